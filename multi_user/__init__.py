@@ -31,7 +31,10 @@ from . import scene_management
 from . import change_tracking
 from . import task_management
 from . import chat_system
+from . import mesh_previews
 from . import diagnostics
+from . import node_cache
+from . import subscriptions
 
 
 def register():
@@ -53,7 +56,10 @@ def register():
     change_tracking.register()
     task_management.register()
     chat_system.register()
+    mesh_previews.register()
     diagnostics.register()
+    node_cache.register()
+    subscriptions.register()
 
     bpy.types.WindowManager.session = bpy.props.PointerProperty(
         type=preferences.SessionProps
@@ -74,7 +80,10 @@ def unregister():
     bpy.types.TOPBAR_MT_file_import.remove(operators.menu_func_import)
     bpy.types.TOPBAR_MT_file_export.remove(operators.menu_func_export)
 
+    subscriptions.unregister()
+    node_cache.unregister()
     diagnostics.unregister()
+    mesh_previews.unregister()
     chat_system.unregister()
     task_management.unregister()
     change_tracking.unregister()
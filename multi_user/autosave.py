@@ -0,0 +1,222 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""Incremental session auto-save.
+
+On each save the main thread only serializes the nodes whose data changed
+since the previous one. A worker thread compresses them and appends them to
+a journal next to the save file, then regularly compacts the last .db and
+the journal into a new .db (see session_file), copying the unchanged nodes
+as they are.
+
+A journal starts with MAGIC followed by records, each one the length (4
+bytes) of a zlib compressed pickle. The first record names the .db the
+journal applies to, the others hold the saved nodes (raw chunks, type and
+name), the removed node uuids and the online users. A journal left by a crash is compacted when
+the auto-save restarts.
+"""
+
+import logging
+import os
+import queue
+import struct
+import threading
+import zlib
+from pathlib import Path
+
+try:
+    import _pickle as pickle
+except ImportError:
+    import pickle
+
+from .session_file import SessionFile, SessionWriter, timestamped_path
+
+MAGIC = b'MUJRNL1\n'
+RECORD_HEADER = struct.Struct('<I')
+
+# Saves appended to the journal before it is compacted
+COMPACT_EVERY = 30
+
+
+def read_journal(filepath: str):
+    """ Iterate over the records of a journal, a truncated last record
+        (interrupted write) is ignored
+    """
+    with open(filepath, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{filepath} is not a session journal")
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            size, = RECORD_HEADER.unpack(header)
+            payload = f.read(size)
+            if len(payload) < size:
+                logging.warning(f"Skipping the truncated end of {filepath}")
+                return
+            yield pickle.loads(zlib.decompress(payload))
+
+
+def save_key(node) -> tuple:
+    """ What a saved node depends on: its data reference, its owner and its
+        dependencies, which rights changes and deletions edit in place
+    """
+    return node.data, node.owner, tuple(node.dependencies or ())
+
+
+class IncrementalSave():
+    """ Save a repository to an append-only journal compacted into .db files
+
+        :param filepath: save filepath, compacted saves are timestamped
+        :type filepath: str
+        :param compact_every: number of saves between two compactions
+        :type compact_every: int
+    """
+
+    def __init__(self, filepath: str, compact_every: int = COMPACT_EVERY):
+        self.filepath = Path(filepath)
+        self.journal_path = self.filepath.with_name(f"{self.filepath.name}.journal")
+        self.compact_every = compact_every
+        self.base = None  # last compacted .db
+        self._saved = {}  # uuid: save_key() of the last saved version
+        self._records = 0
+        self._journal = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='autosave', daemon=True)
+        self._thread.start()
+
+    def save(self, repository) -> int:
+        """ Queue the nodes changed since the last save, on the main thread
+
+            Updates replace the node data instead of mutating it, so an
+            unchanged data reference, owner and dependencies mean an
+            unchanged node.
+
+            :param repository: saved repository
+            :type repository: Repository
+            :return: int, number of queued nodes
+        """
+        nodes = []
+        for uuid, node in repository.graph.items():
+            key = save_key(node)
+            saved = self._saved.get(uuid)
+            if saved and saved[0] is key[0] and saved[1:] == key[1:]:
+                continue
+            data = node.data if isinstance(node.data, dict) else {}
+            nodes.append((node.as_raw_chunks(), data.get('type_id'), data.get('name')))
+            self._saved[uuid] = key
+
+        removed = [uuid for uuid in self._saved if uuid not in repository.graph]
+        for uuid in removed:
+            del self._saved[uuid]
+
+        if nodes or removed:
+            remote = getattr(repository, 'remote', None)
+            users = dict(remote.online_users) if remote else None
+            self._queue.put({'nodes': nodes, 'removed': removed, 'users': users})
+        return len(nodes)
+
+    def close(self, wait: bool = False):
+        """ Compact the journal and stop the worker
+
+            :param wait: block until the last .db is written
+            :type wait: bool
+        """
+        self._queue.put(None)
+        if wait:
+            self._thread.join()
+
+    def _run(self):
+        try:
+            if self.journal_path.exists():
+                logging.info(f"Recovering the auto-save journal {self.journal_path}")
+                self._compact()
+            self._open_journal()
+
+            while True:
+                record = self._queue.get()
+                if record is None:
+                    break
+                self._append(record)
+                if self._records >= self.compact_every:
+                    self._compact()
+                    self._open_journal()
+
+            if self._records:
+                self._compact()
+        except Exception as e:
+            logging.error(f"Auto-save failed: {e}")
+        finally:
+            if self._journal:
+                self._journal.close()
+                self._journal = None
+
+    def _open_journal(self):
+        self._journal = open(self.journal_path, 'wb')
+        self._journal.write(MAGIC)
+        self._write({'base': str(self.base) if self.base else None})
+        self._records = 0
+
+    def _write(self, record: dict):
+        payload = zlib.compress(pickle.dumps(record, protocol=4), 3)
+        self._journal.write(RECORD_HEADER.pack(len(payload)))
+        self._journal.write(payload)
+        self._journal.flush()
+
+    def _append(self, record: dict):
+        self._write(record)
+        self._records += 1
+
+    def _compact(self):
+        """ Merge the last .db and the journal into a new .db
+        """
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+
+        records = read_journal(self.journal_path)
+        base = next(records, {}).get('base')
+        nodes = {}  # uuid: (chunks, type_id, name)
+        users = None
+        for record in records:
+            for chunks, type_id, name in record['nodes']:
+                nodes[chunks[1].decode()] = (chunks, type_id, name)
+            for uuid in record['removed']:
+                nodes[uuid] = None
+            users = record['users']
+
+        filepath = timestamped_path(self.filepath)
+        writer = SessionWriter(filepath)
+        if base and os.path.exists(base):
+            with SessionFile(base) as previous:
+                users = previous.users if users is None else users
+                for uuid, (_, _, type_id, name, dependencies) in previous.nodes.items():
+                    if uuid in nodes:
+                        continue
+                    payload = previous.read_raw(uuid)
+                    if payload is None:
+                        writer.add(previous.read(uuid), type_id, name)
+                    else:
+                        writer.add_raw(uuid, payload, type_id, name, dependencies)
+        for entry in nodes.values():
+            if entry:
+                writer.add(*entry)
+        writer.close(users)
+        self.journal_path.unlink()
+
+        self.base = filepath
+        logging.info(f"Writing session snapshot to {filepath} ({len(writer.nodes)} nodes)")
@@ -15,6 +15,9 @@
 #
 # ##### END GPL LICENSE BLOCK #####
 
+import logging
+import time
+
 import bpy
 
 __all__ = [
@@ -51,17 +54,221 @@ import importlib
 def types_to_register():
     return __all__
 
-from replication.protocol import DataTranslationProtocol
+from deepdiff import Delta
+from replication.protocol import DataTranslationProtocol, ReplicatedDatablock
+
+from ..metrics import APPLIED, COMMITS, DIFF, DUMP, LOAD, metrics
+from ..utils import get_preferences
+from . import dump_compression, profiling
+from .dump_diff import compute_delta, fingerprint
+
+
+class BlDataTranslationProtocol(DataTranslationProtocol):
+    """ Blender flavoured data translation protocol
+
+        Keep a fingerprint of the last committed dump of each node to skip
+        the delta computation (and so the commit/push) of unchanged dumps.
+        Only the dumps that will be committed get their buffers compressed.
+
+        Implementations can also expose an optional `probe(datablock)`
+        staticmethod returning a cheap hashable summary of their geometry.
+        When the depsgraph reports no geometry update and the probe is
+        unchanged, their dump(datablock, reuse=last_data) keeps the geometry
+        buffers last dumped. Everything else is dumped again.
+
+        An optional `preview(last_data, current_data)` staticmethod returns
+        a lightweight stand-in of the committed dump, or None. It is handed
+        to on_preview, when set, before the commit is pushed.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.fingerprints = {}
+        self.probes = {}
+        self.geometry_hints = {}  # uuid: last data, geometry not updated
+        self.commit_stats = {}  # type_id: [evaluated, suppressed]
+        self.compression_stats = {}  # type_id: [raw, compressed, seconds]
+        self.on_preview = None  # callable(uuid, preview)
+
+    def forget(self, uuid: str):
+        """ Drop the cached fingerprint and probe of a node
+        """
+        self.fingerprints.pop(uuid, None)
+        self.probes.pop(uuid, None)
+        self.geometry_hints.pop(uuid, None)
+
+    def hint_geometry(self, uuid: str, last_data: dict = None):
+        """ Tell the next dump of a node whether its geometry was updated
+
+            :param last_data: last committed data of the node if its geometry
+                wasn't updated, None otherwise
+            :type last_data: dict
+        """
+        if isinstance(last_data, dict):
+            self.geometry_hints[uuid] = last_data
+        else:
+            self.geometry_hints.pop(uuid, None)
+
+    def _reusable_data(self, implementation, datablock: object, uuid: str) -> dict:
+        """ Last data of the node if its geometry can be reused
+        """
+        probe = getattr(implementation, 'probe', None)
+        if probe is None or not uuid:
+            return None
+
+        last_data = self.geometry_hints.pop(uuid, None)
+        try:
+            value = probe(datablock)
+        except Exception as e:
+            logging.debug(f"Probe failed on {uuid}: {e}")
+            self.probes.pop(uuid, None)
+            return None
+
+        unchanged = uuid in self.probes and self.probes[uuid] == value
+        self.probes[uuid] = value
+        return last_data if unchanged else None
+
+    def dump(self, datablock: object, stamp_uuid: str = None) -> dict:
+        start = time.perf_counter()
+        implementation = self.get_implementation(datablock)
+        reuse = self._reusable_data(implementation, datablock, stamp_uuid)
+        if reuse is None:
+            data = super().dump(datablock, stamp_uuid=stamp_uuid)
+        else:
+            data = implementation.dump(datablock, reuse=reuse)
+            data['type_id'] = type(datablock).__name__
+            data['uuid'] = stamp_uuid
+        metrics.time(data['type_id'], DUMP, time.perf_counter() - start)
+        return data
+
+    def compress(self, data: dict):
+        """ Compress in place the buffers of a dump about to be committed
+
+            The buffers are compressed in parallel by the dump_compression
+            thread pool, the main thread still waits for them: the commit
+            is pushed right after.
+        """
+        implementation = self._supported_types.get(data['type_id'])
+        settings = get_preferences()
+        if not getattr(implementation, 'bl_compress_buffers', True) \
+                or (settings and not settings.sync_flags.compress_buffers):
+            return
+
+        threshold = settings.sync_flags.compression_threshold * 1024 \
+            if settings else dump_compression.DEFAULT_THRESHOLD
+        raw, packed, elapsed = dump_compression.compress_dump(data, threshold)
+        if raw:
+            stats = self.compression_stats.setdefault(data['type_id'], [0, 0, 0.0])
+            stats[0] += raw
+            stats[1] += packed
+            stats[2] += elapsed
+
+    def load(self, data: dict, datablock: object):
+        # The datablock will now match a distant version
+        self.forget(data.get('uuid'))
+        start = time.perf_counter()
+        super().load(dump_compression.decompress_dump(data), datablock)
+        metrics.time(data.get('type_id'), LOAD, time.perf_counter() - start)
+        metrics.count(data.get('type_id'), APPLIED)
+
+    def placeholder(self, data: dict, datablock: object) -> bool:
+        """ Load a lightweight stand-in of the datablock (preview, bounding
+            box...) if its implementation supports it
+
+            :return: True if a placeholder was loaded
+        """
+        implementation = self.get_implementation(datablock)
+        placeholder = getattr(implementation, 'placeholder', None)
+        if placeholder is None:
+            return False
+
+        placeholder(dump_compression.decompress_dump(data), datablock)
+        return True
+
+    def compute_delta(self, last_data: dict, current_data: dict) -> Delta:
+        """ Compute the delta unless the dump is identical to the last
+            committed one.
+
+            Types relying on the library default delta are routed to the
+            structural differ, the DeepDiff default doesn't scale on big dumps
+        """
+        type_id = current_data.get('type_id')
+        uuid = current_data.get('uuid')
+        stats = self.commit_stats.setdefault(type_id, [0, 0])
+        stats[0] += 1
+
+        digest = fingerprint(current_data)
+        if isinstance(last_data, dict) and uuid \
+                and self.fingerprints.get(uuid) == digest:
+            stats[1] += 1
+            return Delta({})
+
+        # The node data holds compressed buffers, compare them alike
+        self.compress(current_data)
+
+        start = time.perf_counter()
+        implementation = self._supported_types.get(type_id)
+        if implementation.compute_delta is ReplicatedDatablock.compute_delta:
+            delta = compute_delta(last_data, current_data,
+                                  keep_tree=not implementation.use_delta)
+        else:
+            delta = implementation.compute_delta(last_data, current_data)
+        metrics.time(type_id, DIFF, time.perf_counter() - start)
+        if delta.diff:
+            metrics.count(type_id, COMMITS)
+
+        if uuid:
+            self.fingerprints[uuid] = digest
+
+        if delta.diff and self.on_preview:
+            self._publish_preview(implementation, last_data, current_data)
+        return delta
+
+    def _publish_preview(self, implementation, last_data: dict, current_data: dict):
+        """ Hand the preview of a committed dump to on_preview, before the
+            commit is pushed
+        """
+        preview = getattr(implementation, 'preview', None)
+        if preview is None:
+            return
+        try:
+            value = preview(last_data, current_data)
+        except Exception as e:
+            logging.debug(f"Preview of {current_data.get('uuid')} failed: {e}")
+            return
+        if value:
+            self.on_preview(current_data.get('uuid'), value)
+
+    def compression_ratios(self) -> dict:
+        """ Compressed/raw size ratio and time spent per datablock type
+        """
+        return {type_id: (raw, packed, packed / raw, elapsed)
+                for type_id, (raw, packed, elapsed) in self.compression_stats.items()
+                if raw}
+
+    def suppression_rates(self) -> dict:
+        """ Ratio of skipped commits per datablock type
+        """
+        return {type_id: (evaluated, suppressed, suppressed / evaluated)
+                for type_id, (evaluated, suppressed) in self.commit_stats.items()
+                if evaluated}
+
 
 def get_data_translation_protocol()-> DataTranslationProtocol:
     """ Return a data translation protocol from implemented bpy types
+
+        Implementations are profiled while profiling.start() is active
     """
-    bpy_protocol = DataTranslationProtocol()
+    bpy_protocol = BlDataTranslationProtocol()
     for module_name in __all__:
         if module_name not in globals():
             impl = importlib.import_module(f".{module_name}", __package__)
         else:
             impl = globals()[module_name]
         if impl and hasattr(impl, "_type") and hasattr(impl, "_type"):
-            bpy_protocol.register_implementation(impl._type, impl._class)
+            implementation = impl._class
+            if profiling.profiler:
+                implementation = profiling.profiler.profile_implementation(
+                    impl._type.__name__, implementation)
+            bpy_protocol.register_implementation(impl._type, implementation)
     return bpy_protocol
@@ -17,12 +17,13 @@
 
 
 import bpy
-from deepdiff import DeepDiff, Delta
+from deepdiff import Delta
 from replication.protocol import ReplicatedDatablock
 
 from .. import utils
 from .bl_datablock import resolve_datablock_from_uuid
 from .dump_anything import Dumper, Loader
+from .dump_diff import compute_delta
 
 
 def dump_collection_children(collection):
@@ -142,20 +143,7 @@ class BlCollection(ReplicatedDatablock):
 
     @staticmethod
     def compute_delta(last_data: dict, current_data: dict) -> Delta:
-        diff_params = {
-            'ignore_order': True,
-            'report_repetition': True
-        }
-        delta_params = {
-            # 'mutate': True
-        }
-
-        return Delta(
-            DeepDiff(last_data,
-                     current_data,
-                     cache_size=5000,
-                     **diff_params),
-            **delta_params)
+        return compute_delta(last_data, current_data, ignore_order=True)
 
 
 _type = bpy.types.Collection
@@ -53,7 +53,9 @@ class BlFile(ReplicatedDatablock):
     bl_class = Path
     bl_check_common = False
     bl_icon = 'FILE'
+    bl_heavy = True
     bl_reload_parent = True
+    bl_compress_buffers = False  # needs_update relies on the raw file size
 
     @staticmethod
     def construct(data: dict) -> object:
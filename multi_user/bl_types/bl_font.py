@@ -29,6 +29,7 @@ class BlFont(ReplicatedDatablock):
     bl_class = bpy.types.VectorFont
     bl_check_common = False
     bl_icon = 'FILE_FONT'
+    bl_heavy = True
     bl_reload_parent = False
 
     @staticmethod
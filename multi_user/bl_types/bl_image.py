@@ -50,6 +50,7 @@ class BlImage(ReplicatedDatablock):
     bl_class = bpy.types.Image
     bl_check_common = False
     bl_icon = 'IMAGE_DATA'
+    bl_heavy = True
     bl_reload_parent = False
 
     @staticmethod
@@ -73,6 +74,14 @@ class BlImage(ReplicatedDatablock):
         if color_space_name:
             datablock.colorspace_settings.name = color_space_name
 
+    @staticmethod
+    def placeholder(data: dict, datablock: object):
+        """ Stand for the image with a single pixel until it is loaded
+        """
+        datablock.source = 'GENERATED'
+        datablock.generated_width = 1
+        datablock.generated_height = 1
+
     @staticmethod
     def dump(datablock: object) -> dict:
         filename = Path(datablock.filepath).name
@@ -17,6 +17,7 @@
 
 
 import bpy
+import numpy as np
 from replication.exception import ContextError
 from replication.protocol import ReplicatedDatablock
 
@@ -28,6 +29,7 @@ from .bl_material import dump_materials_slots, load_materials_slots
 from .dump_anything import (Dumper, Loader, np_dump_collection,
                             np_dump_collection_primitive, np_load_collection,
                             np_load_collection_primitives)
+from .dump_diff import fingerprint
 
 VERTICE = ['co']
 
@@ -55,12 +57,129 @@ GENERIC_ATTRIBUTES =[
     'bevel_weight_edge'
 ]
 
+# Dump entries holding the geometry, reused as is when it wasn't updated
+GEOMETRY_KEYS = ('vertex_count', 'vertices', 'bounds', 'egdes_count', 'edges',
+                 'poly_count', 'polygons', 'loop_count', 'loops')
+PROBE_SAMPLES = 16
+
+# Meshes above the preview threshold get a decimated version of them,
+# PREVIEW_RATIO of their vertex count, sent apart from their dump each time
+# their geometry changes (see mesh_previews.py)
+DEFAULT_PREVIEW_THRESHOLD = 100000
+PREVIEW_RATIO = 0.05
+
+# Bounding box faces, vertices ordered as in BlMesh.placeholder
+BOX_FACES = [(0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1),
+             (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3)]
+
+# Used when the Mesh supported datablock precision is REDUCED
+QUANTIZATION = {
+    'co': 'POSITION_16',
+    'normal': 'NORMAL_OCT',
+    'uv': 'UV_16',
+    'color': 'COLOR_8',
+}
+
 GENERIC_ATTRIBUTES_ENSURE = {
     'crease_vert': 'vertex_crease_ensure',
     'crease_edge': 'edge_crease_ensure'
 }
 
 
+def cluster_vertices(co: np.ndarray, triangles: np.ndarray, ratio: float) -> tuple:
+    """ Decimate a triangulated mesh by vertex clustering
+
+        Vertices are merged per cell of a regular grid, the grid resolution
+        being searched to keep about `ratio` of the vertices. Collapsed and
+        duplicated triangles are dropped.
+
+        :param co: vertices positions (N, 3)
+        :type co: np.ndarray
+        :param triangles: vertex indices (T, 3)
+        :type triangles: np.ndarray
+        :param ratio: target vertex ratio
+        :type ratio: float
+        :return: (co, triangles)
+    """
+    target = max(4, int(len(co) * ratio))
+    low, high = co.min(axis=0), co.max(axis=0)
+    extent = np.maximum(high - low, 1e-6)
+
+    # Binary search of the cell count along the largest axis
+    best = None
+    lo, hi = 1, 1024
+    while lo <= hi:
+        resolution = (lo + hi) // 2
+        cells = np.maximum(1, np.ceil(extent / extent.max() * resolution)).astype(np.int64)
+        keys = np.minimum(((co - low) / extent * cells).astype(np.int64), cells - 1)
+        keys = (keys[:, 0] * cells[1] + keys[:, 1]) * cells[2] + keys[:, 2]
+        unique_keys, remap = np.unique(keys, return_inverse=True)
+        best = (unique_keys, remap)
+        if len(unique_keys) > target:
+            hi = resolution - 1
+        else:
+            lo = resolution + 1
+
+    unique_keys, remap = best
+    remap = remap.ravel()
+    counts = np.bincount(remap, minlength=len(unique_keys)).astype(np.float32)
+    clustered = np.stack(
+        [np.bincount(remap, weights=co[:, axis], minlength=len(unique_keys))
+         for axis in range(3)], axis=1) / counts[:, None]
+
+    tris = remap[triangles]
+    valid = (tris[:, 0] != tris[:, 1]) & (tris[:, 1] != tris[:, 2]) & (tris[:, 0] != tris[:, 2])
+    tris = tris[valid]
+    if len(tris):
+        tris = np.unique(tris, axis=0)
+
+    return clustered.astype(np.float32), tris.astype(np.int32)
+
+
+def dump_bounds(co) -> list:
+    """ Bounding box of the dumped vertices positions, without reading
+        them again from the mesh
+
+        :param co: dumped 'co' buffer, raw or quantized
+        :type co: bytes or dict
+        :return: [[min x, min y, min z], [max x, max y, max z]] or None
+    """
+    if not co:
+        return None
+    if isinstance(co, dict):
+        # The quantization already stores the bounds
+        return [list(co['min']), list(co['max'])]
+
+    co = np.frombuffer(co, dtype=np.float32).reshape(-1, 3)
+    return [co.min(axis=0).tolist(), co.max(axis=0).tolist()]
+
+
+def geometry_digest(data: dict) -> str:
+    """ Digest of the geometry entries of a mesh dump
+    """
+    return fingerprint({key: data.get(key) for key in GEOMETRY_KEYS}).hex()
+
+
+def dump_preview(mesh: bpy.types.Mesh, co: np.ndarray) -> dict:
+    """ Dump a vertex clustered version of the mesh
+
+        :param co: mesh vertices positions (N, 3)
+        :type co: np.ndarray
+    """
+    mesh.calc_loop_triangles()
+    triangles = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get('vertices', triangles)
+
+    co, triangles = cluster_vertices(co, triangles.reshape(-1, 3),
+                                     PREVIEW_RATIO)
+    return {
+        'vertex_count': len(co),
+        'triangle_count': len(triangles),
+        'co': co.tobytes(),
+        'triangles': triangles.tobytes(),
+    }
+
+
 class BlMesh(ReplicatedDatablock):
     use_delta = True
 
@@ -68,6 +187,8 @@ class BlMesh(ReplicatedDatablock):
     bl_class = bpy.types.Mesh
     bl_check_common = False
     bl_icon = 'MESH_DATA'
+    bl_heavy = True
+    bl_quantization = QUANTIZATION
     bl_reload_parent = True
 
     @staticmethod
@@ -140,11 +261,60 @@ class BlMesh(ReplicatedDatablock):
             datablock.update()
 
     @staticmethod
-    def dump(datablock: object) -> dict:
+    def placeholder(data: dict, datablock: object):
+        """ Stand for the mesh with its preview, or its bounding box, until
+            it is loaded
+        """
+        if datablock.is_editmode:
+            raise ContextError
+
+        if datablock.vertices:
+            datablock.clear_geometry()
+
+        preview = data.get('preview')
+        bounds = data.get('bounds')
+        if preview:
+            triangle_count = preview['triangle_count']
+            datablock.vertices.add(preview['vertex_count'])
+            datablock.vertices.foreach_set(
+                'co', np.frombuffer(preview['co'], dtype=np.float32))
+            datablock.loops.add(triangle_count * 3)
+            datablock.loops.foreach_set(
+                'vertex_index', np.frombuffer(preview['triangles'], dtype=np.int32))
+            datablock.polygons.add(triangle_count)
+            datablock.polygons.foreach_set(
+                'loop_start', np.arange(0, triangle_count * 3, 3, dtype=np.int32))
+            datablock.polygons.foreach_set(
+                'loop_total', np.full(triangle_count, 3, dtype=np.int32))
+            datablock.update(calc_edges=True)
+        elif bounds:
+            (x0, y0, z0), (x1, y1, z1) = bounds
+            vertices = [(x, y, z) for x in (x0, x1) for y in (y0, y1) for z in (z0, z1)]
+            datablock.from_pydata(vertices, [], BOX_FACES)
+
+        src_materials = data.get('materials', None)
+        if src_materials:
+            load_materials_slots(src_materials, datablock.materials)
+
+        datablock.update()
+
+    @staticmethod
+    def dump(datablock: object, reuse: dict = None) -> dict:
+        """ Dump the mesh
+
+            :param reuse: last dump of the mesh, its geometry buffers are
+                kept instead of being dumped again (see probe)
+            :type reuse: dict
+        """
         if (datablock.is_editmode or bpy.context.mode == "SCULPT") and not get_preferences().sync_flags.sync_during_editmode:
             raise ContextError("Mesh is in edit mode")
         mesh = datablock
 
+        settings = get_preferences()
+        type_settings = settings.supported_datablocks.get('Mesh') if settings else None
+        quantization = QUANTIZATION \
+            if type_settings and type_settings.precision == 'REDUCED' else {}
+
         dumper = Dumper()
         dumper.depth = 1
         dumper.include_filter = [
@@ -158,13 +328,26 @@ class BlMesh(ReplicatedDatablock):
 
         data['animation_data'] = dump_animation_data(datablock)
 
-        # VERTICES
-        data["vertex_count"] = len(mesh.vertices)
-        data["vertices"] = np_dump_collection(mesh.vertices, VERTICE)
+        if reuse:
+            for key in GEOMETRY_KEYS:
+                data[key] = reuse[key]
+        else:
+            # VERTICES
+            data["vertex_count"] = len(mesh.vertices)
+            data["vertices"] = np_dump_collection(mesh.vertices, VERTICE, quantization)
+            data["bounds"] = dump_bounds(data["vertices"].get('co'))
+
+            # EDGES
+            data["egdes_count"] = len(mesh.edges)
+            data["edges"] = np_dump_collection(mesh.edges, EDGE)
 
-        # EDGES
-        data["egdes_count"] = len(mesh.edges)
-        data["edges"] = np_dump_collection(mesh.edges, EDGE)
+            # POLYGONS
+            data["poly_count"] = len(mesh.polygons)
+            data["polygons"] = np_dump_collection(mesh.polygons, POLYGON)
+
+            # LOOPS
+            data["loop_count"] = len(mesh.loops)
+            data["loops"] = np_dump_collection(mesh.loops, LOOP, quantization)
 
         # ATTIBUTES
         data["attributes"] = []
@@ -181,32 +364,77 @@ class BlMesh(ReplicatedDatablock):
                         dumped_attr_data
                     )
                 )
-        # POLYGONS
-        data["poly_count"] = len(mesh.polygons)
-        data["polygons"] = np_dump_collection(mesh.polygons, POLYGON)
-
-        # LOOPS
-        data["loop_count"] = len(mesh.loops)
-        data["loops"] = np_dump_collection(mesh.loops, LOOP)
 
         # UV Layers
         if mesh.uv_layers:
             data['uv_layers'] = {}
             for layer in mesh.uv_layers:
                 data['uv_layers'][layer.name] = {}
-                data['uv_layers'][layer.name]['data'] = np_dump_collection_primitive(layer.data, 'uv')
+                data['uv_layers'][layer.name]['data'] = np_dump_collection_primitive(
+                    layer.data, 'uv', quantization.get('uv'))
 
         # Vertex color
         if mesh.vertex_colors:
             data['vertex_colors'] = {}
             for color_map in mesh.vertex_colors:
                 data['vertex_colors'][color_map.name] = {}
-                data['vertex_colors'][color_map.name]['data'] = np_dump_collection_primitive(color_map.data, 'color')
+                data['vertex_colors'][color_map.name]['data'] = np_dump_collection_primitive(
+                    color_map.data, 'color', quantization.get('color'))
 
         # Materials
         data['materials'] = dump_materials_slots(datablock.materials)
         return data
 
+    @staticmethod
+    def probe(datablock: object) -> tuple:
+        """ Cheap summary of the geometry: element counts, a few sampled
+            positions and the precision they are dumped with
+        """
+        vertices = datablock.vertices
+        step = max(1, len(vertices) // PROBE_SAMPLES)
+        settings = get_preferences()
+        type_settings = settings.supported_datablocks.get('Mesh') if settings else None
+
+        return (
+            len(vertices),
+            len(datablock.edges),
+            len(datablock.loops),
+            len(datablock.polygons),
+            tuple(tuple(vertices[i].co) for i in range(0, len(vertices), step)),
+            type_settings.precision if type_settings else None,
+        )
+
+    @staticmethod
+    def preview(last_data: dict, current_data: dict) -> dict:
+        """ Preview of the mesh if its geometry changed since the last
+            committed dump and it is above the preview threshold
+
+            The preview holds the geometry digests of both dumps, 'base'
+            and 'digest', to tell which version of the node it stands for.
+
+            :return: dict or None
+        """
+        settings = get_preferences()
+        preview_threshold = settings.sync_flags.preview_threshold \
+            if settings else DEFAULT_PREVIEW_THRESHOLD
+        if not preview_threshold or current_data.get('vertex_count', 0) <= preview_threshold:
+            return None
+
+        digest = geometry_digest(current_data)
+        base = geometry_digest(last_data) if isinstance(last_data, dict) else None
+        if digest == base:
+            return None
+
+        mesh = BlMesh.resolve(current_data)
+        if mesh is None:
+            return None
+        co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get('co', co)
+        preview = dump_preview(mesh, co.reshape(-1, 3))
+        preview['base'] = base
+        preview['digest'] = digest
+        return preview
+
     @staticmethod
     def resolve_deps(datablock: object) -> list[object]:
         deps = []
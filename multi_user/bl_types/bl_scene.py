@@ -20,7 +20,7 @@ from pathlib import Path
 
 import bpy
 
-from deepdiff import DeepDiff, Delta
+from deepdiff import Delta
 from replication.protocol import ReplicatedDatablock
 
 from ..utils import flush_history, get_preferences
@@ -39,6 +39,7 @@ from .bl_collection import (
 from .bl_datablock import resolve_datablock_from_uuid
 from .bl_file import get_filepath
 from .dump_anything import Dumper, Loader
+from .dump_diff import compute_delta
 
 RENDER_SETTINGS = [
     'dither_intensity',
@@ -596,21 +597,10 @@ class BlScene(ReplicatedDatablock):
         if not get_preferences().sync_flags.sync_active_camera:
             exclude_path.append("root['camera']")
 
-        diff_params = {
-            'exclude_paths': exclude_path,
-            'ignore_order': True,
-            'report_repetition': True
-        }
-        delta_params = {
-            # 'mutate': True
-        }
-
-        return Delta(
-            DeepDiff(last_data,
-                     current_data,
-                     cache_size=5000,
-                     **diff_params),
-            **delta_params)
+        return compute_delta(last_data,
+                             current_data,
+                             ignore_order=True,
+                             exclude_paths=exclude_path)
 
 
 _type = bpy.types.Scene
@@ -30,6 +30,7 @@ class BlSound(ReplicatedDatablock):
     bl_class = bpy.types.Sound
     bl_check_common = False
     bl_icon = 'SOUND'
+    bl_heavy = True
     bl_reload_parent = False
 
     @staticmethod
@@ -36,6 +36,7 @@ class BlVolume(ReplicatedDatablock):
     bl_class = bpy.types.Volume
     bl_check_common = False
     bl_icon = 'VOLUME_DATA'
+    bl_heavy = True
     bl_reload_parent = False
 
     @staticmethod
@@ -68,6 +69,15 @@ class BlVolume(ReplicatedDatablock):
         data['animation_data'] = dump_animation_data(datablock)
         return data
 
+    @staticmethod
+    def placeholder(data: dict, datablock: object):
+        """ Only setup the material slots, the grids file is left unset
+            until the volume is loaded
+        """
+        src_materials = data.get('materials', None)
+        if src_materials:
+            load_materials_slots(src_materials, datablock.materials)
+
     @staticmethod
     def load(data: dict, datablock: object):
         load_animation_data(data.get('animation_data'), datablock)
@@ -59,6 +59,105 @@ ATTRIBUTE_DIMENSION = {
     'INT8': 1,
 }
 
+# Lossy encodings of float buffers, see np_quantize
+QUANTIZATION_PROFILES = [
+    'POSITION_16',  # 16 bits per component, relative to the bounding box
+    'NORMAL_OCT',   # octahedral encoding, two 16 bits components
+    'UV_16',        # 16 bits per component, relative to the uv bounds
+    'COLOR_8',      # 8 bits per channel
+]
+
+
+def _octahedral_wrap(x: np.ndarray, y: np.ndarray) -> tuple:
+    sign_x = np.where(x >= 0.0, 1.0, -1.0)
+    sign_y = np.where(y >= 0.0, 1.0, -1.0)
+    return (1.0 - np.abs(y)) * sign_x, (1.0 - np.abs(x)) * sign_y
+
+
+def np_quantize(array: np.ndarray, profile: str, components: int) -> dict:
+    """ Encode a flat float array with the given quantization profile
+
+        :arg array: flat float32 array
+        :type array: np.ndarray
+        :arg profile: one of QUANTIZATION_PROFILES
+        :type profile: str
+        :arg components: item dimension (3 for a position)
+        :type components: int
+        :return: dict
+    """
+    values = array.reshape(-1, components)
+    quantized = {
+        'quantization': profile,
+        'components': components,
+    }
+
+    if profile in ['POSITION_16', 'UV_16']:
+        lower = values.min(axis=0) if len(values) else np.zeros(components)
+        upper = values.max(axis=0) if len(values) else np.zeros(components)
+        extent = np.where(upper > lower, upper - lower, 1.0)
+        encoded = np.round((values - lower) / extent * 65535.0).astype(np.uint16)
+        quantized['min'] = lower.tolist()
+        quantized['max'] = upper.tolist()
+    elif profile == 'NORMAL_OCT':
+        assert components == 3
+        norm = np.abs(values).sum(axis=1)
+        norm[norm == 0.0] = 1.0
+        x = values[:, 0] / norm
+        y = values[:, 1] / norm
+        wrapped_x, wrapped_y = _octahedral_wrap(x, y)
+        below = values[:, 2] < 0.0
+        x = np.where(below, wrapped_x, x)
+        y = np.where(below, wrapped_y, y)
+        encoded = np.round(np.stack((x, y), axis=1) * 32767.0).astype(np.int16)
+    elif profile == 'COLOR_8':
+        encoded = np.round(np.clip(values, 0.0, 1.0) * 255.0).astype(np.uint8)
+    else:
+        raise ValueError(f"Unknown quantization profile {profile}")
+
+    quantized['data'] = encoded.tobytes()
+    return quantized
+
+
+def np_dequantize(quantized: dict) -> np.ndarray:
+    """ Decode a buffer encoded by np_quantize to a flat float32 array
+
+        :arg quantized: quantized buffer
+        :type quantized: dict
+        :return: np.ndarray
+    """
+    profile = quantized['quantization']
+    components = quantized['components']
+
+    if profile in ['POSITION_16', 'UV_16']:
+        lower = np.array(quantized['min'], dtype=np.float64)
+        upper = np.array(quantized['max'], dtype=np.float64)
+        encoded = np.frombuffer(quantized['data'], dtype=np.uint16)
+        values = encoded.reshape(-1, components) / 65535.0 * (upper - lower) + lower
+    elif profile == 'NORMAL_OCT':
+        encoded = np.frombuffer(quantized['data'], dtype=np.int16)
+        xy = encoded.reshape(-1, 2) / 32767.0
+        x, y = xy[:, 0], xy[:, 1]
+        z = 1.0 - np.abs(x) - np.abs(y)
+        wrapped_x, wrapped_y = _octahedral_wrap(x, y)
+        below = z < 0.0
+        values = np.stack((np.where(below, wrapped_x, x),
+                           np.where(below, wrapped_y, y),
+                           z), axis=1)
+        length = np.linalg.norm(values, axis=1)
+        length[length == 0.0] = 1.0
+        values /= length[:, np.newaxis]
+    elif profile == 'COLOR_8':
+        encoded = np.frombuffer(quantized['data'], dtype=np.uint8)
+        values = encoded / 255.0
+    else:
+        raise ValueError(f"Unknown quantization profile {profile}")
+
+    return values.astype(np.float32).ravel()
+
+
+def is_quantized(sequence) -> bool:
+    return isinstance(sequence, dict) and 'quantization' in sequence
+
 
 def np_dump_attributes(attributes_collection: bpy.types.bpy_prop_collection, attributes_names = None) -> dict:
     """ Dump a list of attributes to the target dikt
@@ -156,7 +255,7 @@ def np_load_collection(dikt: dict, collection: bpy.types.CollectionProperty, att
             logging.error(f"{attr} of type {attr_type} not supported.")
 
 
-def np_dump_collection(collection: bpy.types.CollectionProperty, attributes: list = None) -> dict:
+def np_dump_collection(collection: bpy.types.CollectionProperty, attributes: list = None, quantization: dict = None) -> dict:
     """ Dump a list of attributes from the sane collection
         to the target dikt
 
@@ -167,6 +266,8 @@ def np_dump_collection(collection: bpy.types.CollectionProperty, attributes: lis
         :type collection: bpy.types.CollectionProperty
         :arg attributes: list of attributes name
         :type attributes: list
+        :arg quantization: optional quantization profile per float attribute
+        :type quantization: dict
         :retrun: dict
     """
     dumped_collection = {}
@@ -185,7 +286,8 @@ def np_dump_collection(collection: bpy.types.CollectionProperty, attributes: lis
 
         if attr_type in PRIMITIVE_TYPES:
             dumped_collection[attr] = np_dump_collection_primitive(
-                collection, attr)
+                collection, attr,
+                quantization=quantization.get(attr) if quantization else None)
         elif attr_type == 'ENUM':
             dumped_collection[attr] = np_dump_collection_enum(collection, attr)
         else:
@@ -194,7 +296,7 @@ def np_dump_collection(collection: bpy.types.CollectionProperty, attributes: lis
     return dumped_collection
 
 
-def np_dump_collection_primitive(collection: bpy.types.CollectionProperty, attribute: str) -> str:
+def np_dump_collection_primitive(collection: bpy.types.CollectionProperty, attribute: str, quantization: str = None) -> str:
     """ Dump a collection attribute as a sequence
 
         !!! warning
@@ -204,7 +306,9 @@ def np_dump_collection_primitive(collection: bpy.types.CollectionProperty, attri
         :type collection: bpy.types.CollectionProperty
         :arg attribute: target attribute
         :type attribute: str
-        :return: numpy byte buffer
+        :arg quantization: optional float quantization profile
+        :type quantization: str
+        :return: numpy byte buffer (quantized dict if a profile is given)
     """
     if len(collection) == 0:
         logging.debug(f'Skipping empty {attribute} attribute')
@@ -222,6 +326,9 @@ def np_dump_collection_primitive(collection: bpy.types.CollectionProperty, attri
 
     collection.foreach_get(attribute, dumped_sequence)
 
+    if quantization and attr_infos.type == 'FLOAT':
+        return np_quantize(dumped_sequence, quantization, size)
+
     return dumped_sequence.tobytes()
 
 
@@ -279,7 +386,7 @@ def np_load_collection_primitives(collection: bpy.types.CollectionProperty, attr
         :type collection: bpy.types.CollectionProperty
         :arg attribute: target attribute
         :type attribute: str
-        :arg sequence: data buffer
+        :arg sequence: data buffer or quantized buffer
         :type sequence: strr
     """
     if len(collection) == 0 or not sequence:
@@ -290,6 +397,10 @@ def np_load_collection_primitives(collection: bpy.types.CollectionProperty, attr
 
     assert attr_infos.type in ["FLOAT", "INT", "BOOLEAN"]
 
+    if is_quantized(sequence):
+        collection.foreach_set(attribute, np_dequantize(sequence))
+        return
+
     collection.foreach_set(
         attribute,
         np.frombuffer(sequence, dtype=BPY_TO_NUMPY_TYPES.get(attr_infos.type)))
@@ -0,0 +1,194 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""Compression of the byte buffers found in dumps.
+
+Buffers are byte-shuffled (all the first bytes of each item, then all the
+second bytes...) which groups the slowly varying exponent bytes of float
+arrays together, then zlib compressed. Both numpy and zlib release the GIL so
+buffers are processed in parallel by a small thread pool.
+
+A compressed buffer is replaced by a plain dict so it survives pickling and
+the deepdiff Delta restricted unpickler.
+"""
+
+import logging
+import os
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+COMPRESSED_KEY = '__compressed__'
+SHUFFLE_ZLIB = 'shuffle-zlib'
+
+DEFAULT_THRESHOLD = 64 * 1024
+COMPRESSION_LEVEL = 3
+# Keep the raw buffer when compression doesn't save at least 10%
+MAX_RATIO = 0.9
+
+_executor = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+
+    if _executor is None:
+        workers = max(2, min(8, (os.cpu_count() or 2) // 2))
+        _executor = ThreadPoolExecutor(max_workers=workers,
+                                       thread_name_prefix='multiuser_compress')
+    return _executor
+
+
+def shutdown():
+    global _executor
+
+    if _executor:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+
+def is_compressed(obj) -> bool:
+    return isinstance(obj, dict) and COMPRESSED_KEY in obj
+
+
+def _item_size(buffer: bytes) -> int:
+    return 4 if len(buffer) % 4 == 0 else 1
+
+
+def compress_buffer(buffer: bytes) -> object:
+    """ Shuffle and compress a buffer, return it untouched if it doesn't
+        compress well enough
+    """
+    itemsize = _item_size(buffer)
+    shuffled = buffer
+    if itemsize > 1:
+        shuffled = np.frombuffer(buffer, dtype=np.uint8)\
+            .reshape(-1, itemsize).T.tobytes()
+    packed = zlib.compress(shuffled, COMPRESSION_LEVEL)
+
+    if len(packed) > len(buffer) * MAX_RATIO:
+        return buffer
+
+    return {
+        COMPRESSED_KEY: SHUFFLE_ZLIB,
+        'itemsize': itemsize,
+        'data': packed,
+    }
+
+
+def decompress_buffer(packed: dict) -> bytes:
+    if packed[COMPRESSED_KEY] != SHUFFLE_ZLIB:
+        raise ValueError(f"Unknown buffer encoding {packed[COMPRESSED_KEY]}")
+
+    itemsize = packed['itemsize']
+    shuffled = zlib.decompress(packed['data'])
+    if itemsize == 1:
+        return shuffled
+    return np.frombuffer(shuffled, dtype=np.uint8)\
+        .reshape(itemsize, -1).T.tobytes()
+
+
+def _collect(obj, threshold: int, found: list):
+    if isinstance(obj, dict):
+        items = obj.items()
+    elif isinstance(obj, list):
+        items = enumerate(obj)
+    else:
+        return
+
+    for key, value in items:
+        if isinstance(value, bytes):
+            if len(value) >= threshold:
+                found.append((obj, key, value))
+        elif not is_compressed(value):
+            # Compressed ones come from a reused dump (see probes)
+            _collect(value, threshold, found)
+
+
+def compress_dump(data: dict, threshold: int = DEFAULT_THRESHOLD) -> tuple:
+    """ Compress in place the buffers of a freshly created dump
+
+        :param data: dump to compress
+        :type data: dict
+        :param threshold: minimal buffer size in bytes
+        :type threshold: int
+        :return: (raw size, compressed size, elapsed seconds)
+    """
+    start = time.perf_counter()
+    buffers = []
+    _collect(data, threshold, buffers)
+    if not buffers:
+        return 0, 0, 0.0
+
+    results = get_executor().map(compress_buffer,
+                                 [buffer for _, _, buffer in buffers])
+
+    raw_size = packed_size = 0
+    for (container, key, buffer), result in zip(buffers, results):
+        container[key] = result
+        raw_size += len(buffer)
+        packed_size += len(result['data']) if is_compressed(result) else len(buffer)
+
+    return raw_size, packed_size, time.perf_counter() - start
+
+
+def _collect_compressed(obj, found: list):
+    if is_compressed(obj):
+        found.append(obj)
+    elif isinstance(obj, dict):
+        for value in obj.values():
+            _collect_compressed(value, found)
+    elif isinstance(obj, list):
+        for value in obj:
+            _collect_compressed(value, found)
+
+
+def _rebuild(obj, buffers: dict):
+    if isinstance(obj, dict):
+        if COMPRESSED_KEY in obj:
+            return buffers[id(obj)]
+        result = {k: _rebuild(v, buffers) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        result = [_rebuild(v, buffers) for v in obj]
+    else:
+        return obj
+
+    return result
+
+
+def decompress_dump(data: dict) -> dict:
+    """ Return a copy of the dump with its buffers decompressed
+
+        The given dump is left untouched since it is the node data. When
+        nothing is compressed the dump itself is returned.
+
+        :param data: dump to decompress
+        :type data: dict
+        :return: dict
+    """
+    compressed = []
+    _collect_compressed(data, compressed)
+    if not compressed:
+        return data
+
+    logging.debug(f"Decompressing {len(compressed)} buffers")
+    results = get_executor().map(decompress_buffer, compressed)
+    buffers = {id(packed): buffer for packed, buffer in zip(compressed, results)}
+
+    return _rebuild(data, buffers)
@@ -0,0 +1,395 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""Structural differ for replicated dumps.
+
+Subtrees of a dump are hashed bottom-up (a merkle tree) so the diff only
+descends into branches whose digest changed. Byte buffers produced by the
+numpy dumpers are compared by digest instead of element-wise. The result is
+a regular deepdiff Delta so it stays wire compatible with the rest of the
+replication stack (Commit serialisation, Node.patch, ...).
+"""
+
+import logging
+from collections import Counter, OrderedDict
+from hashlib import blake2b
+
+from deepdiff import DeepDiff, Delta
+from deepdiff.path import parse_path, stringify_path
+
+DIGEST_SIZE = 16
+
+# Buffers smaller than this are re-hashed every time, caching them costs
+# more than it saves.
+BUFFER_MEMO_THRESHOLD = 4096
+BUFFER_MEMO_MAX_ENTRIES = 4096
+BUFFER_MEMO_MAX_BYTES = 256 * 1024 * 1024
+
+BUFFER_TYPES = (bytes, bytearray, memoryview)
+SEQUENCE_TYPES = (list, tuple)
+
+
+class BufferDigestMemo():
+    """ Identity keyed cache of byte buffer digests.
+
+        Buffers are immutable bytes objects which survive the deepcopy done by
+        Delta.__add__, so the buffers of the previous dump (node.data) are the
+        very same objects we hashed when they were the current dump.
+    """
+
+    def __init__(self,
+                 max_entries=BUFFER_MEMO_MAX_ENTRIES,
+                 max_bytes=BUFFER_MEMO_MAX_BYTES):
+        self._entries = OrderedDict()
+        self._size = 0
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def digest(self, buffer) -> bytes:
+        if len(buffer) < BUFFER_MEMO_THRESHOLD or not isinstance(buffer, bytes):
+            return blake2b(buffer, digest_size=DIGEST_SIZE).digest()
+
+        key = id(buffer)
+        entry = self._entries.get(key)
+        if entry and entry[0] is buffer:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        digest = blake2b(buffer, digest_size=DIGEST_SIZE).digest()
+        if entry:
+            self._size -= len(entry[0])
+        # Keep a reference on the buffer so its id can't be recycled
+        self._entries[key] = (buffer, digest)
+        self._size += len(buffer)
+
+        while self._entries and (len(self._entries) > self.max_entries
+                                 or self._size > self.max_bytes):
+            _, (old_buffer, _) = self._entries.popitem(last=False)
+            self._size -= len(old_buffer)
+
+        return digest
+
+    def clear(self):
+        self._entries.clear()
+        self._size = 0
+
+
+class MerkleTree():
+    """ Subtree digests of a dump, indexed by container identity
+    """
+
+    def __init__(self, data, ignore_order=False, memo=None):
+        self.data = data
+        self.ignore_order = ignore_order
+        self.memo = memo if memo is not None else BufferDigestMemo()
+        self.digests = {}
+        self.root = self.digest(data)
+
+    def digest(self, obj) -> bytes:
+        """ Return the digest of obj, hashing it if needed
+        """
+        if isinstance(obj, dict):
+            cached = self.digests.get(id(obj))
+            if cached is None:
+                # Dict equality doesn't depend on insertion order
+                entries = sorted(
+                    self._leaf_key(key) + self.digest(value)
+                    for key, value in obj.items())
+                cached = self._combine(b'd', entries)
+                self.digests[id(obj)] = cached
+            return cached
+        elif isinstance(obj, SEQUENCE_TYPES):
+            cached = self.digests.get(id(obj))
+            if cached is None:
+                items = [self.digest(item) for item in obj]
+                if self.ignore_order:
+                    items.sort()
+                cached = self._combine(
+                    b'l' if isinstance(obj, list) else b't', items)
+                self.digests[id(obj)] = cached
+            return cached
+        elif isinstance(obj, BUFFER_TYPES):
+            return b'b' + self.memo.digest(obj)
+        else:
+            return self._leaf_key(obj)
+
+    @staticmethod
+    def _combine(tag: bytes, children: list) -> bytes:
+        hasher = blake2b(tag, digest_size=DIGEST_SIZE)
+        for child in children:
+            hasher.update(child)
+        return tag + hasher.digest()
+
+    @staticmethod
+    def _leaf_key(obj) -> bytes:
+        # Type is part of the key so 1 and 1.0 or True and 1 are different
+        return blake2b(f"{type(obj).__name__}:{obj!r}".encode(),
+                       digest_size=DIGEST_SIZE).digest()
+
+
+class StructuralDiffer():
+    """ Compute a deepdiff Delta between two dumps using merkle trees.
+
+        :param ignore_order: compare lists as multisets (same semantic as
+            DeepDiff ignore_order + report_repetition)
+        :type ignore_order: bool
+        :param exclude_paths: deepdiff style paths to ignore (ex: "root['eevee']")
+        :type exclude_paths: list
+    """
+
+    def __init__(self, ignore_order=False, exclude_paths=None, memo=None):
+        self.ignore_order = ignore_order
+        self.exclude_paths = set()
+        for path in exclude_paths or []:
+            self.exclude_paths.add(tuple(parse_path(path)))
+        self.memo = memo if memo is not None else BufferDigestMemo()
+
+    def tree(self, data) -> MerkleTree:
+        return MerkleTree(data, ignore_order=self.ignore_order, memo=self.memo)
+
+    def diff(self, last_data, current_data,
+             last_tree: MerkleTree = None,
+             current_tree: MerkleTree = None) -> dict:
+        """ Return a deepdiff text view dict of the changes from last_data
+            to current_data
+        """
+        self._old = last_tree or self.tree(last_data)
+        self._new = current_tree or self.tree(current_data)
+        self._result = {}
+        self.old_values = {}  # path: value replaced by a values_changed entry
+
+        if self._old.root != self._new.root:
+            self._compare_dict(last_data, current_data, ())
+
+        result = self._result
+        del self._old, self._new, self._result
+        return result
+
+    def _report(self, report_type: str, path: tuple, value):
+        self._result.setdefault(report_type, {})[_stringify(path)] = value
+
+    def _changed(self, path: tuple, old_value, new_value):
+        # Directed delta: the old value stays local, see old_values
+        self._report('values_changed', path, {'new_value': new_value})
+        self.old_values[_stringify(path)] = old_value
+
+    def _compare(self, old, new, path: tuple):
+        if old is new:
+            return
+        if type(old) is not type(new):
+            self._changed(path, old, new)
+            return
+        if self._old.digest(old) == self._new.digest(new):
+            return
+
+        if isinstance(old, dict):
+            self._compare_dict(old, new, path)
+        elif isinstance(old, list):
+            self._compare_list(old, new, path)
+        else:
+            self._changed(path, old, new)
+
+    def _compare_dict(self, old: dict, new: dict, path: tuple):
+        if not all(_is_path_key(k) for k in old.keys() | new.keys()):
+            # Delta paths can't address these keys, replace the whole branch
+            self._changed(path, old, new)
+            return
+
+        for key, value in old.items():
+            if key not in new and path + (key,) not in self.exclude_paths:
+                self._report('dictionary_item_removed', path + (key,), value)
+
+        for key, value in new.items():
+            key_path = path + (key,)
+            if key_path in self.exclude_paths:
+                continue
+            if key not in old:
+                self._report('dictionary_item_added', key_path, value)
+            else:
+                self._compare(old[key], value, key_path)
+
+    def _compare_list(self, old: list, new: list, path: tuple):
+        if self.ignore_order:
+            self._compare_multiset(old, new, path)
+        elif len(old) == len(new):
+            for index, (old_item, new_item) in enumerate(zip(old, new)):
+                self._compare(old_item, new_item, path + (index,))
+        else:
+            self._changed(path, old, new)
+
+    def _compare_multiset(self, old: list, new: list, path: tuple):
+        old_keys = [self._old.digest(item) for item in old]
+        new_keys = [self._new.digest(item) for item in new]
+
+        remaining = Counter(new_keys)
+        removed = []
+        for index, key in enumerate(old_keys):
+            if remaining[key]:
+                remaining[key] -= 1
+            else:
+                removed.append(index)
+
+        remaining = Counter(old_keys)
+        added = []
+        for item, key in zip(new, new_keys):
+            if remaining[key]:
+                remaining[key] -= 1
+            else:
+                added.append(item)
+
+        for index in removed:
+            self._report('iterable_item_removed', path + (index,), old[index])
+
+        # Order doesn't matter here, new items are appended once the
+        # removed ones are gone
+        offset = len(old) - len(removed)
+        for index, item in enumerate(added):
+            self._report('iterable_item_added', path + (offset + index,), item)
+
+
+def _is_path_key(key) -> bool:
+    return isinstance(key, str) or (isinstance(key, int)
+                                    and not isinstance(key, bool))
+
+
+def _stringify(path: tuple) -> str:
+    return stringify_path([(element, 'GET') for element in path])
+
+
+_buffer_memo = BufferDigestMemo()
+
+# Merkle tree of the last dump diffed per node uuid, only reusable while the
+# node data is that very dump (types replicated without delta)
+PREVIOUS_TREES_MAX_ENTRIES = 256
+_previous_trees = {}
+
+# Values replaced by the last diffs, kept locally for the undo since the
+# deltas don't carry them
+OLD_VALUES_MAX_ENTRIES = 64
+_old_values = {}
+
+
+def compute_delta(last_data: dict,
+                  current_data: dict,
+                  ignore_order: bool = False,
+                  exclude_paths: list = None,
+                  keep_tree: bool = False) -> Delta:
+    """ Drop-in replacement for the DeepDiff based compute_delta
+
+        With keep_tree, the merkle tree of the current dump is kept per node
+        uuid so the next diff against it doesn't need to hash it again. Only
+        useful when the dump becomes the node data: patched nodes get a new
+        data dict, the tree would never be reused.
+
+        :param last_data: last replicated dump
+        :type last_data: dict
+        :param current_data: freshly dumped data
+        :type current_data: dict
+        :param ignore_order: compare lists regardless of their order
+        :type ignore_order: bool
+        :param exclude_paths: deepdiff style paths to skip
+        :type exclude_paths: list
+        :param keep_tree: keep the tree of the current dump for the next diff
+        :type keep_tree: bool
+        :return: Delta
+    """
+    if not isinstance(last_data, dict) or not isinstance(current_data, dict):
+        logging.debug("Structural diff only supports dict dumps")
+        return Delta(DeepDiff(last_data, current_data, cache_size=5000))
+
+    differ = StructuralDiffer(ignore_order=ignore_order,
+                              exclude_paths=exclude_paths,
+                              memo=_buffer_memo)
+    uuid = current_data.get('uuid')
+    last_tree = None
+    # Either reused now or outdated
+    cached = _previous_trees.pop(uuid, None)
+    if cached and cached.data is last_data and cached.ignore_order == ignore_order:
+        last_tree = cached
+
+    current_tree = differ.tree(current_data)
+    diff = differ.diff(last_data, current_data,
+                       last_tree=last_tree,
+                       current_tree=current_tree)
+
+    if uuid:
+        if keep_tree:
+            _previous_trees[uuid] = current_tree
+            while len(_previous_trees) > PREVIOUS_TREES_MAX_ENTRIES:
+                del _previous_trees[next(iter(_previous_trees))]
+        _old_values.pop(uuid, None)
+        if differ.old_values:
+            _old_values[uuid] = differ.old_values
+            while len(_old_values) > OLD_VALUES_MAX_ENTRIES:
+                del _old_values[next(iter(_old_values))]
+
+    return Delta(diff)
+
+
+def pop_old_values(uuid: str) -> dict:
+    """ Values replaced by the last delta computed for a node
+
+        :param uuid: node uuid
+        :type uuid: str
+        :return: dict, value by deepdiff path, None if unknown
+    """
+    return _old_values.pop(uuid, None)
+
+
+def fingerprint(data) -> bytes:
+    """ Streaming digest of a whole dump
+
+        Cheaper than a MerkleTree since nothing is stored per container, it
+        only tells if two dumps are identical.
+
+        :param data: dump to fingerprint
+        :type data: dict
+        :return: bytes
+    """
+    hasher = blake2b(digest_size=DIGEST_SIZE)
+    _feed(hasher, data)
+    return hasher.digest()
+
+
+def _feed(hasher, obj):
+    if isinstance(obj, dict):
+        hasher.update(b'd%d' % len(obj))
+        for key, value in obj.items():
+            _feed(hasher, key)
+            _feed(hasher, value)
+    elif isinstance(obj, SEQUENCE_TYPES):
+        hasher.update(b'l%d' % len(obj))
+        for item in obj:
+            _feed(hasher, item)
+    elif isinstance(obj, BUFFER_TYPES):
+        hasher.update(b'b')
+        hasher.update(_buffer_memo.digest(obj))
+    else:
+        hasher.update(f"{type(obj).__name__}:{obj!r};".encode())
+
+
+def clear_cache():
+    """ Drop every cached tree, buffer digest and old value (ex: on session
+        exit)
+    """
+    _previous_trees.clear()
+    _buffer_memo.clear()
+    _old_values.clear()
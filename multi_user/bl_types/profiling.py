@@ -0,0 +1,242 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""Opt-in instrumentation of the Bl* implementations.
+
+Each profiled implementation is replaced by a subclass whose methods record
+a timing histogram (and an allocation histogram when allocation tracing is
+enabled). Once a call exceeds the threshold, the next call of the same
+method is run under cProfile and its stats are written next to the session
+log, so only the slow paths pay the profiling cost.
+"""
+
+import cProfile
+import functools
+import json
+import logging
+import math
+import time
+import tracemalloc
+from pathlib import Path
+
+from replication.protocol import ReplicatedDatablock
+
+PROFILED_METHODS = [
+    'dump',
+    'load',
+    'construct',
+    'resolve',
+    'resolve_deps',
+    'compute_delta',
+]
+
+# Histogram buckets are powers of two: [0, 1[, [1, 2[, [2, 4[...
+HISTOGRAM_BUCKETS = 24
+# Profile snapshots kept per implementation method
+MAX_SNAPSHOTS = 5
+
+
+def bucket(value: float) -> int:
+    if value < 1:
+        return 0
+    return min(HISTOGRAM_BUCKETS - 1, int(math.log2(value)) + 1)
+
+
+class CallStats():
+    """ Timing (ms) and allocation (KB) histograms of a method
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.time_histogram = [0] * HISTOGRAM_BUCKETS
+        self.alloc_histogram = [0] * HISTOGRAM_BUCKETS
+        self.snapshots = 0
+
+    def add(self, elapsed_ms: float, allocated_kb: float = None):
+        self.calls += 1
+        self.total_time += elapsed_ms
+        self.max_time = max(self.max_time, elapsed_ms)
+        self.time_histogram[bucket(elapsed_ms)] += 1
+        if allocated_kb is not None:
+            self.alloc_histogram[bucket(allocated_kb)] += 1
+
+    def as_dict(self) -> dict:
+        return {
+            'calls': self.calls,
+            'total_ms': self.total_time,
+            'max_ms': self.max_time,
+            'time_histogram_ms': self.time_histogram,
+            'alloc_histogram_kb': self.alloc_histogram,
+            'snapshots': self.snapshots,
+        }
+
+
+class Profiler():
+    """ Collect the implementations calls statistics
+
+        :param output: path prefix of the written files, usually the session
+            log path without extension
+        :type output: Path
+        :param threshold: call duration (ms) arming a cProfile snapshot
+        :type threshold: float
+        :param trace_allocations: record allocations with tracemalloc
+        :type trace_allocations: bool
+    """
+
+    def __init__(self, output: Path, threshold: float = 50,
+                 trace_allocations: bool = False):
+        self.output = Path(output)
+        self.threshold = threshold
+        self.trace_allocations = trace_allocations
+        self.stats = {}  # (type_id, method): CallStats
+        self.armed = set()
+        self._depth = 0
+
+        if trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def wrap(self, type_id: str, name: str, method):
+        key = (type_id, name)
+
+        @functools.wraps(method)
+        def profiled(*args, **kwargs):
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = CallStats()
+
+            # Nested calls (ex: compute_delta dumping) are only accounted
+            # in their caller profile
+            snapshot = None
+            if key in self.armed and self._depth == 0:
+                self.armed.discard(key)
+                snapshot = cProfile.Profile()
+
+            tracing = self.trace_allocations and tracemalloc.is_tracing()
+            if tracing:
+                memory_start = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+
+            self._depth += 1
+            start = time.perf_counter()
+            try:
+                if snapshot:
+                    return snapshot.runcall(method, *args, **kwargs)
+                return method(*args, **kwargs)
+            finally:
+                elapsed = (time.perf_counter() - start) * 1000
+                self._depth -= 1
+                allocated = None
+                if tracing:
+                    allocated = max(0, tracemalloc.get_traced_memory()[1] - memory_start) / 1024
+                stats.add(elapsed, allocated)
+
+                if snapshot:
+                    self._write_snapshot(key, stats, snapshot)
+                elif elapsed > self.threshold and stats.snapshots < MAX_SNAPSHOTS:
+                    self.armed.add(key)
+
+        return profiled
+
+    def profile_implementation(self, type_id: str, implementation: type) -> type:
+        """ Return a subclass of the implementation with its methods profiled
+        """
+        attributes = {}
+        for name in PROFILED_METHODS:
+            method = getattr(implementation, name, None)
+            # Library defaults are left untouched, the protocol relies on
+            # their identity
+            if method is None or method is getattr(ReplicatedDatablock, name, None):
+                continue
+            attributes[name] = staticmethod(self.wrap(type_id, name, method))
+
+        return type(implementation.__name__, (implementation,), attributes)
+
+    def _write_snapshot(self, key: tuple, stats: CallStats, snapshot: cProfile.Profile):
+        stats.snapshots += 1
+        type_id, name = key
+        filepath = self.output.with_name(
+            f"{self.output.name}_{type_id}_{name}_{stats.snapshots}.prof")
+        try:
+            filepath.parent.mkdir(parents=True, exist_ok=True)
+            snapshot.dump_stats(str(filepath))
+        except OSError as e:
+            logging.warning(f"Can't write profile {filepath}: {e}")
+        else:
+            logging.info(f"Profile of a slow {type_id}.{name} written to {filepath}")
+
+    def as_dict(self) -> dict:
+        return {f"{type_id}.{name}": stats.as_dict()
+                for (type_id, name), stats in sorted(self.stats.items())}
+
+    def write_report(self) -> Path:
+        """ Write the histograms next to the snapshots
+        """
+        filepath = self.output.with_name(f"{self.output.name}_profile.json")
+        with open(filepath, 'w') as f:
+            json.dump({
+                'threshold_ms': self.threshold,
+                'histogram_buckets': "powers of two, [0,1[ [1,2[ [2,4[...",
+                'methods': self.as_dict(),
+            }, f, indent=2)
+        return filepath
+
+    def stop(self):
+        if self.trace_allocations and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+profiler = None
+
+
+def get_log_prefix() -> Path:
+    """ Find the session log file set by setup_logging
+    """
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.FileHandler):
+            return Path(handler.baseFilename).with_suffix('')
+    return None
+
+
+def start(threshold: float, trace_allocations: bool) -> Profiler:
+    global profiler
+
+    stop()
+    output = get_log_prefix()
+    if output is None:
+        logging.warning("No session log, profiling disabled")
+        return None
+
+    profiler = Profiler(output, threshold, trace_allocations)
+    logging.info(f"Profiling implementations, threshold {threshold} ms")
+    return profiler
+
+
+def stop():
+    """ Write the report of the running profiler, if any
+    """
+    global profiler
+
+    if profiler:
+        try:
+            filepath = profiler.write_report()
+            logging.info(f"Profiling report written to {filepath}")
+        except OSError as e:
+            logging.warning(f"Can't write profiling report: {e}")
+        profiler.stop()
+        profiler = None
@@ -16,59 +16,238 @@
 # ##### END GPL LICENSE BLOCK #####
 
 import bpy
+import logging
+import sqlite3
 import time
 from datetime import datetime
 from collections import deque
+from deepdiff import Delta
+from deepdiff.path import parse_path
+from replication import porcelain
 from replication.interface import session
-from replication.constants import STATE_ACTIVE
+from replication.constants import COMMITED, STATE_ACTIVE
+from replication.objects import Commit, Node
+
+from .bl_types import dump_diff
+from .repository_hooks import OUTGOING
+
+try:
+    import _pickle as pickle
+except ImportError:
+    import pickle
+
+# Changes kept in memory, older ones are spilled to the history database
+MAX_HISTORY = 1000
+# Spilled changes written to the database at once
+SPILL_BATCH = 200
+# Changed properties recorded per commit, the others are summed up
+MAX_COMMIT_PROPERTIES = 8
+MAX_VALUE_LENGTH = 64
+
+# Memory held by the undo diffs
+MAX_UNDO_BYTES = 64 * 1024 * 1024
+# Local commits pushed within this delay form a single undo step
+UNDO_GROUP_SECONDS = 0.5
+
+# Fields of a change, in the ring buffer and in the database
+FIELDS = ('timestamp', 'user', 'object', 'property', 'old_value', 'new_value')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS changes (
+    timestamp REAL, user TEXT, object TEXT, property TEXT,
+    old_value, new_value);
+CREATE INDEX IF NOT EXISTS changes_time ON changes (timestamp);
+CREATE INDEX IF NOT EXISTS changes_object ON changes (object, timestamp);
+CREATE INDEX IF NOT EXISTS changes_user ON changes (user, timestamp);
+"""
+
+
+def summarize(value):
+    """ Compact form of a changed value: scalars are kept, long strings are
+        truncated and containers are reduced to their type and size
+    """
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        return value if len(value) <= MAX_VALUE_LENGTH else value[:MAX_VALUE_LENGTH - 1] + '…'
+    try:
+        return f"<{type(value).__name__} {len(value)}>"
+    except TypeError:
+        return f"<{type(value).__name__}>"
+
+
+def property_path(path: str) -> str:
+    """ Readable form of a delta path, root['location'][0] -> location[0]
+    """
+    try:
+        elements = parse_path(path)
+    except Exception:
+        return path
+    readable = ''
+    for element in elements:
+        if isinstance(element, int):
+            readable += f"[{element}]"
+        else:
+            readable += f".{element}" if readable else str(element)
+    return readable
 
 
 # Global change history storage
 class ChangeHistory:
-    """Track changes made by users (git blame-like)"""
-    def __init__(self, max_history=1000):
+    """Track changes made by users (git blame-like)
+
+    The latest changes are kept in a ring buffer of tuples (see FIELDS). Once
+    a database is opened, the changes leaving the buffer are spilled to it by
+    batches, indexed by object, user and time, so the queries reach back
+    further than the buffer without growing the memory.
+    """
+    def __init__(self, max_history=MAX_HISTORY):
         self.changes = deque(maxlen=max_history)  # Limited history
-        self.object_history = {}  # object_name -> [changes]
+        self.filepath = None
+        self._spilled = []  # Changes out of the buffer, not yet written
+        self._db = None
+
+    def open(self, filepath):
+        """ Spill the changes to a database
+
+            :param filepath: database filepath, created when missing
+            :type filepath: str
+        """
+        self.close()
+        try:
+            self._db = sqlite3.connect(filepath)
+            self._db.executescript(SCHEMA)
+            self.filepath = filepath
+        except sqlite3.Error as e:
+            logging.error(f"Can't open the change history {filepath}: {e}")
+            self._db = None
+
+    def close(self):
+        """ Write the buffered changes to the database and close it
+        """
+        if self._db is None:
+            return
+        self._spilled.extend(self.changes)
+        self.changes.clear()
+        self._flush()
+        self._db.close()
+        self._db = None
+
+    def _flush(self):
+        if self._db is None or not self._spilled:
+            return
+        try:
+            with self._db:
+                self._db.executemany(
+                    "INSERT INTO changes VALUES (?, ?, ?, ?, ?, ?)", self._spilled)
+        except sqlite3.Error as e:
+            logging.error(f"Can't write the change history: {e}")
+        self._spilled.clear()
 
     def add_change(self, object_name, property_name, old_value, new_value, username, timestamp=None):
         """Record a change"""
         if timestamp is None:
             timestamp = time.time()
 
-        change = {
-            'object': object_name,
-            'property': property_name,
-            'old_value': str(old_value),
-            'new_value': str(new_value),
-            'user': username,
-            'timestamp': timestamp,
-            'datetime': datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
-        }
-
-        self.changes.append(change)
+        if len(self.changes) == self.changes.maxlen:
+            if self._db is not None:
+                self._spilled.append(self.changes[0])
+                if len(self._spilled) >= SPILL_BATCH:
+                    self._flush()
+
+        self.changes.append((timestamp, username, object_name, property_name,
+                             summarize(old_value), summarize(new_value)))
+
+    def record_update(self, update, repository, username=None):
+        """ Record the changes carried by a pushed or received update
+
+            :param update: replicated node or commit
+            :type update: ReplicationObject
+            :param repository: repository holding the updated node
+            :type repository: Repository
+            :param username: author, the node owner by default
+            :type username: str
+        """
+        if isinstance(update, Commit):
+            node = repository.graph.get(update.node_id)
+            if node is None or update.delta is None:
+                return
+            changed = []  # (path, old value, new value)
+            for report_type, report in (update.delta.diff or {}).items():
+                items = report.items() if isinstance(report, dict) else ((path, None) for path in report)
+                for path, value in items:
+                    if isinstance(value, dict) and 'new_value' in value:
+                        changed.append((path, value.get('old_value'), value['new_value']))
+                    elif 'removed' in report_type:
+                        changed.append((path, value, None))
+                    else:
+                        changed.append((path, None, value))
+        elif isinstance(update, Node):
+            node = repository.graph.get(update.uuid) or update
+            changed = [(None, None, None)]  # Whole datablock
+        else:
+            return
 
-        # Track per-object history
-        if object_name not in self.object_history:
-            self.object_history[object_name] = []
-        self.object_history[object_name].append(change)
+        data = node.data if isinstance(node.data, dict) else {}
+        object_name = data.get('name') or node.uuid
+        username = username or node.owner
+        timestamp = time.time()
+
+        for path, old_value, new_value in changed[:MAX_COMMIT_PROPERTIES]:
+            property_name = property_path(path) if path else data.get('type_id', 'datablock')
+            self.add_change(object_name, property_name, old_value, new_value, username, timestamp)
+        if len(changed) > MAX_COMMIT_PROPERTIES:
+            self.add_change(object_name, f"{len(changed) - MAX_COMMIT_PROPERTIES} more properties",
+                            None, None, username, timestamp)
+
+    def _select(self, column=None, value=None, limit=50):
+        """Latest changes, oldest first, from the buffer then the database"""
+        found = []
+        index = FIELDS.index(column) if column else None
+        for change in reversed(self.changes):
+            if index is None or change[index] == value:
+                found.append(change)
+                if len(found) == limit:
+                    break
+
+        if len(found) < limit and self._db is not None:
+            self._flush()
+            where = f"WHERE {column} = ?" if column else ""
+            parameters = (value,) if column else ()
+            try:
+                found.extend(self._db.execute(
+                    f"SELECT * FROM changes {where} ORDER BY timestamp DESC LIMIT ?",
+                    parameters + (limit - len(found),)))
+            except sqlite3.Error as e:
+                logging.error(f"Can't read the change history: {e}")
+
+        return [self._as_dict(change) for change in reversed(found)]
+
+    @staticmethod
+    def _as_dict(change):
+        change = dict(zip(FIELDS, change))
+        change['datetime'] = datetime.fromtimestamp(change['timestamp']).strftime('%Y-%m-%d %H:%M:%S')
+        return change
 
     def get_object_changes(self, object_name, limit=50):
         """Get change history for an object"""
-        return self.object_history.get(object_name, [])[-limit:]
+        return self._select('object', object_name, limit)
 
     def get_recent_changes(self, limit=50):
         """Get most recent changes across all objects"""
-        return list(self.changes)[-limit:]
+        return self._select(limit=limit)
 
     def get_user_changes(self, username, limit=50):
         """Get all changes by a specific user"""
-        user_changes = [c for c in self.changes if c['user'] == username]
-        return user_changes[-limit:]
+        return self._select('user', username, limit)
 
     def clear(self):
         """Clear all history"""
         self.changes.clear()
-        self.object_history.clear()
+        self._spilled.clear()
+        if self._db is not None:
+            with self._db:
+                self._db.execute("DELETE FROM changes")
 
 
 # Global instance
@@ -76,13 +255,114 @@ change_history = ChangeHistory()
 
 
 # Undo/Redo System
+MISSING = object()  # Absent dict key or list item
+
+# Kind of the delta reports, added and removed reports are the two
+# directions of the same change
+REPORT_KINDS = {
+    'values_changed': ('value', None),
+    'dictionary_item_added': ('dict', 'added'),
+    'dictionary_item_removed': ('dict', 'removed'),
+    'iterable_item_added': ('iterable', 'added'),
+    'iterable_item_removed': ('iterable', 'removed'),
+}
+
+
+def commit_changes(diff, old_values):
+    """ Changes of a commit as (kind, path, before, after) tuples, None
+        when the values replaced by the commit are unknown
+
+        :param diff: commit delta diff, as produced by compute_delta
+        :type diff: dict
+        :param old_values: values replaced by the values_changed entries,
+            see dump_diff.pop_old_values
+        :type old_values: dict
+        :return: list
+    """
+    changes = []
+    for report_type, report in diff.items():
+        if report_type not in REPORT_KINDS or not isinstance(report, dict):
+            return None
+        kind, direction = REPORT_KINDS[report_type]
+        for path, value in report.items():
+            if kind == 'value':
+                if not old_values or path not in old_values:
+                    return None
+                changes.append((kind, path, old_values[path], value['new_value']))
+            elif direction == 'added':
+                changes.append((kind, path, MISSING, value))
+            else:
+                changes.append((kind, path, value, MISSING))
+    return changes
+
+
+def value_at(data, path: str):
+    """ Value of a dump at a deepdiff path, MISSING when absent
+    """
+    try:
+        for element in parse_path(path):
+            data = data[element]
+    except (KeyError, IndexError, TypeError):
+        return MISSING
+    return data
+
+
+def directed_diff(data, changes, undo: bool):
+    """ Diff undoing or redoing changes on a node data
+
+        A change only applies when the node still holds the value it left,
+        so a later edit (ex: by another user on a common node) isn't
+        overwritten.
+
+        :return: (diff, list of the skipped paths)
+    """
+    diff = {}
+    skipped = []
+    for kind, path, before, after in reversed(changes) if undo else changes:
+        source, target = (after, before) if undo else (before, after)
+        current = value_at(data, path)
+        # Re-inserted list items have no slot to check
+        if not (kind == 'iterable' and source is MISSING) and not _same(current, source):
+            skipped.append(path)
+            continue
+
+        if kind == 'value':
+            diff.setdefault('values_changed', {})[path] = {'new_value': target}
+        elif target is MISSING:
+            diff.setdefault(f"{'dictionary' if kind == 'dict' else 'iterable'}_item_removed", {})[path] = source
+        else:
+            diff.setdefault(f"{'dictionary' if kind == 'dict' else 'iterable'}_item_added", {})[path] = target
+    return diff, skipped
+
+
+def _same(value, expected) -> bool:
+    if value is MISSING or expected is MISSING:
+        return value is expected
+    return type(value) is type(expected) and value == expected
+
+
 class UndoRedoManager:
-    """Collaborative undo/redo system"""
-    def __init__(self, max_undo=50):
-        self.undo_stack = deque(maxlen=max_undo)
-        self.redo_stack = deque(maxlen=max_undo)
+    """Collaborative undo/redo system
+
+    Each step holds the changes of local commits, with the values they
+    replaced captured when the commit was made. Undoing a step commits and
+    pushes the reverse changes, so only the affected properties are sent
+    and the other users get it as any other change. Steps are dropped from
+    the oldest once their changes exceed max_bytes.
+    """
+    def __init__(self, max_undo=50, max_bytes=MAX_UNDO_BYTES):
+        self.undo_stack = deque()
+        self.redo_stack = deque()
+        self.max_undo = max_undo
+        self.max_bytes = max_bytes
+        self.size = 0  # Bytes of the changes held by both stacks
         self.enabled = True
 
+    def _trim(self):
+        while self.undo_stack and (len(self.undo_stack) > self.max_undo
+                                   or self.size > self.max_bytes):
+            self.size -= self.undo_stack.popleft()['size']
+
     def push_undo(self, action_data):
         """Push an action to undo stack"""
         if not self.enabled:
@@ -90,23 +370,114 @@ class UndoRedoManager:
 
         self.undo_stack.append(action_data)
         # Clear redo stack when new action is performed
+        self.size -= sum(action['size'] for action in self.redo_stack)
         self.redo_stack.clear()
+        self.size += action_data.get('size', 0)
+        self._trim()
+
+    def record_commit(self, commit, repository):
+        """ Store the changes of a pushed local commit
+
+            Commits pushed less than UNDO_GROUP_SECONDS apart (ex: while
+            dragging an object) form a single step.
+
+            :param commit: pushed commit
+            :type commit: Commit
+            :param repository: repository holding the committed node
+            :type repository: Repository
+        """
+        old_values = dump_diff.pop_old_values(commit.node_id)
+        if not self.enabled or commit.delta is None or not commit.delta.diff:
+            return
+        changes = commit_changes(commit.delta.diff, old_values)
+        if changes is None:
+            return
 
-    def undo(self):
+        try:
+            size = len(pickle.dumps(changes, protocol=4))
+        except Exception as e:
+            logging.debug(f"Can't store the undo of {commit.node_id}: {e}")
+            return
+        node = repository.graph.get(commit.node_id)
+        name = node.data.get('name', commit.node_id) if node and isinstance(node.data, dict) else commit.node_id
+        now = time.monotonic()
+
+        last = self.undo_stack[-1] if self.undo_stack and not self.redo_stack else None
+        if last and now - last['time'] < UNDO_GROUP_SECONDS:
+            last['commits'].append((commit.node_id, changes))
+            last['time'] = now
+            last['size'] += size
+            if name not in last['names']:
+                last['names'].append(name)
+                last['description'] = ", ".join(last['names'][:3])
+            self.size += size
+            self._trim()
+        else:
+            self.push_undo({'commits': [(commit.node_id, changes)],
+                            'names': [name],
+                            'description': name,
+                            'size': size,
+                            'time': now})
+
+    def _commit_changes(self, repository, action, undo):
+        """ Apply the changes of a step to the nodes and their datablocks,
+            then push them as new commits
+
+            :return: list, paths skipped since they changed meanwhile
+        """
+        commits = reversed(action['commits']) if undo else action['commits']
+        skipped = []
+        self.enabled = False
+        try:
+            for node_id, changes in commits:
+                node = repository.graph.get(node_id)
+                if node is None or node.instance is None \
+                        or repository.is_node_readonly(node_id):
+                    logging.warning(f"Skipping the undo of {node_id}, not available")
+                    skipped.append(node_id)
+                    continue
+                diff, conflicts = directed_diff(node.data, changes, undo)
+                if conflicts:
+                    logging.warning(f"{node_id} changed since, skipping {', '.join(conflicts)}")
+                    skipped.extend(conflicts)
+                if not diff:
+                    continue
+                commit = Commit()
+                commit.node_id = node_id
+                commit.deps = node.dependencies
+                commit.delta = Delta(diff)
+                try:
+                    node.patch(commit)
+                    repository.rdp.load(node.data, node.instance)
+                    node.last_commit = commit
+                    node.state = COMMITED
+                    porcelain.push(repository, 'origin', node_id)
+                except Exception as e:
+                    logging.error(f"Failed to undo {node_id} changes: {e}")
+                    skipped.append(node_id)
+        finally:
+            self.enabled = True
+        action['skipped'] = skipped
+        return skipped
+
+    def undo(self, repository):
         """Undo last action"""
         if not self.undo_stack:
             return None
 
         action = self.undo_stack.pop()
+        self._commit_changes(repository, action, undo=True)
         self.redo_stack.append(action)
         return action
 
-    def redo(self):
+    def redo(self, repository):
         """Redo last undone action"""
         if not self.redo_stack:
             return None
 
         action = self.redo_stack.pop()
+        self._commit_changes(repository, action, undo=False)
+        action['time'] = float('-inf')  # Don't group the next commits with it
         self.undo_stack.append(action)
         return action
 
@@ -122,12 +493,24 @@ class UndoRedoManager:
         """Clear undo/redo history"""
         self.undo_stack.clear()
         self.redo_stack.clear()
+        self.size = 0
 
 
 # Global instance
 undo_manager = UndoRedoManager()
 
 
+def record_traffic(repository, direction: str, replication_object, chunks: list):
+    """ Repository listener feeding the change history and the undo steps
+    """
+    if direction == OUTGOING:
+        change_history.record_update(replication_object, repository, repository.username)
+        if isinstance(replication_object, Commit):
+            undo_manager.record_commit(replication_object, repository)
+    else:
+        change_history.record_update(replication_object, repository)
+
+
 # Operators
 class MULTIUSER_OT_show_change_history(bpy.types.Operator):
     """Show change history for selected object"""
@@ -165,7 +548,12 @@ class MULTIUSER_OT_show_change_history(bpy.types.Operator):
                 row = col.row()
                 row.label(text=change['datetime'])
                 row.label(text=change['user'], icon='USER')
-                row.label(text=f"{change['property']}: {change['old_value']} → {change['new_value']}")
+                if change['old_value'] is None and change['new_value'] is None:
+                    row.label(text=change['property'])
+                elif change['old_value'] is None:
+                    row.label(text=f"{change['property']}: {change['new_value']}")
+                else:
+                    row.label(text=f"{change['property']}: {change['old_value']} → {change['new_value']}")
                 col.separator()
 
 
@@ -220,9 +608,13 @@ class MULTIUSER_OT_collaborative_undo(bpy.types.Operator):
                 undo_manager.can_undo())
 
     def execute(self, context):
-        action = undo_manager.undo()
+        action = undo_manager.undo(session.repository)
         if action:
-            self.report({'INFO'}, f"Undid: {action.get('description', 'unknown action')}")
+            if action.get('skipped'):
+                self.report({'WARNING'}, f"Undid: {action.get('description', 'unknown action')}, "
+                            f"{len(action['skipped'])} changes skipped (edited since)")
+            else:
+                self.report({'INFO'}, f"Undid: {action.get('description', 'unknown action')}")
         else:
             self.report({'WARNING'}, "Nothing to undo")
         return {'FINISHED'}
@@ -240,9 +632,13 @@ class MULTIUSER_OT_collaborative_redo(bpy.types.Operator):
                 undo_manager.can_redo())
 
     def execute(self, context):
-        action = undo_manager.redo()
+        action = undo_manager.redo(session.repository)
         if action:
-            self.report({'INFO'}, f"Redid: {action.get('description', 'unknown action')}")
+            if action.get('skipped'):
+                self.report({'WARNING'}, f"Redid: {action.get('description', 'unknown action')}, "
+                            f"{len(action['skipped'])} changes skipped (edited since)")
+            else:
+                self.report({'INFO'}, f"Redid: {action.get('description', 'unknown action')}")
         else:
             self.report({'WARNING'}, "Nothing to redo")
         return {'FINISHED'}
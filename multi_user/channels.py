@@ -0,0 +1,102 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""Message channels between the clients and the server.
+
+A channel message is an UpdateUserMetadata command holding a single
+CHANNEL_PREFIX + name key. The persistent server (see
+server/persistent_server_v2.py) handles it instead of storing it in the
+sender metadata, so it doesn't ride along with the presence updates, and
+relays it or answers the sender. Received channel messages are taken out of
+the command (see on_traffic) and handed to the channel handler before the
+session merges the rest of the metadata.
+
+Servers without channels merge the message in the sender metadata and relay
+it as any metadata update: live messages still reach the other clients. Such
+servers also rebroadcast the whole metadata of every user each second, so
+the key is cleared (set to None) right after the message is sent.
+"""
+
+import logging
+import traceback
+
+from replication import porcelain
+from replication.constants import STATE_ACTIVE
+from replication.interface import session
+from replication.objects import UpdateUserMetadata
+
+from .repository_hooks import INCOMING
+
+CHANNEL_PREFIX = 'channel:'
+
+_handlers = {}  # channel name: handler(sender, payload)
+
+
+def register_channel(name: str, handler):
+    """ Receive the messages of a channel
+
+        :param name: channel name
+        :type name: str
+        :param handler: called with the sender username and the message
+            payload on the main thread
+        :type handler: callable
+    """
+    _handlers[CHANNEL_PREFIX + name] = handler
+
+
+def unregister_channel(name: str):
+    _handlers.pop(CHANNEL_PREFIX + name, None)
+
+
+def send(name: str, payload: dict) -> bool:
+    """ Send a message on a channel
+
+        :return: bool, False when not connected
+    """
+    if not session or session.state != STATE_ACTIVE:
+        return False
+
+    key = CHANNEL_PREFIX + name
+    porcelain.update_user_metadata(session.repository, {key: payload})
+    # Don't let the message ride along with the presence updates
+    porcelain.update_user_metadata(session.repository, {key: None})
+    return True
+
+
+def dispatch(command):
+    """ Hand the channel messages of a received command to their handlers
+    """
+    if not isinstance(command, UpdateUserMetadata) or not isinstance(command.data, dict):
+        return
+
+    for key in [key for key in command.data if key in _handlers]:
+        payload = command.data.pop(key)
+        if payload is None:
+            # Clearing of the sender metadata, see send()
+            continue
+        try:
+            _handlers[key](command.owner, payload)
+        except Exception:
+            logging.error(f"Failed to handle the {key} message of {command.owner}")
+            traceback.print_exc()
+
+
+def on_traffic(repository, direction: str, replication_object, chunks: list):
+    """ Repository listener dispatching the received channel messages
+    """
+    if direction == INCOMING:
+        dispatch(replication_object)
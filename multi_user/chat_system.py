@@ -16,14 +16,25 @@
 # ##### END GPL LICENSE BLOCK #####
 
 import bpy
-import json
 import time
 import webbrowser
 from datetime import datetime
 from collections import deque
+from uuid import uuid4
 from replication.interface import session
 from replication.constants import STATE_ACTIVE
-from replication import porcelain
+
+from . import channels
+from .presence import refresh_sidebar_view
+
+# Chat messages go through their own channel: each message is sent once,
+# the server keeps the history and sends it by pages on demand.
+# The stock replication server (Host mode) keeps no history, it relays the
+# history requests: the other users answer with their latest messages, and
+# the history is given up on if nobody answers within HISTORY_TIMEOUT.
+CHAT_CHANNEL = 'chat'
+HISTORY_PAGE_SIZE = 50
+HISTORY_TIMEOUT = 5  # seconds
 
 
 class ChatMessage:
@@ -35,6 +46,8 @@ class ChatMessage:
         self.metadata = metadata or {}
         self.timestamp = time.time()
         self.datetime_str = datetime.fromtimestamp(self.timestamp).strftime('%H:%M:%S')
+        self.seq = 0  # Sender sequence number
+        self.index = None  # Position in the server history
 
     def to_dict(self):
         return {
@@ -43,7 +56,8 @@ class ChatMessage:
             'message': self.message,
             'msg_type': self.msg_type,
             'metadata': self.metadata,
-            'timestamp': self.timestamp
+            'timestamp': self.timestamp,
+            'seq': self.seq,
         }
 
     @staticmethod
@@ -57,18 +71,57 @@ class ChatMessage:
         msg.id = data['id']
         msg.timestamp = data['timestamp']
         msg.datetime_str = datetime.fromtimestamp(msg.timestamp).strftime('%H:%M:%S')
+        msg.seq = data.get('seq', 0)
+        msg.index = data.get('index')
         return msg
 
 
 class ChatManager:
+    """ Chat messages of the session
+
+        Messages are identified by their sender id and sequence number, so
+        duplicates (a history page overlapping live messages) are dropped
+        with a lookup in the id index.
+    """
+
     def __init__(self, max_messages=500):
         self.messages = deque(maxlen=max_messages)
+        self.index = {}  # message id: ChatMessage
         self.unread_count = 0
+        self.sender_id = uuid4().hex[:8]
+        self.sequence = 0
+        self.history_cursor = None  # Server index of the oldest fetched message
+        self.history_requested = False
+        self.history_complete = False
+        self.history_pending = None  # Time of the unanswered history request
+        self._repository = None
+
+    def _follow_session(self):
+        """ Start over when a new session is joined
+        """
+        if session.repository is not self._repository:
+            self.clear()
+            self._repository = session.repository
+
+    def _username(self):
+        return getattr(self._repository, 'username', None)
+
+    def _append(self, message):
+        if message.id in self.index:
+            return False
+        if len(self.messages) == self.messages.maxlen:
+            del self.index[self.messages[0].id]
+        self.messages.append(message)
+        self.index[message.id] = message
+        return True
 
     def add_message(self, message):
-        self.messages.append(message)
-        self.unread_count += 1
-        self.sync_messages()
+        self._follow_session()
+        self.sequence += 1
+        message.seq = self.sequence
+        message.id = f"{self.sender_id}:{self.sequence}"
+        self._append(message)
+        self.sync_messages(message)
 
     def get_messages(self, limit=50):
         return list(self.messages)[-limit:]
@@ -76,40 +129,81 @@ class ChatManager:
     def mark_read(self):
         self.unread_count = 0
 
-    def sync_messages(self):
-        """Sync messages to server"""
-        if session and session.state == STATE_ACTIVE:
-            # Send latest messages via metadata
-            recent_msgs = [m.to_dict() for m in list(self.messages)[-10:]]  # Last 10 messages
-            try:
-                porcelain.update_user_metadata(session.repository, {
-                    'chat_messages': json.dumps(recent_msgs)
-                })
-            except Exception as e:
-                print(f"Failed to sync chat: {e}")
-
-    def load_messages_from_metadata(self):
-        """Load messages from all users"""
-        if session and session.state == STATE_ACTIVE:
-            for username, user_data in session.online_users.items():
-                metadata = user_data.get('metadata', {})
-                chat_json = metadata.get('chat_messages')
-                if chat_json:
-                    try:
-                        messages_data = json.loads(chat_json)
-                        for msg_dict in messages_data:
-                            # Check if we already have this message
-                            if not any(m.id == msg_dict['id'] for m in self.messages):
-                                msg = ChatMessage.from_dict(msg_dict)
-                                self.messages.append(msg)
-                                if msg.username != username:  # New message from other user
-                                    self.unread_count += 1
-                    except:
-                        pass
+    def sync_messages(self, message):
+        """Send a message to the other users"""
+        try:
+            channels.send(CHAT_CHANNEL, {'op': 'post', 'message': message.to_dict()})
+        except Exception as e:
+            print(f"Failed to sync chat: {e}")
+
+    def request_history(self):
+        """Ask the server for the page of messages preceding the oldest one"""
+        if self.history_complete:
+            return
+        self.history_requested = True
+        if channels.send(CHAT_CHANNEL, {
+                'op': 'history',
+                'before': self.history_cursor,
+                'limit': HISTORY_PAGE_SIZE}):
+            self.history_pending = time.monotonic()
+
+    def can_load_history(self):
+        """ False once the history is complete, or unavailable when nobody
+            answered the last request
+        """
+        if self.history_pending is not None \
+                and time.monotonic() - self.history_pending > HISTORY_TIMEOUT:
+            self.history_pending = None
+            self.history_complete = True
+        return not self.history_complete
+
+    def receive(self, sender, payload):
+        """Handle a chat channel message"""
+        self._follow_session()
+        op = payload.get('op')
+
+        if op == 'post':
+            if self._append(ChatMessage.from_dict(payload['message'])):
+                self.unread_count += 1
+                refresh_sidebar_view()
+
+        elif op == 'page' and payload.get('to', self._username()) == self._username():
+            # Older than the messages held, from the newest to the oldest
+            for msg_dict in reversed(payload['messages']):
+                msg = ChatMessage.from_dict(msg_dict)
+                if msg.id in self.index or len(self.messages) == self.messages.maxlen:
+                    continue
+                self.messages.appendleft(msg)
+                self.index[msg.id] = msg
+            if any(msg.get('index') is None for msg in payload['messages']):
+                # Answered by a user, it may overlap the held messages
+                ordered = sorted(self.messages, key=lambda m: m.timestamp)
+                self.messages.clear()
+                self.messages.extend(ordered)
+            elif payload['messages']:
+                self.history_cursor = payload['messages'][0]['index']
+            self.history_pending = None
+            self.history_complete = not payload.get('more', False)
+            refresh_sidebar_view()
+
+        elif op == 'history' and payload.get('before') is None and self.messages:
+            # The server relayed the request instead of answering it, send
+            # the latest messages held. Older pages aren't available.
+            limit = min(int(payload.get('limit', HISTORY_PAGE_SIZE)), HISTORY_PAGE_SIZE)
+            channels.send(CHAT_CHANNEL, {
+                'op': 'page',
+                'to': sender,
+                'messages': [msg.to_dict() for msg in self.get_messages(limit)],
+                'more': False})
 
     def clear(self):
         self.messages.clear()
+        self.index.clear()
         self.unread_count = 0
+        self.history_cursor = None
+        self.history_requested = False
+        self.history_complete = False
+        self.history_pending = None
 
 
 # Global instance
@@ -211,8 +305,10 @@ class MULTIUSER_OT_view_chat(bpy.types.Operator):
         return session and session.state == STATE_ACTIVE
 
     def invoke(self, context, event):
-        # Load latest messages
-        chat_manager.load_messages_from_metadata()
+        # Fetch the latest messages once, the next ones are pushed
+        chat_manager._follow_session()
+        if not chat_manager.history_requested:
+            chat_manager.request_history()
         chat_manager.mark_read()
         return context.window_manager.invoke_popup(self, width=600)
 
@@ -228,6 +324,9 @@ class MULTIUSER_OT_view_chat(bpy.types.Operator):
 
         messages = chat_manager.get_messages(limit=20)
 
+        if chat_manager.history_requested and chat_manager.can_load_history():
+            col.operator("multiuser.chat_history", text="Load Older Messages", icon='TRIA_UP')
+
         if not messages:
             col.label(text="No messages yet. Start chatting!", icon='INFO')
         else:
@@ -275,8 +374,21 @@ class MULTIUSER_OT_view_chat(bpy.types.Operator):
         col.label(text="Tips: Paste links directly, wrap code in ``` for syntax highlighting", icon='INFO')
 
     def execute(self, context):
-        # Refresh messages
-        chat_manager.load_messages_from_metadata()
+        return {'FINISHED'}
+
+
+class MULTIUSER_OT_chat_history(bpy.types.Operator):
+    """Load older chat messages"""
+    bl_idname = "multiuser.chat_history"
+    bl_label = "Load Older Messages"
+    bl_description = "Fetch the previous page of messages from the server"
+
+    @classmethod
+    def poll(cls, context):
+        return session and session.state == STATE_ACTIVE and chat_manager.can_load_history()
+
+    def execute(self, context):
+        chat_manager.request_history()
         return {'FINISHED'}
 
 
@@ -331,11 +443,11 @@ class MULTIUSER_PT_chat(bpy.types.Panel):
             op.message = context.scene.multiuser_quick_message
             # Clear after sending would require callback
 
-        # Refresh button
+        # History button
         layout.separator()
         col = layout.column()
         col.scale_y = 0.8
-        col.operator("multiuser.view_chat", text="Refresh Messages", icon='FILE_REFRESH')
+        col.operator("multiuser.chat_history", text="Load Older Messages", icon='FILE_REFRESH')
 
 
 classes = (
@@ -343,6 +455,7 @@ classes = (
     MULTIUSER_OT_open_chat_link,
     MULTIUSER_OT_copy_chat_code,
     MULTIUSER_OT_view_chat,
+    MULTIUSER_OT_chat_history,
     MULTIUSER_PT_chat,
 )
 
@@ -351,6 +464,8 @@ def register():
     for cls in classes:
         bpy.utils.register_class(cls)
 
+    channels.register_channel(CHAT_CHANNEL, chat_manager.receive)
+
     # Register scene property for quick message
     if not hasattr(bpy.types.Scene, 'multiuser_quick_message'):
         bpy.types.Scene.multiuser_quick_message = bpy.props.StringProperty(
@@ -360,6 +475,8 @@ def register():
 
 
 def unregister():
+    channels.unregister_channel(CHAT_CHANNEL)
+
     for cls in reversed(classes):
         bpy.utils.unregister_class(cls)
 
@@ -17,9 +17,73 @@
 
 import bpy
 import sys
+from bpy_extras.io_utils import ExportHelper
 from replication.interface import session
 from replication.constants import STATE_ACTIVE
 
+from .metrics import (BYTES_IN, BYTES_OUT, COMMITS, DUMP, ECHO_SUPPRESSED,
+                      LOAD, PUSHED, RECEIVED, metrics)
+
+
+def draw_metrics(layout):
+    """ Draw the replication metrics, heaviest datablock types first
+    """
+    from . import utils
+
+    counters = metrics.counters
+    if not counters:
+        layout.label(text="No replication traffic yet")
+        return
+
+    def traffic(type_id):
+        return counters[type_id].get(BYTES_OUT, 0) + counters[type_id].get(BYTES_IN, 0)
+
+    col = layout.column(align=True)
+    for type_id in sorted(counters, key=traffic, reverse=True):
+        values = counters[type_id]
+        col.label(text=f"{type_id}: out {utils.ByteSize(values.get(BYTES_OUT, 0))} "
+                       f"({values.get(PUSHED, 0)}), in {utils.ByteSize(values.get(BYTES_IN, 0))} "
+                       f"({values.get(RECEIVED, 0)})")
+        details = [f"commits {values.get(COMMITS, 0)}"]
+        if values.get(ECHO_SUPPRESSED):
+            details.append(f"echoes {values[ECHO_SUPPRESSED]}")
+        for stage in (DUMP, LOAD):
+            timings = metrics.timing_percentiles(type_id, stage)
+            if timings:
+                details.append(f"{stage} p50/p90 {timings[0]:.1f}/{timings[1]:.1f} ms")
+        col.label(text="    " + ", ".join(details))
+
+    queues = metrics.as_dict()['queues']
+    if queues:
+        col.separator()
+        col.label(text="Queues: " + ", ".join(
+            f"{name} {int(queue['last'])} (max {int(queue['max'])})"
+            for name, queue in queues.items()))
+
+
+class MULTIUSER_OT_export_metrics(bpy.types.Operator, ExportHelper):
+    """Export the replication metrics to a json file"""
+    bl_idname = "multiuser.export_metrics"
+    bl_label = "Export Metrics"
+    bl_description = "Export the replication metrics to a json file"
+
+    filename_ext = ".json"
+
+    filter_glob: bpy.props.StringProperty(
+        default="*.json",
+        options={'HIDDEN'},
+        maxlen=255,
+    )  # type:ignore
+
+    def execute(self, context):
+        try:
+            metrics.export(self.filepath)
+        except OSError as e:
+            self.report({'ERROR'}, repr(e))
+            return {'CANCELLED'}
+        self.report({'INFO'}, f"Metrics exported to {self.filepath}")
+        return {'FINISHED'}
+
 
 class MULTIUSER_OT_show_diagnostics(bpy.types.Operator):
     """Show diagnostic information"""
@@ -83,6 +147,31 @@ class MULTIUSER_OT_show_diagnostics(bpy.types.Operator):
                 col.label(text="Connected Users:")
                 for username in session.online_users.keys():
                     col.label(text=f"  • {username}", icon='USER')
+
+            # Skipped commits
+            rdp = session.repository.rdp
+            if hasattr(rdp, 'suppression_rates') and rdp.commit_stats:
+                box = layout.box()
+                box.label(text="Unchanged Commits Skipped:", icon='SORTTIME')
+                col = box.column(align=True)
+                for type_id, (evaluated, suppressed, rate) in sorted(rdp.suppression_rates().items()):
+                    col.label(text=f"{type_id}: {suppressed}/{evaluated} ({rate:.0%})")
+
+            # Buffer compression
+            if hasattr(rdp, 'compression_ratios') and rdp.compression_stats:
+                box = layout.box()
+                box.label(text="Buffer Compression:", icon='PACKAGE')
+                col = box.column(align=True)
+                for type_id, (raw, packed, ratio, elapsed) in sorted(rdp.compression_ratios().items()):
+                    col.label(text=f"{type_id}: {utils.ByteSize(raw)} -> {utils.ByteSize(packed)} "
+                                   f"({ratio:.0%}, {elapsed * 1000:.0f} ms)")
+
+            # Replication metrics
+            box = layout.box()
+            row = box.row()
+            row.label(text="Replication Metrics:", icon='GRAPH')
+            row.operator('multiuser.export_metrics', text="", icon='EXPORT')
+            draw_metrics(box)
         else:
             box = layout.box()
             box.label(text="Not Connected", icon='UNLINKED')
@@ -111,6 +200,7 @@ class MULTIUSER_OT_show_diagnostics(bpy.types.Operator):
 
 classes = (
     MULTIUSER_OT_show_diagnostics,
+    MULTIUSER_OT_export_metrics,
 )
 
 
@@ -25,6 +25,7 @@ from replication.exception import ContextError, NonAuthorizedOperationError
 from replication.interface import session
 
 from . import shared_data, utils
+from .metrics import ECHO_SUPPRESSED, metrics
 
 
 def sanitize_deps_graph(remove_nodes: bool = False):
@@ -53,7 +54,9 @@ def update_external_dependencies():
     """Force external dependencies(files such as images) evaluation 
     """
     external_types = ['WindowsPath', 'PosixPath', 'Image']
-    nodes_ids = [n.uuid for n in session.repository.graph.values() if n.data['type_id'] in external_types]
+    nodes_ids = [n.uuid for n in session.repository.graph.values()
+                 if n.data['type_id'] in external_types
+                 and n.uuid not in shared_data.session.lazy_nodes]
     for node_id in nodes_ids:
         node = session.repository.graph.get(node_id)
         if node and node.owner in [session.repository.username, RP_COMMON]:
@@ -74,6 +77,9 @@ def on_scene_update(scene):
         if distant_update:
             for u in distant_update:
                 shared_data.session.applied_updates.remove(u)
+                node = session.repository.graph.get(u)
+                if node:
+                    metrics.count(node.data.get('type_id'), ECHO_SUPPRESSED)
             logging.debug(f"Ignoring distant update of {dependency_updates[0].id.name}")
             return
 
@@ -90,6 +96,11 @@ def on_scene_update(scene):
                 if node and (node.owner == session.repository.username or check_common):
                     logging.debug(f"Evaluate {update.id.name}")
                     if node.state == UP:
+                        rdp = session.repository.rdp
+                        # Implementations with a probe may reuse their last
+                        # dumped geometry
+                        rdp.hint_geometry(node.uuid,
+                                          None if update.is_updated_geometry else node.data)
                         try:
                             porcelain.commit(session.repository, node.uuid)
                             porcelain.push(session.repository,
@@ -100,11 +111,15 @@ def on_scene_update(scene):
                                 updated_objects.append(update.id)
 
                         except ReferenceError:
+                            rdp.forget(node.uuid)
                             logging.debug(f"Reference error {node.uuid}")
                         except ContextError as e:
+                            rdp.forget(node.uuid)
                             logging.debug(e)
                         except Exception as e:
+                            rdp.forget(node.uuid)
                             logging.error(e)
+                        rdp.hint_geometry(node.uuid)
                 else:
                     continue
             elif isinstance(update.id, bpy.types.Scene):
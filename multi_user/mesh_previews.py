@@ -0,0 +1,165 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import logging
+
+from replication.interface import session
+
+from . import channels, shared_data
+from .bl_types.bl_mesh import geometry_digest
+
+# Previews of the large meshes go through their own channel, on the command
+# socket: each commit changing the geometry of a mesh above the preview
+# threshold sends its preview before the commit itself is pushed on the data
+# socket. The server keeps the latest preview of each node and sends them to
+# joining users ahead of the nodes catalog.
+# The stock replication server (Host mode) keeps none, it relays the 'sync'
+# request of a joining user: the other users answer with the previews of the
+# nodes they own.
+PREVIEW_CHANNEL = 'previews'
+
+
+class PreviewManager:
+    """ Latest mesh previews of the session
+
+        A preview holds the geometry digests of the dump it was computed
+        from ('digest') and of the previous one ('base'). It only stands for
+        a node whose data matches one of them: the node is either already
+        patched or its commit is on the way.
+    """
+
+    def __init__(self):
+        self.previews = {}  # node uuid: latest preview
+        self.unsent = set()
+        self.requested = False
+        self._repository = None
+
+    def _follow_session(self):
+        """ Start over when a new session is joined
+        """
+        if session.repository is not self._repository:
+            self.clear()
+            self._repository = session.repository
+
+    def publish(self, uuid: str, preview: dict):
+        """ Send the preview of a committed mesh, set as the data
+            translation protocol on_preview hook
+
+            Previews committed before the session is active (the host
+            initial commit) are sent by flush().
+        """
+        self._follow_session()
+        self.previews[uuid] = preview
+        if channels.send(PREVIEW_CHANNEL, {'op': 'put', 'previews': {uuid: preview}}):
+            self.unsent.discard(uuid)
+        else:
+            self.unsent.add(uuid)
+
+    def flush(self):
+        """ Send the previews committed while disconnected
+        """
+        self._follow_session()
+        previews = {uuid: self.previews[uuid] for uuid in self.unsent
+                    if uuid in self.previews}
+        if previews and channels.send(PREVIEW_CHANNEL, {'op': 'put', 'previews': previews}):
+            self.unsent.clear()
+
+    def request_previews(self):
+        """ Ask for the previews, once per session, unless the server
+            already sent them with the snapshot
+        """
+        self._follow_session()
+        if not self.requested and not self.previews:
+            self.requested = channels.send(PREVIEW_CHANNEL, {'op': 'sync'})
+
+    def display(self, uuid: str, pending: bool = None) -> bool:
+        """ Load the preview of a node in place of its geometry, until the
+            node is loaded
+
+            :param pending: whether the node waits to be loaded, looked up
+                in the join and lazy loading queues by default
+            :type pending: bool
+            :return: True if the preview was loaded
+        """
+        self._follow_session()
+        preview = self.previews.get(uuid)
+        node = session.repository.graph.get(uuid) if session.repository else None
+        if preview is None or node is None or node.instance is None \
+                or not isinstance(node.data, dict):
+            return False
+
+        if pending is None:
+            pending = uuid in shared_data.session.pending_join \
+                or uuid in shared_data.session.lazy_nodes
+        if not pending:
+            # The full geometry is loaded or on its way
+            return False
+
+        if geometry_digest(node.data) not in (preview['base'], preview['digest']):
+            # Older than the node data
+            return False
+
+        session.repository.rdp.placeholder({
+            'preview': preview,
+            'bounds': node.data.get('bounds'),
+            'materials': node.data.get('materials'),
+        }, node.instance)
+        # Not a local change to commit
+        shared_data.session.applied_updates.append(uuid)
+        return True
+
+    def receive(self, sender, payload):
+        """Handle a preview channel message"""
+        self._follow_session()
+        op = payload.get('op')
+
+        if op in ('put', 'state') and payload.get('to', self._username()) == self._username():
+            for uuid, preview in payload.get('previews', {}).items():
+                self.previews[uuid] = preview
+                try:
+                    self.display(uuid)
+                except Exception as e:
+                    logging.debug(f"Can't load preview of {uuid}: {e}")
+        elif op == 'sync':
+            # The server relayed the request instead of answering it
+            owned = {uuid: preview for uuid, preview in self.previews.items()
+                     if self._owner(uuid) == self._username()}
+            if owned:
+                channels.send(PREVIEW_CHANNEL, {'op': 'state', 'to': sender, 'previews': owned})
+
+    def _username(self):
+        return getattr(self._repository, 'username', None)
+
+    def _owner(self, uuid):
+        node = self._repository.graph.get(uuid) if self._repository else None
+        return node.owner if node else None
+
+    def clear(self):
+        self.previews.clear()
+        self.unsent.clear()
+        self.requested = False
+
+
+preview_manager = PreviewManager()
+
+
+def register():
+    channels.register_channel(PREVIEW_CHANNEL, preview_manager.receive)
+
+
+def unregister():
+    channels.unregister_channel(PREVIEW_CHANNEL)
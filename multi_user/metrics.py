@@ -0,0 +1,164 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""Live replication metrics.
+
+Counters and timings are recorded per datablock type (type_id) from the
+dump/diff/load paths of the data translation protocol and the push/fetch
+paths of the repository (see count_traffic). Timings and queue depths are
+kept in fixed size rolling windows so memory stays bounded for long sessions.
+"""
+
+import json
+import time
+from collections import deque
+
+import numpy as np
+from replication.objects import Commit, Node
+
+from .repository_hooks import OUTGOING
+
+WINDOW_SIZE = 512
+PERCENTILES = (50, 90, 99)
+
+# Counter names
+COMMITS = 'commits'
+PUSHED = 'pushed'
+RECEIVED = 'received'
+APPLIED = 'applied'
+BYTES_OUT = 'bytes_out'
+BYTES_IN = 'bytes_in'
+ECHO_SUPPRESSED = 'echo_suppressed'
+
+# Timing stages
+DUMP = 'dump'
+DIFF = 'diff'
+LOAD = 'load'
+
+COMMAND = 'Command'
+
+
+class RollingWindow():
+    """ Last `size` samples of a measure
+    """
+
+    def __init__(self, size: int = WINDOW_SIZE):
+        self.samples = deque(maxlen=size)
+        self.total = 0
+
+    def add(self, value: float):
+        self.samples.append(value)
+        self.total += 1
+
+    def percentiles(self, percentiles: tuple = PERCENTILES) -> list:
+        if not self.samples:
+            return [0.0] * len(percentiles)
+        return np.percentile(self.samples, percentiles).tolist()
+
+    @property
+    def last(self) -> float:
+        return self.samples[-1] if self.samples else 0
+
+
+class Metrics():
+    """ Replication metrics store
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.started = time.time()
+        self.counters = {}  # type_id: {counter: value}
+        self.timings = {}  # (type_id, stage): RollingWindow
+        self.queues = {}  # queue name: RollingWindow
+
+    def count(self, type_id: str, counter: str, value: int = 1):
+        counters = self.counters.setdefault(type_id, {})
+        counters[counter] = counters.get(counter, 0) + value
+
+    def time(self, type_id: str, stage: str, seconds: float):
+        window = self.timings.get((type_id, stage))
+        if window is None:
+            window = self.timings[(type_id, stage)] = RollingWindow()
+        window.add(seconds * 1000)
+
+    def sample_queue(self, name: str, depth: int):
+        window = self.queues.get(name)
+        if window is None:
+            window = self.queues[name] = RollingWindow()
+        window.add(depth)
+
+    def timing_percentiles(self, type_id: str, stage: str) -> list:
+        window = self.timings.get((type_id, stage))
+        return window.percentiles() if window else None
+
+    def as_dict(self) -> dict:
+        """ Json serializable view of the metrics
+        """
+        types = {}
+        for type_id, counters in self.counters.items():
+            types[type_id] = {'counters': dict(counters), 'timings_ms': {}}
+        for (type_id, stage), window in self.timings.items():
+            entry = types.setdefault(type_id, {'counters': {}, 'timings_ms': {}})
+            entry['timings_ms'][stage] = {
+                'samples': window.total,
+                **{f"p{p}": v for p, v in zip(PERCENTILES, window.percentiles())}
+            }
+
+        return {
+            'started': self.started,
+            'duration': time.time() - self.started,
+            'types': types,
+            'queues': {name: {'last': window.last,
+                              'max': max(window.samples, default=0),
+                              **{f"p{p}": v for p, v in zip(PERCENTILES, window.percentiles())}}
+                       for name, window in self.queues.items()},
+        }
+
+    def export(self, filepath: str):
+        with open(filepath, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+
+metrics = Metrics()
+
+
+def frame_size(chunks: list) -> int:
+    return sum(len(chunk) for chunk in chunks)
+
+
+def _type_id(repository, replication_object) -> str:
+    if isinstance(replication_object, Node):
+        return replication_object.data.get('type_id', COMMAND)
+    if isinstance(replication_object, Commit):
+        node = repository.graph.get(replication_object.node_id)
+        if node:
+            return node.data.get('type_id', COMMAND)
+    return COMMAND
+
+
+def count_traffic(repository, direction: str, replication_object, chunks: list):
+    """ Repository listener counting the traffic of each datablock type
+    """
+    type_id = _type_id(repository, replication_object)
+    if direction == OUTGOING:
+        metrics.count(type_id, PUSHED)
+        metrics.count(type_id, BYTES_OUT, frame_size(chunks))
+    else:
+        metrics.count(type_id, RECEIVED)
+        metrics.count(type_id, BYTES_IN, frame_size(chunks))
@@ -0,0 +1,227 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""On-disk cache of the nodes received during a session snapshot.
+
+Every node downloaded on join is stored under the cache directory, keyed by
+its uuid and the hash of its serialized chunks. When the server announces
+the node hashes along with its catalog (see server/persistent_server_v2.py),
+the nodes whose hash matches a cached entry are rebuilt locally and only
+the others are requested.
+
+On join, the entries whose hash no longer matches the server one are
+dropped, and so are the ones unused for MAX_AGE. The least recently used
+entries (their mtime is refreshed on every hit) are then dropped until the
+cache fits in its size limit.
+"""
+
+import hashlib
+import logging
+import os
+import time
+from pathlib import Path
+
+try:
+    import _pickle as pickle
+except ImportError:
+    import pickle
+
+from replication.constants import FETCHED
+from replication.interface import Session
+from replication.objects import ReplicationObject
+
+from .utils import get_preferences
+
+CACHE_FOLDER = 'nodes'
+EXTENSION = '.node'
+DEFAULT_MAX_SIZE = 2048 * 1024 * 1024  # bytes
+MAX_AGE = 30 * 24 * 3600  # seconds
+
+_original_handle_client_snapshot = None
+
+
+def node_digest(chunks: list) -> str:
+    """ Hash the serialized chunks of a node, the type chunk excepted
+
+        Must stay in sync with the server side node_digest.
+
+        :param chunks: node raw chunks
+        :type chunks: list
+        :return: str
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for chunk in chunks[1:]:
+        digest.update(len(chunk).to_bytes(8, 'little'))
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+class NodeCache():
+    """ Node chunks stored as <directory>/<uuid>.<digest>.node
+    """
+
+    def __init__(self, directory: str, max_size: int = DEFAULT_MAX_SIZE):
+        self.directory = Path(directory, CACHE_FOLDER)
+        self.max_size = max_size
+
+    def _path(self, uuid: str, digest: str) -> Path:
+        return self.directory / f"{uuid}.{digest}{EXTENSION}"
+
+    def get(self, uuid: str, digest: str) -> list:
+        """ Load the chunks of a node if the cached version matches digest
+        """
+        if not digest:
+            return None
+        path = self._path(uuid, digest)
+        try:
+            with open(path, 'rb') as f:
+                chunks = pickle.load(f)
+            # Recently used, evicted last
+            os.utime(path)
+            return chunks
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"Dropping corrupted cache entry {path.name}: {e}")
+            path.unlink(missing_ok=True)
+            return None
+
+    def put(self, uuid: str, chunks: list):
+        """ Store the chunks of a node, replacing its older versions
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(uuid, node_digest(chunks))
+        if path.exists():
+            return
+
+        for outdated in self.directory.glob(f"{uuid}.*{EXTENSION}"):
+            outdated.unlink(missing_ok=True)
+
+        temporary = path.with_suffix('.tmp')
+        with open(temporary, 'wb') as f:
+            pickle.dump(chunks, f, protocol=4)
+        os.replace(temporary, path)
+
+    def discard_outdated(self, hashes: dict) -> int:
+        """ Drop the entries of the given nodes whose hash doesn't match
+
+            :param hashes: node hashes announced by the server, by uuid
+            :type hashes: dict
+            :return: int, number of dropped entries
+        """
+        dropped = 0
+        for path in list(self.directory.glob(f"*{EXTENSION}")):
+            uuid, _, digest = path.name[:-len(EXTENSION)].rpartition('.')
+            if uuid in hashes and hashes[uuid] != digest:
+                path.unlink(missing_ok=True)
+                dropped += 1
+        return dropped
+
+    def prune(self) -> int:
+        """ Drop the entries unused for MAX_AGE, then the least recently
+            used ones until the cache fits in max_size
+
+            :return: int, number of dropped entries
+        """
+        entries = []
+        for path in self.directory.glob(f"*{EXTENSION}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        limit = time.time() - MAX_AGE
+        dropped = 0
+        for mtime, size, path in entries:
+            if mtime >= limit and total <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            dropped += 1
+        return dropped
+
+
+def get_node_cache() -> NodeCache:
+    settings = get_preferences()
+    if settings is None or not settings.use_node_cache:
+        return None
+    return NodeCache(settings.cache_directory,
+                     max_size=settings.node_cache_size * 1024 * 1024)
+
+
+def handle_client_snapshot(self, command):
+    """ Session.handle_client_snapshot wrapper loading cached nodes from
+        disk instead of requesting them to the server
+    """
+    cache = get_node_cache()
+    state = command.data.get('STATE')
+
+    if cache and state == 'INIT' and command.data.get('HASHES'):
+        hashes = command.data['HASHES']
+        catalog = command.data['CATALOG']
+        missing = []
+        for uuid in catalog:
+            chunks = cache.get(uuid, hashes.get(uuid))
+            if chunks is None:
+                missing.append(uuid)
+                continue
+            node = ReplicationObject.from_raw_chunks(chunks)
+            node.state = FETCHED
+            self.repository.do_commit(node)
+
+        try:
+            # The outdated versions are replaced as they are received, the
+            # entries just loaded are the most recently used
+            cache.discard_outdated(hashes)
+            cache.prune()
+        except OSError as e:
+            logging.warning(f"Can't clean the node cache: {e}")
+
+        # The snapshot end is driven by the last received node, keep at
+        # least one to request
+        if not missing and catalog:
+            missing.append(catalog[-1])
+        logging.info(f"Snapshot : {len(catalog) - len(missing)}/{len(catalog)}"
+                     " nodes loaded from the local cache")
+        command.data['CATALOG'] = missing
+    elif cache and state == 'SET' and command.data.get('DATA') != b'removed':
+        chunks = command.data['DATA']
+        try:
+            cache.put(chunks[1].decode(), chunks)
+        except OSError as e:
+            logging.warning(f"Can't cache node {self._current_snapshot}: {e}")
+
+    return _original_handle_client_snapshot(self, command)
+
+
+def register():
+    global _original_handle_client_snapshot
+
+    if _original_handle_client_snapshot is None:
+        _original_handle_client_snapshot = Session.handle_client_snapshot
+        Session.handle_client_snapshot = handle_client_snapshot
+
+
+def unregister():
+    global _original_handle_client_snapshot
+
+    if _original_handle_client_snapshot is not None:
+        Session.handle_client_snapshot = _original_handle_client_snapshot
+        _original_handle_client_snapshot = None
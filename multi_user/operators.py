@@ -16,7 +16,6 @@
 # ##### END GPL LICENSE BLOCK #####
 
 
-import gzip
 import logging
 import os
 import traceback
@@ -25,29 +24,49 @@ from pathlib import Path
 from uuid import uuid4
 import bmesh
 
-try:
-    import _pickle as pickle
-except ImportError:
-    import pickle
-
 import bpy
 import mathutils
 from bpy_extras.io_utils import ExportHelper, ImportHelper
 from replication import porcelain
-from replication.constants import FETCHED, RP_COMMON, STATE_ACTIVE
+from replication.constants import FETCHED, RP_COMMON, STATE_ACTIVE, UP
+from replication.objects import Node
 from replication.interface import session
 from replication.repository import Repository
 
-from . import bl_types, timers, utils
+from . import (bl_types, change_tracking, channels, recorder, session_file,
+               shared_data, timers, utils)
+from .bl_types import dump_compression, dump_diff, profiling
 from .handlers import on_scene_update
-from .presence import (SessionStatusWidget, bbox_from_obj,
+from .mesh_previews import preview_manager
+from .metrics import count_traffic, metrics
+from .presence import (JoinProgressWidget, SessionStatusWidget, bbox_from_obj,
                        refresh_sidebar_view, presence_viewer, view3d_find)
+from .repository_hooks import HookedRepository
 from .timers import timers_registry
 
 
 deleyables = []
 stop_modal_executor = False
 
+# Change history database, in the cache directory
+HISTORY_FILE = 'history.sqlite'
+
+
+def create_repository(rdp, username: str) -> HookedRepository:
+    """ Session repository, with the traffic listeners of the add-on
+
+        Channel messages are dispatched before the change history sees the
+        metadata updates.
+    """
+    repository = HookedRepository(rdp=rdp, username=username)
+    rdp.on_preview = preview_manager.publish
+    for listener in (recorder.record_traffic,
+                     channels.on_traffic,
+                     change_tracking.record_traffic,
+                     count_traffic):
+        repository.add_listener(listener)
+    return repository
+
 
 def draw_user(username, metadata, radius=0.01, intensity=10.0):
     view_corners = metadata.get("view_corners")
@@ -160,11 +179,57 @@ def draw_user(username, metadata, radius=0.01, intensity=10.0):
 
     bpy.context.scene.collection.children.link(user_collection)
 
+def get_view_origin() -> mathutils.Vector:
+    """ Find the point of view of the local user: the 3D viewport, the scene
+        camera or the world origin
+    """
+    try:
+        area, region, rv3d = view3d_find()
+    except Exception:
+        rv3d = None
+    if rv3d:
+        return rv3d.view_matrix.inverted().translation
+    camera = bpy.context.scene.camera
+    if camera:
+        return camera.matrix_world.translation
+    return mathutils.Vector()
+
+
+def get_visibility_scores(repository, nodes: list) -> dict:
+    """ Score nodes so that the datablocks used by visible objects close to
+        the local point of view come first
+
+        :param repository: session repository
+        :type repository: Repository
+        :param nodes: uuids to score
+        :type nodes: list
+        :return: dict of (hidden, distance) by uuid, hidden being 2 for
+            nodes not used by any object
+    """
+    users = timers.get_users_index(repository)
+
+    bpy.context.view_layer.update()
+    origin = get_view_origin()
+
+    scores = {}
+    for node_id in nodes:
+        best = (2, 0.0)
+        for obj in timers.get_user_objects(node_id, users):
+            try:
+                hidden = 0 if obj.visible_get() else 1
+            except RuntimeError:
+                hidden = 1
+            best = min(best, (hidden, (obj.matrix_world.translation - origin).length))
+        scores[node_id] = best
+    return scores
+
+
 @session.register('on_connection')
 def initialize_session():
     """Session connection init hander
     """
     runtime_settings = bpy.context.window_manager.session
+    streamed = []
 
     if not runtime_settings.is_host:
         logging.info("Intializing the scene")
@@ -180,10 +245,56 @@ def initialize_session():
                     node_ref.instance = session.repository.rdp.construct(node_ref.data)
                     node_ref.instance.uuid = node_ref.uuid
 
-        # Step 2: Load nodes
+        # Step 2: Load the light nodes, heavy ones (meshes, images...)
+        # are streamed afterward so the user can start working right away
         logging.info("Applying nodes")
-        for node in session.repository.heads:
-            porcelain.apply(session.repository, node)
+        rdp = session.repository.rdp
+        for node in session.repository.index_sorted:
+            node_ref = session.repository.graph.get(node)
+            if node_ref is None or node_ref.state != FETCHED:
+                continue
+            impl = rdp.get_implementation(node_ref.instance)
+            if getattr(impl, 'bl_heavy', False):
+                streamed.append(node)
+                continue
+            try:
+                rdp.load(node_ref.data, node_ref.instance)
+                node_ref.state = UP
+            except Exception:
+                logging.warning(f"Deferring {node} to the streamed nodes")
+                streamed.append(node)
+
+    if streamed:
+        # Step 3: Stream heavy nodes, visible and close ones first
+        scores = get_visibility_scores(session.repository, streamed)
+        streamed.sort(key=scores.get)
+
+        # Lazy loading: the ones only used by hidden objects get a
+        # placeholder until they are needed
+        rdp = session.repository.rdp
+        if utils.get_preferences().sync_flags.lazy_loading:
+            lazy = [n for n in streamed if scores[n][0] == 1]
+            streamed = [n for n in streamed if scores[n][0] != 1]
+            for node in lazy:
+                node_ref = session.repository.graph.get(node)
+                try:
+                    if not preview_manager.display(node, pending=True):
+                        rdp.placeholder(node_ref.data, node_ref.instance)
+                except Exception as e:
+                    logging.debug(f"Can't build placeholder for {node}: {e}")
+                shared_data.session.lazy_nodes.add(node)
+            logging.info(f"{len(shared_data.session.lazy_nodes)} nodes lazily loaded")
+            deleyables.append(timers.LazyLoadTimer())
+
+        # Display the previews of the streamed meshes right away
+        for node in streamed:
+            try:
+                preview_manager.display(node, pending=True)
+            except Exception as e:
+                logging.debug(f"Can't load preview of {node}: {e}")
+
+        logging.info(f"Streaming {len(streamed)} nodes")
+        deleyables.append(timers.ProgressiveJoinTimer(streamed))
 
     logging.info("Registering timers")
     # Step 4: Register blender timers
@@ -193,7 +304,16 @@ def initialize_session():
     # Step 5: Clearing history
     utils.flush_history()
 
-    # Step 6: Launch deps graph update handling
+    # Step 6: Spill the change history to the cache directory
+    change_tracking.change_history.open(
+        os.path.join(utils.get_preferences().cache_directory, HISTORY_FILE))
+
+    # Step 7: Share the previews of the meshes committed while connecting,
+    # ask for the others unless the server already sent them
+    preview_manager.flush()
+    preview_manager.request_previews()
+
+    # Step 8: Launch deps graph update handling
     bpy.app.handlers.depsgraph_update_post.append(on_scene_update)
 
 
@@ -212,12 +332,19 @@ def on_connection_end(reason="none"):
     deleyables.clear()
 
     stop_modal_executor = True
+    profiling.stop()
+    recorder.stop()
 
     if on_scene_update in bpy.app.handlers.depsgraph_update_post:
         bpy.app.handlers.depsgraph_update_post.remove(on_scene_update)
 
     presence_viewer.clear_widgets()
     presence_viewer.add_widget("session_status", SessionStatusWidget())
+    presence_viewer.add_widget("join_progress", JoinProgressWidget())
+
+    dump_diff.clear_cache()
+    change_tracking.change_history.close()
+    change_tracking.undo_manager.clear()
 
     # Step 3: remove file handled
     logger = logging.getLogger()
@@ -318,6 +445,9 @@ class SessionJoinOperator(bpy.types.Operator):
         deleyables.clear()
 
         setup_logging()
+        if settings.enable_profiling:
+            profiling.start(settings.profiling_threshold,
+                            settings.profile_allocations)
 
         bpy_protocol = bl_types.get_data_translation_protocol()
 
@@ -329,9 +459,8 @@ class SessionJoinOperator(bpy.types.Operator):
                              regenerate type settings...")
                 settings.generate_supported_types()
 
-        repo = Repository(
-            rdp=bpy_protocol,
-            username=settings.username)
+        metrics.clear()
+        repo = create_repository(bpy_protocol, settings.username)
 
         # Join a session
         if not active_server.use_admin_password:
@@ -383,6 +512,9 @@ class SessionHostOperator(bpy.types.Operator):
         deleyables.clear()
 
         setup_logging()
+        if settings.enable_profiling:
+            profiling.start(settings.profiling_threshold,
+                            settings.profile_allocations)
 
         bpy_protocol = bl_types.get_data_translation_protocol()
 
@@ -394,9 +526,8 @@ class SessionHostOperator(bpy.types.Operator):
                              regenerate type settings...")
                 settings.generate_supported_types()
 
-        repo = Repository(
-            rdp=bpy_protocol,
-            username=settings.username)
+        metrics.clear()
+        repo = create_repository(bpy_protocol, settings.username)
 
         # Host a session
         if settings.init_method == 'EMPTY':
@@ -909,7 +1040,7 @@ class SessionSaveBackupOperator(bpy.types.Operator, ExportHelper):
             recorder.register()
             deleyables.append(recorder)
         else:
-            session.repository.dumps(self.filepath)
+            session_file.dump_repository(session.repository, self.filepath)
 
         return {'FINISHED'}
 
@@ -933,6 +1064,48 @@ class SessionStopAutoSaveOperator(bpy.types.Operator):
 
         return {'FINISHED'}
 
+class SessionRecordOperator(bpy.types.Operator, ExportHelper):
+    bl_idname = "wm.session_record"
+    bl_label = "Record session traffic"
+    bl_description = "Record the session updates to replay them later with scripts/replay_session.py"
+
+    filename_ext = ".murec"
+
+    filter_glob: bpy.props.StringProperty(
+        default="*.murec",
+        options={'HIDDEN'},
+        maxlen=255,
+    )  # type:ignore
+
+    def execute(self, context):
+        try:
+            recorder.start(self.filepath, session.repository)
+        except OSError as e:
+            self.report({'ERROR'}, repr(e))
+            return {'CANCELLED'}
+
+        return {'FINISHED'}
+
+    @classmethod
+    def poll(cls, context):
+        return session.state == STATE_ACTIVE and not recorder.recorder
+
+
+class SessionStopRecordOperator(bpy.types.Operator):
+    bl_idname = "wm.session_stop_record"
+    bl_label = "Stop recording"
+    bl_description = "Stop the session traffic recording"
+
+    @classmethod
+    def poll(cls, context):
+        return recorder.recorder is not None
+
+    def execute(self, context):
+        recorder.stop()
+
+        return {'FINISHED'}
+
+
 class SessionLoadSaveOperator(bpy.types.Operator, ImportHelper):
     bl_idname = "wm.session_load"
     bl_label = "Load session save"
@@ -963,9 +1136,14 @@ class SessionLoadSaveOperator(bpy.types.Operator, ImportHelper):
         description="Shading intensity",
         default=10.0,
     )
+    scene_name: bpy.props.StringProperty(
+        name="Scene",
+        description="Only load this scene and the data it uses, the whole session when empty",
+        default="",
+    )  # type:ignore
 
     def draw(self, context):
-        pass
+        self.layout.prop(self, "scene_name")
 
     def execute(self, context):
         from replication.repository import Repository
@@ -973,28 +1151,65 @@ class SessionLoadSaveOperator(bpy.types.Operator, ImportHelper):
         # init the factory with supported types
         bpy_protocol = bl_types.get_data_translation_protocol()
         repo = Repository(bpy_protocol)
-        repo.loads(self.filepath)
-        utils.clean_scene()
 
-        nodes = [repo.graph.get(n) for n in repo.index_sorted]
+        with session_file.SessionFile(self.filepath) as save:
+            uuids = None
+            if self.scene_name:
+                scenes = [uuid for uuid, name in save.scenes().items()
+                          if name == self.scene_name]
+                if not scenes:
+                    self.report({'ERROR'}, f"No scene named {self.scene_name} in the save")
+                    return {'CANCELLED'}
+                uuids = save.closure(scenes)
+            batches = save.batches(uuids)
+            users = save.users
+
+            # Step 1: Read the nodes, in dependency order
+            nodes = []
+            for _, batch in batches:
+                for uuid in batch:
+                    node = Node.from_raw_chunks(save.read(uuid))
+                    node.state = FETCHED
+                    repo.do_commit(node)
+                    nodes.append(node)
 
-        # Step 1: Construct nodes
+        utils.clean_scene()
+        progress = context.window_manager
+        progress.progress_begin(0, 2 * len(nodes))
+
+        # Step 2: Resolve the nodes before creating any datablock, resolving
+        # is linear in the size of the datablock collections
         for node in nodes:
             node.instance = bpy_protocol.resolve(node.data)
-            if node.instance is None:
-                node.instance = bpy_protocol.construct(node.data)
-                node.instance.uuid = node.uuid
 
-        # Step 2: Load nodes
+        # Step 3: Construct the missing datablocks type by type
+        done = 0
+        for type_id, batch in batches:
+            for uuid in batch:
+                node = repo.graph.get(uuid)
+                if node.instance is None:
+                    node.instance = bpy_protocol.construct(node.data)
+                    node.instance.uuid = node.uuid
+            done += len(batch)
+            progress.progress_update(done)
+            logging.debug(f"Constructed {len(batch)} {type_id}")
+
+        # Step 4: Load nodes, dependencies first
         for node in nodes:
-            porcelain.apply(repo, node.uuid)
-
-        if self.draw_users:
-            f = gzip.open(self.filepath, "rb")
-            db = pickle.load(f)
-
-            users = db.get("users")
-
+            try:
+                bpy_protocol.load(node.data, node.instance)
+                node.state = UP
+            except Exception:
+                logging.error(f"Fail to load {node.uuid}")
+                traceback.print_exc()
+            done += 1
+            if done % 100 == 0:
+                progress.progress_update(done)
+
+        progress.progress_end()
+        logging.info(f"Loaded {len(nodes)} nodes from {self.filepath}")
+
+        if self.draw_users and users:
             for username, user_data in users.items():
                 metadata = user_data['metadata']
 
@@ -1263,6 +1478,7 @@ def menu_func_import(self, context):
 
 def menu_func_export(self, context):
     self.layout.operator(SessionSaveBackupOperator.bl_idname, text='Multi-user session snapshot (.db)')
+    self.layout.operator(SessionRecordOperator.bl_idname, text='Multi-user session traffic recording (.murec)')
 
 
 classes = (
@@ -1283,6 +1499,8 @@ classes = (
     SessionLoadSaveOperator,
     SESSION_PT_ImportUser,
     SessionStopAutoSaveOperator,
+    SessionRecordOperator,
+    SessionStopRecordOperator,
     SessionPurgeOperator,
     SessionPresetServerAdd,
     SessionPresetServerEdit,
@@ -1307,3 +1525,5 @@ def unregister():
     from bpy.utils import unregister_class
     for cls in reversed(classes):
         unregister_class(cls)
+
+    dump_compression.shutdown()
@@ -122,6 +122,17 @@ class ReplicatedDatablock(bpy.types.PropertyGroup):
     use_as_filter: bpy.props.BoolProperty(default=True)
     auto_push: bpy.props.BoolProperty(default=True)
     icon: bpy.props.StringProperty()
+    supports_precision: bpy.props.BoolProperty(default=False)
+    precision: bpy.props.EnumProperty(
+        name="Precision",
+        description="Precision of the replicated geometry attributes",
+        items=[
+            ('FULL', "Full", "Send float attributes at full precision"),
+            ('REDUCED', "Reduced",
+             "Quantize positions, normals, uvs and colors (review sessions over slow links)"),
+        ],
+        default='FULL',
+    )
 
 
 class ServerPreset(bpy.types.PropertyGroup):
@@ -179,6 +190,36 @@ class ReplicationFlags(bpy.types.PropertyGroup):
         get=get_sync_active_camera,
         set=set_sync_active_camera,
     )  # type:ignore
+    compress_buffers: bpy.props.BoolProperty(
+        name="Compress geometry buffers",
+        description="Compress large data buffers (mesh, shape keys...) before sending them",
+        default=True,
+    )  # type:ignore
+    compression_threshold: bpy.props.IntProperty(
+        name="Compression threshold (KB)",
+        description="Minimal buffer size to compress",
+        default=64,
+        min=1,
+    )  # type:ignore
+    preview_threshold: bpy.props.IntProperty(
+        name="Mesh preview threshold",
+        description="Meshes above this vertex count are shared with a decimated preview, "
+                    "displayed by joining users until the full mesh is loaded (0 to disable)",
+        default=100000,
+        min=0,
+    )  # type:ignore
+    lazy_loading: bpy.props.BoolProperty(
+        name="Lazy loading",
+        description="On join, only load heavy datablocks (meshes, images, volumes) "
+                    "once they are visible or selected, placeholders stand for the others",
+        default=False,
+    )  # type:ignore
+    scene_subscription: bpy.props.BoolProperty(
+        name="Scene subscription",
+        description="Only receive the scenes open in your windows, "
+                    "others are fetched when switching to them (persistent server only)",
+        default=False,
+    )  # type:ignore
 
 
 class SessionPrefs(bpy.types.AddonPreferences):
@@ -285,6 +326,17 @@ class SessionPrefs(bpy.types.AddonPreferences):
         description="Remove filecache from memory",
         default=False
     )  # type:ignore
+    use_node_cache: bpy.props.BoolProperty(
+        name="Cache session nodes",
+        description="Keep the received nodes on disk to only download what changed when rejoining",
+        default=True
+    )  # type:ignore
+    node_cache_size: bpy.props.IntProperty(
+        name="Node cache size (MB)",
+        description="The least recently used nodes are dropped from the cache beyond this size",
+        default=2048,
+        min=64,
+    )  # type:ignore
     # For UI
     category: bpy.props.EnumProperty(
         name="Category",
@@ -308,6 +360,23 @@ class SessionPrefs(bpy.types.AddonPreferences):
         set=set_log_level,
         get=get_log_level
     )  # type:ignore
+    enable_profiling: bpy.props.BoolProperty(
+        name="Profile datablocks",
+        description="Record the time spent in each datablock implementation and "
+                    "save a profile of the slow calls next to the session log",
+        default=False
+    )  # type:ignore
+    profiling_threshold: bpy.props.IntProperty(
+        name="Slow call threshold (ms)",
+        description="Calls slower than this trigger a cProfile snapshot",
+        default=50,
+        min=1
+    )  # type:ignore
+    profile_allocations: bpy.props.BoolProperty(
+        name="Trace allocations",
+        description="Also record memory allocations (! Impact performances !)",
+        default=False
+    )  # type:ignore
     presence_hud_scale: bpy.props.FloatProperty(
         name="Text scale",
         description="Adjust the session widget text scale",
@@ -519,6 +588,22 @@ class SessionPrefs(bpy.types.AddonPreferences):
                 row.prop(self.sync_flags, "sync_render_settings")
                 row = box.row()
                 row.prop(self.sync_flags, "sync_active_camera")
+                for datablock_settings in self.supported_datablocks:
+                    if datablock_settings.supports_precision:
+                        row = box.row()
+                        row.label(text=f"{datablock_settings.type_name} precision:",
+                                  icon=datablock_settings.icon)
+                        row.prop(datablock_settings, "precision", text="")
+                row = box.row()
+                row.prop(self.sync_flags, "compress_buffers")
+                if self.sync_flags.compress_buffers:
+                    row.prop(self.sync_flags, "compression_threshold", text="Threshold (KB)")
+                row = box.row()
+                row.prop(self.sync_flags, "preview_threshold")
+                row = box.row()
+                row.prop(self.sync_flags, "lazy_loading")
+                row = box.row()
+                row.prop(self.sync_flags, "scene_subscription")
                 row = box.row()
                 row.prop(self.sync_flags, "sync_during_editmode")
                 row = box.row()
@@ -539,6 +624,9 @@ class SessionPrefs(bpy.types.AddonPreferences):
             if self.conf_session_cache_expanded:
                 box.row().prop(self, "cache_directory", text="Cache directory")
                 box.row().prop(self, "clear_memory_filecache", text="Clear memory filecache")
+                box.row().prop(self, "use_node_cache", text="Cache session nodes")
+                if self.use_node_cache:
+                    box.row().prop(self, "node_cache_size", text="Node cache size (MB)")
                 box.row().operator('wm.session_cache_clear', text=f"Clear cache ({get_folder_size(self.cache_directory)})")
 
             # LOGGING
@@ -551,6 +639,12 @@ class SessionPrefs(bpy.types.AddonPreferences):
                 row = box.row()
                 row.label(text="Log level:")
                 row.prop(self, 'logging_level', text="")
+                row = box.row()
+                row.prop(self, 'enable_profiling')
+                if self.enable_profiling:
+                    row.prop(self, 'profiling_threshold', text="Threshold (ms)")
+                    row = box.row()
+                    row.prop(self, 'profile_allocations')
 
     def generate_supported_types(self):
         self.supported_datablocks.clear()
@@ -566,6 +660,7 @@ class SessionPrefs(bpy.types.AddonPreferences):
             new_db.use_as_filter = True
             new_db.icon = impl.bl_icon
             new_db.bl_name = impl.bl_id
+            new_db.supports_precision = bool(getattr(impl, 'bl_quantization', None))
 
     # Get a server preset through its name
     def get_server_preset(self, name):
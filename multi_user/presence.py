@@ -29,6 +29,7 @@ from gpu_extras.batch import batch_for_shader
 from replication.constants import STATE_ACTIVE, STATE_INITIAL
 from replication.interface import session
 
+from . import shared_data
 from .utils import find_from_attr, get_preferences, get_state_str
 
 # Helper functions
@@ -525,6 +526,34 @@ class SessionStatusWidget(Widget):
         blf.draw(0,  state_str)
 
 
+class JoinProgressWidget(Widget):
+    draw_type = 'POST_PIXEL'
+
+    def __init__(self):
+        self.preferences = get_preferences()
+
+    @property
+    def settings(self):
+        return getattr(bpy.context.window_manager, 'session', None)
+
+    def poll(self):
+        return shared_data.session.join_progress and self.settings and \
+            self.settings.presence_show_session_status and \
+            self.settings.enable_presence
+
+    def draw(self):
+        done, total = shared_data.session.join_progress
+        text_scale = self.preferences.presence_hud_scale
+        ui_scale = bpy.context.preferences.view.ui_scale
+        hpos = (self.preferences.presence_hud_hpos*bpy.context.area.width)/100
+        vpos = (self.preferences.presence_hud_vpos*bpy.context.area.height)/100
+
+        blf.position(0, hpos, vpos - text_scale*ui_scale*1.5, 0)
+        blf.size(0, int(text_scale*ui_scale*0.8))
+        blf.color(0, 1, 1, 1, 0.8)
+        blf.draw(0, f"Streaming scene {done}/{total}")
+
+
 class DrawFactory(object):
     def __init__(self):
         self.post_view_handle = None
@@ -596,6 +625,7 @@ def register():
     global presence_viewer
     presence_viewer.register_handlers()
     presence_viewer.add_widget("session_status", SessionStatusWidget())
+    presence_viewer.add_widget("join_progress", JoinProgressWidget())
 
 
 def unregister():
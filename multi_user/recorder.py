@@ -0,0 +1,177 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""Session traffic recording and replay.
+
+A recording is a gzip stream starting with MAGIC followed by pickled
+(time, kind, payload) records:
+
+- BASE: raw chunks of every node of the repository when the recording
+  started
+- OUTGOING / INCOMING: raw chunks of a pushed or received node or commit,
+  in the order they went through the repository
+
+Replaying rebuilds the base scene, then commits and applies every update
+through the same apply path as the ApplyTimer, see scripts/replay_session.py.
+"""
+
+import gzip
+import logging
+import time
+
+try:
+    import _pickle as pickle
+except ImportError:
+    import pickle
+
+from replication import porcelain
+from replication.constants import FETCHED
+from replication.objects import Commit, Node, ReplicationObject
+from replication.repository import Repository
+
+from .repository_hooks import INCOMING, OUTGOING  # noqa: F401
+
+MAGIC = b'MUREC1\n'
+
+BASE = 'base'
+
+recorder = None
+
+
+class TrafficRecorder():
+    """ Append the repository traffic to a recording file
+
+        :param filepath: recording filepath
+        :type filepath: str
+        :param repository: recorded repository, its nodes are the base state
+        :type repository: Repository
+    """
+
+    def __init__(self, filepath: str, repository: Repository):
+        self.filepath = filepath
+        self.records = 0
+        self._file = gzip.open(filepath, 'wb', compresslevel=3)
+        self._file.write(MAGIC)
+        self._start = time.perf_counter()
+
+        self._write(BASE, [node.as_raw_chunks() for node in repository.graph.values()])
+
+    def _write(self, kind: str, payload):
+        pickle.dump((time.perf_counter() - self._start, kind, payload),
+                    self._file, protocol=4)
+        self.records += 1
+
+    def record(self, direction: str, replication_object, chunks: list):
+        if isinstance(replication_object, (Node, Commit)):
+            self._write(direction, chunks)
+
+    def close(self):
+        self._file.close()
+        logging.info(f"Recorded {self.records} records to {self.filepath}")
+
+
+def record_traffic(repository, direction: str, replication_object, chunks: list):
+    """ Repository listener feeding the active recorder
+    """
+    if recorder:
+        recorder.record(direction, replication_object, chunks)
+
+
+def start(filepath: str, repository: Repository) -> TrafficRecorder:
+    global recorder
+
+    stop()
+    recorder = TrafficRecorder(filepath, repository)
+    logging.info(f"Recording session traffic to {filepath}")
+    return recorder
+
+
+def stop():
+    global recorder
+
+    if recorder:
+        recorder.close()
+        recorder = None
+
+
+def read_recording(filepath: str):
+    """ Iterate over the (time, kind, payload) records of a recording
+    """
+    with gzip.open(filepath, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{filepath} is not a session recording")
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def replay(filepath: str, realtime: bool = False) -> dict:
+    """ Replay a recording in the current blender instance
+
+        :param filepath: recording filepath
+        :type filepath: str
+        :param realtime: keep the recorded pace instead of replaying as fast
+            as possible
+        :type realtime: bool
+        :return: dict, replay statistics
+    """
+    from . import bl_types, timers, utils
+
+    protocol = bl_types.get_data_translation_protocol()
+    repository = Repository(protocol)
+    utils.clean_scene()
+
+    stats = {'updates': 0, 'base_nodes': 0, 'base_seconds': 0.0, 'apply_seconds': 0.0}
+    replay_start = time.perf_counter()
+
+    for timestamp, kind, payload in read_recording(filepath):
+        if kind == BASE:
+            start = time.perf_counter()
+            for chunks in payload:
+                node = ReplicationObject.from_raw_chunks(chunks)
+                node.state = FETCHED
+                repository.do_commit(node)
+            # Dependencies are applied first, already applied nodes skipped
+            for node_id in list(repository.graph.keys()):
+                porcelain.apply(repository, node_id)
+            stats['base_nodes'] = len(payload)
+            stats['base_seconds'] = time.perf_counter() - start
+            replay_start = time.perf_counter() - timestamp
+            continue
+
+        if realtime:
+            delay = timestamp - (time.perf_counter() - replay_start)
+            if delay > 0:
+                time.sleep(delay)
+
+        update = ReplicationObject.from_raw_chunks(payload)
+        node_id = getattr(update, 'uuid', getattr(update, 'node_id', None))
+        if isinstance(update, Commit) and repository.graph.get(node_id) is None:
+            logging.warning(f"Skipping commit of unknown node {node_id}")
+            continue
+
+        start = time.perf_counter()
+        repository.do_commit(update)
+        repository.graph.get(node_id).state = FETCHED
+        timers.apply_node(node_id, repository)
+        stats['apply_seconds'] += time.perf_counter() - start
+        stats['updates'] += 1
+
+    stats['total_seconds'] = time.perf_counter() - replay_start
+    return stats
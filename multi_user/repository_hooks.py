@@ -0,0 +1,112 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""Hooks on the replication traffic of the session repository.
+
+Features watching what goes through the repository (session recorder,
+channels, change history, metrics...) register a listener instead of
+subclassing it. Listeners are called in their registration order with every
+pushed (OUTGOING) and fetched (INCOMING) replication object, once its
+chunks are sent or before the session handles it.
+"""
+
+import logging
+import traceback
+
+import zmq
+from replication.objects import Commit, Delete, Node, ReplicationObject
+from replication.repository import Repository
+
+OUTGOING = 'out'
+INCOMING = 'in'
+
+
+class HookedRepository(Repository):
+    """ Repository calling its listeners with its traffic
+
+        It also counts the graph topology changes seen on the wire (added or
+        removed nodes, changed dependencies) in graph_revision, so the
+        indexes built over the graph know when to be rebuilt.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.listeners = []
+        self.graph_revision = 0
+        self._dependencies = {}  # node uuid: dependencies last seen
+
+    def add_listener(self, listener):
+        """ Register a traffic listener
+
+            :param listener: called with the repository, the direction
+                (OUTGOING or INCOMING), the replication object and its chunks
+            :type listener: callable
+        """
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def _notify(self, direction: str, replication_object, chunks: list):
+        for listener in list(self.listeners):
+            try:
+                listener(self, direction, replication_object, chunks)
+            except Exception:
+                logging.error(f"Repository listener {listener} failed")
+                traceback.print_exc()
+
+    def _track_topology(self, replication_object):
+        if isinstance(replication_object, Node):
+            node_id = replication_object.uuid
+            dependencies = replication_object.dependencies
+        elif isinstance(replication_object, Commit):
+            node_id = replication_object.node_id
+            dependencies = replication_object.deps
+        elif isinstance(replication_object, Delete):
+            self._dependencies.pop(replication_object.data, None)
+            self.graph_revision += 1
+            return
+        else:
+            return
+
+        dependencies = tuple(dependencies or ())
+        if self._dependencies.get(node_id) != dependencies:
+            self._dependencies[node_id] = dependencies
+            self.graph_revision += 1
+
+    def push(self, socket, replication_object, identity=None, force=False):
+        chunks = replication_object.as_raw_chunks()
+        if identity:
+            socket.send(identity, zmq.SNDMORE)
+        socket.send_multipart(chunks)
+        self._track_topology(replication_object)
+        self._notify(OUTGOING, replication_object, chunks)
+
+    def fetch(self, socket):
+        frame = socket.recv_multipart(0)
+
+        if self._bare:
+            identity = frame.pop(0)
+        else:
+            identity = 'server'
+
+        replication_object = ReplicationObject.from_raw_chunks(frame)
+        self._track_topology(replication_object)
+        self._notify(INCOMING, replication_object, frame)
+
+        return identity, replication_object
@@ -21,6 +21,8 @@ from replication import porcelain
 from replication.constants import STATE_ACTIVE
 from replication.interface import session
 
+from . import shared_data, timers
+
 
 class MULTIUSER_OT_scene_create_blank(bpy.types.Operator):
     """Create a new blank scene in the collaborative session"""
@@ -139,6 +141,13 @@ class MULTIUSER_OT_scene_create_copy(bpy.types.Operator):
             return {'CANCELLED'}
 
 
+def get_remote_scenes():
+    """ Session scenes not received yet, name: uuid
+    """
+    return {name: uuid for uuid, name in shared_data.session.remote_scenes.items()
+            if uuid not in session.repository.graph}
+
+
 class MULTIUSER_OT_scene_switch(bpy.types.Operator):
     """Switch to a different scene in the session"""
     bl_idname = "multiuser.scene_switch"
@@ -162,6 +171,16 @@ class MULTIUSER_OT_scene_switch(bpy.types.Operator):
         # Check if scene exists
         target_scene = bpy.data.scenes.get(self.scene_name)
         if not target_scene:
+            # Not received yet (scene subscription), fetch it first
+            remote_uuid = get_remote_scenes().get(self.scene_name)
+            if remote_uuid:
+                switch_timer = timers.timers_registry.get('SceneSwitchTimer')
+                if switch_timer:
+                    switch_timer.unregister()
+                timers.SceneSwitchTimer(remote_uuid).register()
+                self.report({'INFO'}, f"Fetching scene '{self.scene_name}'...")
+                return {'FINISHED'}
+
             self.report({'ERROR'}, f"Scene '{self.scene_name}' not found")
             return {'CANCELLED'}
 
@@ -409,7 +428,8 @@ class MULTIUSER_PT_scene_management(bpy.types.Panel):
 
         # Available scenes list
         scenes = [s for s in bpy.data.scenes]
-        if len(scenes) > 1:
+        remote_scenes = get_remote_scenes()
+        if len(scenes) > 1 or remote_scenes:
             box = layout.box()
             box.label(text="Available Scenes:", icon='OUTLINER_COLLECTION')
             col = box.column(align=True)
@@ -422,6 +442,15 @@ class MULTIUSER_PT_scene_management(bpy.types.Panel):
                                         text=scene.name)
                     props.scene_name = scene.name
                     row.label(text=f"{len(scene.objects)} obj")
+
+            # Scenes left on the server by the scene subscription
+            for name, scene_uuid in sorted(remote_scenes.items()):
+                row = col.row(align=True)
+                pending = scene_uuid in shared_data.session.pending_scenes
+                row.label(text="", icon='SORTTIME' if pending else 'IMPORT')
+                props = row.operator("multiuser.scene_switch", text=name)
+                props.scene_name = name
+                row.label(text="fetching" if pending else "remote")
         else:
             box = layout.box()
             col = box.column()
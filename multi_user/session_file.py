@@ -0,0 +1,222 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""Session save files (.db).
+
+A save starts with MAGIC, followed by the zlib compressed raw chunks of
+every node, then the zlib compressed header and the header offset (FOOTER).
+The header holds the online users and, for each node, the position of its
+chunks, its type, name and dependencies, so a subset of the nodes can be
+read without going through the rest of the file.
+
+Saves written by Repository.dumps (a single gzip pickle) are still read.
+"""
+
+import gzip
+import logging
+import os
+import struct
+import zlib
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import _pickle as pickle
+except ImportError:
+    import pickle
+
+MAGIC = b'MUSAVE2\n'
+FOOTER = struct.Struct('<Q')
+
+SCENE_TYPE_ID = 'Scene'
+
+
+def timestamped_path(filepath: str) -> Path:
+    """ Save filepath suffixed with the current time, like Repository.dumps
+    """
+    filepath = Path(filepath)
+    stime = datetime.now().strftime('%Y_%m_%d_%H-%M-%S')
+    return filepath.with_name(f"{filepath.stem}_{stime}{filepath.suffix}")
+
+
+class SessionWriter():
+    """ Write a save file, through a temporary file
+
+        :param filepath: save filepath
+        :type filepath: str
+    """
+
+    def __init__(self, filepath: str):
+        self.filepath = Path(filepath)
+        self.nodes = {}  # uuid: (offset, length, type_id, name, dependencies)
+        self._temporary = self.filepath.with_name(f"{self.filepath.name}.tmp")
+        self._file = open(self._temporary, 'wb')
+        self._file.write(MAGIC)
+        self._offset = len(MAGIC)
+
+    def add(self, chunks: list, type_id: str = None, name: str = None):
+        """ Add a node from its raw chunks
+        """
+        payload = zlib.compress(pickle.dumps(chunks, protocol=4), 3)
+        self.add_raw(chunks[1].decode(), payload, type_id, name,
+                     pickle.loads(chunks[3]))
+
+    def add_raw(self, uuid: str, payload: bytes, type_id: str, name: str, dependencies: list):
+        """ Add a node already compressed, see SessionFile.read_raw
+        """
+        self._file.write(payload)
+        self.nodes[uuid] = (self._offset, len(payload), type_id, name, dependencies)
+        self._offset += len(payload)
+
+    def close(self, users: dict = None):
+        header = {'users': users, 'nodes': self.nodes}
+        self._file.write(zlib.compress(pickle.dumps(header, protocol=4), 3))
+        self._file.write(FOOTER.pack(self._offset))
+        self._file.close()
+        os.replace(self._temporary, self.filepath)
+
+
+def dump_repository(repository, filepath: str) -> Path:
+    """ Save a repository, in place of Repository.dumps
+
+        :return: Path, timestamped save filepath
+    """
+    filepath = timestamped_path(filepath)
+    logging.info(f"Writing session snapshot to {filepath}")
+
+    writer = SessionWriter(filepath)
+    for node in repository.graph.values():
+        data = node.data if isinstance(node.data, dict) else {}
+        writer.add(node.as_raw_chunks(), data.get('type_id'), data.get('name'))
+    remote = getattr(repository, 'remote', None)
+    writer.close(dict(remote.online_users) if remote else None)
+    return filepath
+
+
+class SessionFile():
+    """ Read access to a save file
+
+        Only the header is read when opening an indexed save, node chunks
+        are read on demand.
+
+        :param filepath: save filepath
+        :type filepath: str
+    """
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self._file = open(filepath, 'rb')
+        self._legacy_nodes = None  # uuid: chunks, saves without index
+
+        if self._file.read(len(MAGIC)) == MAGIC:
+            self._file.seek(-FOOTER.size, os.SEEK_END)
+            footer = self._file.tell()
+            header_offset, = FOOTER.unpack(self._file.read(FOOTER.size))
+            self._file.seek(header_offset)
+            header = pickle.loads(zlib.decompress(self._file.read(footer - header_offset)))
+            self.users = header['users']
+            self.nodes = header['nodes']
+        else:
+            self._read_legacy()
+
+    def _read_legacy(self):
+        self._file.seek(0)
+        with gzip.open(self._file, 'rb') as f:
+            db = pickle.load(f)
+
+        self.users = db.get('users')
+        self.nodes = {}
+        self._legacy_nodes = {}
+        for chunks in db.get('nodes', []):
+            uuid = chunks[1].decode()
+            data = pickle.loads(chunks[4])
+            data = data if isinstance(data, dict) else {}
+            self.nodes[uuid] = (None, None, data.get('type_id'), data.get('name'),
+                                pickle.loads(chunks[3]))
+            self._legacy_nodes[uuid] = chunks
+
+    def read_raw(self, uuid: str) -> bytes:
+        """ Compressed chunks of a node, None for saves without index
+        """
+        if self._legacy_nodes is not None:
+            return None
+        offset, length = self.nodes[uuid][:2]
+        self._file.seek(offset)
+        return self._file.read(length)
+
+    def read(self, uuid: str) -> list:
+        """ Raw chunks of a node
+        """
+        if self._legacy_nodes is not None:
+            return self._legacy_nodes[uuid]
+        return pickle.loads(zlib.decompress(self.read_raw(uuid)))
+
+    def scenes(self) -> dict:
+        """ Scene names, by uuid
+        """
+        return {uuid: entry[3] for uuid, entry in self.nodes.items()
+                if entry[2] == SCENE_TYPE_ID}
+
+    def closure(self, roots: list) -> set:
+        """ Nodes reachable from the given ones through their dependencies
+        """
+        closure = set()
+        stack = list(roots)
+        while stack:
+            uuid = stack.pop()
+            if uuid in closure or uuid not in self.nodes:
+                continue
+            closure.add(uuid)
+            stack.extend(self.nodes[uuid][4] or [])
+        return closure
+
+    def batches(self, uuids=None) -> list:
+        """ Group the nodes by dependency level then by type, each batch only
+            depending on the previous ones
+
+            :param uuids: nodes to sort, every node by default
+            :return: list of (type_id, [uuids])
+        """
+        uuids = set(self.nodes if uuids is None else uuids)
+        levels = {}
+        for root in uuids:
+            stack = [(root, False)]
+            while stack:
+                uuid, expanded = stack.pop()
+                dependencies = [d for d in self.nodes[uuid][4] or [] if d in uuids]
+                if expanded:
+                    levels[uuid] = 1 + max((levels.get(d, 0) for d in dependencies), default=-1)
+                    continue
+                if uuid in levels:
+                    continue
+                levels[uuid] = 0  # Cycles are cut
+                stack.append((uuid, True))
+                stack.extend((d, False) for d in dependencies if d not in levels)
+
+        batches = {}
+        for uuid in sorted(uuids, key=lambda uuid: (levels[uuid], self.nodes[uuid][2] or '', uuid)):
+            batches.setdefault((levels[uuid], self.nodes[uuid][2]), []).append(uuid)
+        return [(type_id, batch) for (_, type_id), batch in batches.items()]
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -31,6 +31,11 @@ class SessionData():
         self.server = None
         self.applied_updates = []
         self.timeline_sync_updating = False  # Flag to prevent frame update loops
+        self.pending_join = set()  # Nodes streamed by the progressive join
+        self.join_progress = None  # (applied, total) while joining
+        self.lazy_nodes = set()  # Nodes only loaded as placeholders
+        self.remote_scenes = {}  # Session scenes announced on join, uuid: name
+        self.pending_scenes = set()  # Scenes fetched before switching to them
 
     @property
     def state(self):
@@ -45,6 +50,11 @@ class SessionData():
         self.server = None
         self.applied_updates = []
         self.timeline_sync_updating = False
+        self.pending_join = set()
+        self.join_progress = None
+        self.lazy_nodes = set()
+        self.remote_scenes = {}
+        self.pending_scenes = set()
 
 
 session = SessionData()
@@ -0,0 +1,103 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""Scene subscriptions.
+
+A subscribed client joins with the closure of its current scene only, then
+announces the scenes open in its windows in its user metadata. The server
+(see server/persistent_server_v2.py) only forwards the updates of the nodes
+used by those scenes, and sends the nodes of a newly opened scene. Servers
+without the filter ignore the subscription and send everything.
+"""
+
+import logging
+
+import bpy
+from replication.interface import Session
+from replication.objects import Snapshot
+
+from . import shared_data
+from .utils import get_preferences
+
+SUBSCRIPTION_KEY = 'subscribed_scenes'
+
+_original_request_snapshot_init = None
+_original_handle_client_snapshot = None
+
+
+def is_enabled() -> bool:
+    settings = get_preferences()
+    return settings is not None and settings.sync_flags.scene_subscription
+
+
+def get_subscribed_scenes() -> list:
+    """ Uuids of the scenes open in a window or waiting to be switched to
+    """
+    scenes = set(shared_data.session.pending_scenes)
+    for window in bpy.context.window_manager.windows:
+        if window.scene.uuid:
+            scenes.add(window.scene.uuid)
+    return sorted(scenes)
+
+
+def request_snapshot_init(self):
+    """ Session.request_snapshot_init asking for the current scene only
+    """
+    if not is_enabled():
+        return _original_request_snapshot_init(self)
+
+    logging.info('Snapshot: request init')
+
+    self._snapshot_progress = 0
+    self._snapshot_total = 0
+
+    snapshot_request = Snapshot(
+        owner=self._id,
+        data={'STATE': "REQUEST_INIT",
+              'SCENE': bpy.context.scene.name})
+
+    self.repository.push(self.remote.command, snapshot_request)
+
+
+def handle_client_snapshot(self, command):
+    """ Session.handle_client_snapshot wrapper keeping the session scenes
+        announced by the server
+    """
+    if command.data.get('STATE') == 'INIT':
+        shared_data.session.remote_scenes = dict(command.data.get('SCENES') or {})
+
+    return _original_handle_client_snapshot(self, command)
+
+
+def register():
+    global _original_request_snapshot_init, _original_handle_client_snapshot
+
+    if _original_request_snapshot_init is None:
+        _original_request_snapshot_init = Session.request_snapshot_init
+        Session.request_snapshot_init = request_snapshot_init
+        _original_handle_client_snapshot = Session.handle_client_snapshot
+        Session.handle_client_snapshot = handle_client_snapshot
+
+
+def unregister():
+    global _original_request_snapshot_init, _original_handle_client_snapshot
+
+    if _original_request_snapshot_init is not None:
+        Session.request_snapshot_init = _original_request_snapshot_init
+        Session.handle_client_snapshot = _original_handle_client_snapshot
+        _original_request_snapshot_init = None
+        _original_handle_client_snapshot = None
@@ -16,17 +16,30 @@
 # ##### END GPL LICENSE BLOCK #####
 
 import bpy
-import json
 import time
+from uuid import uuid4
 from replication.interface import session
 from replication.constants import STATE_ACTIVE
-from replication import porcelain
+
+from . import channels
+from .presence import refresh_sidebar_view
+
+# Tasks go through their own channel as per task changes. Every field carries
+# a version (lamport clock, writer id): the most recent write of a field wins,
+# on every client and on the server which keeps the canonical board.
+TASK_CHANNEL = 'tasks'
+TASK_FIELDS = ('title', 'description', 'assigned_to', 'status', 'created_by',
+               'created_at', 'object_name', 'deleted')
+NO_VERSION = (0, '')
+# Removed tasks are forgotten after this delay (seconds), older writes
+# reviving them are not expected anymore
+TOMBSTONE_TTL = 600
 
 
 # Task storage
 class Task:
     def __init__(self, title, description="", assigned_to="", status="todo", created_by="", object_name=""):
-        self.id = str(time.time())
+        self.id = uuid4().hex
         self.title = title
         self.description = description
         self.assigned_to = assigned_to
@@ -34,6 +47,9 @@ class Task:
         self.created_by = created_by
         self.created_at = time.time()
         self.object_name = object_name  # Optional: link to specific object
+        self.deleted = False  # Removed tasks are kept so older writes can't revive them
+        self.deleted_at = None  # Local time the removal was seen
+        self.versions = {}  # field: (clock, writer) of its last write
 
     def to_dict(self):
         return {
@@ -61,29 +77,88 @@ class Task:
         task.created_at = data.get('created_at', time.time())
         return task
 
+    def set_field(self, name, value):
+        setattr(self, name, value)
+        if name == 'deleted':
+            self.deleted_at = time.time() if value else None
+
+    def merge(self, change):
+        """ Apply the fields of a change written after the task ones
+
+            :param change: {'id', 'fields': {field: value}, 'versions': {field: version}}
+            :type change: dict
+            :return: list, names of the applied fields
+        """
+        applied = []
+        for name, value in change['fields'].items():
+            version = tuple(change['versions'][name])
+            if name in TASK_FIELDS and version > self.versions.get(name, NO_VERSION):
+                self.set_field(name, value)
+                self.versions[name] = version
+                applied.append(name)
+        return applied
+
 
 class TaskManager:
+    """ Task board of the session
+
+        Only the written fields of a task are sent, the server merges them in
+        its board, relays them to the other users and sends the whole board
+        to the users joining.
+
+        The board is kept by the persistent server (server/persistent_server_v2.py).
+        The stock replication server started by Host only relays the
+        messages: the 'sync' request of a joining user then reaches the other
+        users, who answer with their own board.
+    """
+
     def __init__(self):
-        self.tasks = {}  # task_id -> Task
+        self.tasks = {}  # task_id -> Task, removed ones included
+        self.writer_id = uuid4().hex[:8]
+        self.clock = 0
+        self.requested = False
+        self._repository = None
+
+    def _follow_session(self):
+        """ Start over when a new session is joined
+        """
+        if session.repository is not self._repository:
+            self.clear()
+            self._repository = session.repository
+
+    def _write(self, task, fields):
+        """ Version the written fields of a task and send them
+        """
+        self.clock += 1
+        version = (self.clock, self.writer_id)
+        for name in fields:
+            task.versions[name] = version
+        self.sync_tasks([{
+            'id': task.id,
+            'fields': {name: getattr(task, name) for name in fields},
+            'versions': {name: version for name in fields},
+        }])
 
     def add_task(self, task):
+        self._follow_session()
         self.tasks[task.id] = task
-        self.sync_tasks()
+        self._write(task, TASK_FIELDS)
 
     def remove_task(self, task_id):
-        if task_id in self.tasks:
-            del self.tasks[task_id]
-            self.sync_tasks()
+        self.update_task(task_id, deleted=True)
 
     def update_task(self, task_id, **kwargs):
-        if task_id in self.tasks:
-            for key, value in kwargs.items():
-                setattr(self.tasks[task_id], key, value)
-            self.sync_tasks()
+        task = self.tasks.get(task_id)
+        if task and not task.deleted:
+            fields = [key for key in kwargs if key in TASK_FIELDS]
+            for key in fields:
+                task.set_field(key, kwargs[key])
+            if fields:
+                self._write(task, fields)
 
     def get_tasks(self, status=None, assigned_to=None):
         """Get filtered tasks"""
-        tasks = list(self.tasks.values())
+        tasks = [t for t in self.tasks.values() if not t.deleted]
 
         if status:
             tasks = [t for t in tasks if t.status == status]
@@ -92,35 +167,71 @@ class TaskManager:
 
         return sorted(tasks, key=lambda t: t.created_at, reverse=True)
 
-    def sync_tasks(self):
-        """Sync tasks to server via metadata"""
-        if session and session.state == STATE_ACTIVE:
-            tasks_data = {tid: t.to_dict() for tid, t in self.tasks.items()}
-            try:
-                porcelain.update_user_metadata(session.repository, {
-                    'tasks': json.dumps(tasks_data)
-                })
-            except Exception as e:
-                print(f"Failed to sync tasks: {e}")
-
-    def load_tasks_from_metadata(self):
-        """Load tasks from server metadata"""
-        if session and session.state == STATE_ACTIVE:
-            for username, user_data in session.online_users.items():
-                metadata = user_data.get('metadata', {})
-                tasks_json = metadata.get('tasks')
-                if tasks_json:
-                    try:
-                        tasks_data = json.loads(tasks_json)
-                        for task_dict in tasks_data.values():
-                            task = Task.from_dict(task_dict)
-                            if task.id not in self.tasks:
-                                self.tasks[task.id] = task
-                    except:
-                        pass
+    def sync_tasks(self, changes):
+        """Send task changes to the server"""
+        try:
+            channels.send(TASK_CHANNEL, {'op': 'put', 'changes': changes})
+        except Exception as e:
+            print(f"Failed to sync tasks: {e}")
+
+    def request_tasks(self):
+        """Ask the server for the task board, once per session"""
+        self._follow_session()
+        if not self.requested:
+            self.requested = channels.send(TASK_CHANNEL, {'op': 'sync'})
+
+    def purge_tombstones(self):
+        """ Forget the tasks removed for more than TOMBSTONE_TTL
+        """
+        limit = time.time() - TOMBSTONE_TTL
+        for task_id in [task_id for task_id, task in self.tasks.items()
+                        if task.deleted and task.deleted_at < limit]:
+            del self.tasks[task_id]
+
+    def changes(self):
+        """ Every task as changes, recently removed ones included so they
+            stay removed
+        """
+        self.purge_tombstones()
+        return [{'id': task.id,
+                 'fields': {name: getattr(task, name) for name in task.versions},
+                 'versions': dict(task.versions)}
+                for task in self.tasks.values() if task.versions]
+
+    def apply_changes(self, changes):
+        """ Merge task changes, last writer wins per field
+
+            :return: int, number of changed tasks
+        """
+        changed = 0
+        for change in changes:
+            task = self.tasks.get(change['id'])
+            if task is None:
+                task = Task(title="")
+                task.id = change['id']
+                self.tasks[task.id] = task
+            if task.merge(change):
+                changed += 1
+            for version in change['versions'].values():
+                self.clock = max(self.clock, version[0])
+        return changed
+
+    def receive(self, sender, payload):
+        """Handle a task channel message"""
+        self._follow_session()
+        op = payload.get('op')
+
+        if op in ('put', 'state'):
+            if self.apply_changes(payload.get('changes', [])):
+                refresh_sidebar_view()
+            self.purge_tombstones()
+        elif op == 'sync' and self.tasks:
+            # The server relayed the request instead of answering it
+            channels.send(TASK_CHANNEL, {'op': 'state', 'changes': self.changes()})
 
     def clear(self):
         self.tasks.clear()
+        self.requested = False
 
 
 # Global instance
@@ -266,8 +377,7 @@ class MULTIUSER_OT_view_tasks(bpy.types.Operator):
         return session and session.state == STATE_ACTIVE
 
     def invoke(self, context, event):
-        # Load latest tasks from metadata
-        task_manager.load_tasks_from_metadata()
+        task_manager.request_tasks()
         return context.window_manager.invoke_popup(self, width=700)
 
     def draw(self, context):
@@ -365,15 +475,15 @@ class MULTIUSER_PT_tasks(bpy.types.Panel):
         col = box.column(align=True)
         col.scale_y = 1.1
 
-        # Load latest tasks
-        task_manager.load_tasks_from_metadata()
+        # Fetch the board once, the next changes are pushed
+        task_manager.request_tasks()
 
         # Count tasks by status
         todo_count = len(task_manager.get_tasks(status='todo'))
         in_progress_count = len(task_manager.get_tasks(status='in_progress'))
         done_count = len(task_manager.get_tasks(status='done'))
 
-        col.operator("multiuser.view_tasks", text=f"All Tasks ({len(task_manager.tasks)})", icon='PRESET')
+        col.operator("multiuser.view_tasks", text=f"All Tasks ({len(task_manager.get_tasks())})", icon='PRESET')
 
         row = col.row(align=True)
         row.scale_y = 0.9
@@ -398,7 +508,11 @@ def register():
     for cls in classes:
         bpy.utils.register_class(cls)
 
+    channels.register_channel(TASK_CHANNEL, task_manager.receive)
+
 
 def unregister():
+    channels.unregister_channel(TASK_CHANNEL)
+
     for cls in reversed(classes):
         bpy.utils.unregister_class(cls)
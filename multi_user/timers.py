@@ -18,9 +18,11 @@
 import logging
 import sys
 import traceback
+from collections import deque
+
 import bpy
 from replication.constants import (FETCHED, RP_COMMON, STATE_ACTIVE,
-                                   STATE_LOBBY)
+                                   STATE_LOBBY, UP)
 from replication.exception import NonAuthorizedOperationError
 from replication.interface import session
 from replication import porcelain
@@ -30,7 +32,8 @@ from .presence import (UserFrustumWidget, UserNameWidget, UserModeWidget, UserSe
                        generate_user_camera, get_view_matrix, refresh_3d_view,
                        refresh_sidebar_view, presence_viewer)
 
-from . import shared_data
+from . import autosave, shared_data, subscriptions
+from .metrics import metrics
 
 
 # Registered timers
@@ -97,12 +100,28 @@ class Timer(object):
 
 
 class SessionBackupTimer(Timer):
+    """ Auto-save the nodes changed since the previous save, the writing is
+        done by the autosave worker thread
+    """
     def __init__(self, timeout=10, filepath=None):
         self._filepath = filepath
+        self._autosave = None
         super().__init__(timeout)
 
+    def register(self):
+        if not self.is_running:
+            self._autosave = autosave.IncrementalSave(self._filepath)
+        super().register()
+
     def execute(self):
-        session.repository.dumps(self._filepath)
+        self._autosave.save(session.repository)
+
+    def unregister(self):
+        super().unregister()
+        if self._autosave:
+            self._autosave.save(session.repository)
+            self._autosave.close()
+            self._autosave = None
 
 
 class SessionListenTimer(Timer):
@@ -110,34 +129,214 @@ class SessionListenTimer(Timer):
         session.listen()
 
 
+def apply_node(node_id: str, repository=None):
+    """ Apply a fetched node and reload the nodes depending on it
+
+        :param repository: repository holding the node, the session one by
+            default
+        :type repository: Repository
+    """
+    if repository is None:
+        repository = session.repository
+    node_ref = repository.graph.get(node_id)
+    try:
+        shared_data.session.applied_updates.append(node_id)
+        porcelain.apply(repository, node_id)
+    except Exception:
+        logging.error(f"Fail to apply {node_ref.uuid}")
+        traceback.print_exc()
+    else:
+        impl = repository.rdp.get_implementation(node_ref.instance)
+        if impl.bl_reload_parent:
+            for parent in repository.graph.get_parents(node_id):
+                logging.debug("Refresh parent {node}")
+                porcelain.apply(
+                    repository,
+                    parent.uuid,
+                    force=True
+                )
+        if hasattr(impl, 'bl_reload_child') and impl.bl_reload_child:
+            for dep in node_ref.dependencies:
+                porcelain.apply(repository,
+                                dep,
+                                force=True)
+
+
+def get_users_index(repository) -> dict:
+    """ Map each node uuid to the nodes depending on it
+    """
+    users = {}
+    for node_id in repository.graph.keys():
+        node_ref = repository.graph.get(node_id)
+        for dep in node_ref.dependencies or []:
+            users.setdefault(dep, []).append(node_ref)
+    return users
+
+
+def get_user_objects(node_id: str, users: dict) -> list:
+    """ Walk up the users of a node until the objects displaying it
+    """
+    objects = []
+    visited = set()
+    stack = list(users.get(node_id, []))
+    while stack:
+        user = stack.pop()
+        if user.uuid in visited:
+            continue
+        visited.add(user.uuid)
+        if isinstance(user.instance, bpy.types.Object):
+            objects.append(user.instance)
+        else:
+            stack.extend(users.get(user.uuid, []))
+    return objects
+
+
 class ApplyTimer(Timer):
     def execute(self):
         if session and session.state == STATE_ACTIVE:
+            fetched = 0
             for node in session.repository.graph.keys():
                 node_ref = session.repository.graph.get(node)
 
-                if node_ref.state == FETCHED:
-                    try:
-                        shared_data.session.applied_updates.append(node)
-                        porcelain.apply(session.repository, node)
-                    except Exception:
-                        logging.error(f"Fail to apply {node_ref.uuid}")
-                        traceback.print_exc()
-                    else:
-                        impl = session.repository.rdp.get_implementation(node_ref.instance)
-                        if impl.bl_reload_parent:
-                            for parent in session.repository.graph.get_parents(node):
-                                logging.debug("Refresh parent {node}")
-                                porcelain.apply(
-                                    session.repository,
-                                    parent.uuid,
-                                    force=True
-                                )
-                        if hasattr(impl, 'bl_reload_child') and impl.bl_reload_child:
-                            for dep in node_ref.dependencies:
-                                porcelain.apply(session.repository,
-                                                dep,
-                                                force=True)
+                # Nodes still streamed by the join are applied there,
+                # lazy ones once they are needed
+                if node_ref.state == FETCHED \
+                        and node not in shared_data.session.pending_join \
+                        and node not in shared_data.session.lazy_nodes:
+                    fetched += 1
+                    apply_node(node)
+
+            metrics.sample_queue('apply', fetched)
+            metrics.sample_queue('join', len(shared_data.session.pending_join))
+            metrics.sample_queue('lazy', len(shared_data.session.lazy_nodes))
+
+
+class ProgressiveJoinTimer(Timer):
+    """ Stream the heavy nodes of a join in time-sliced chunks
+
+        :param queue: node uuids, in apply order
+        :type queue: list
+        :param budget: time spent applying nodes per tick (ms)
+        :type budget: int
+    """
+
+    def __init__(self, queue, timeout=0.05, budget=30):
+        self._queue = deque(queue)
+        self._total = len(self._queue)
+        self._budget = budget
+        super().__init__(timeout)
+
+    def register(self):
+        shared_data.session.pending_join.update(self._queue)
+        shared_data.session.join_progress = (0, self._total)
+        super().register()
+
+    def execute(self):
+        if not (session and session.state == STATE_ACTIVE):
+            return
+
+        start = utils.current_milli_time()
+        while self._queue \
+                and utils.current_milli_time() - start < self._budget:
+            node_id = self._queue.popleft()
+            shared_data.session.pending_join.discard(node_id)
+            node_ref = session.repository.graph.get(node_id)
+            if node_ref and node_ref.state == FETCHED:
+                apply_node(node_id)
+
+        shared_data.session.join_progress = (
+            self._total - len(self._queue), self._total)
+        refresh_3d_view()
+
+        if not self._queue:
+            logging.info(f"Progressive join done, {self._total} nodes streamed")
+            self.unregister()
+
+    def unregister(self):
+        shared_data.session.pending_join.clear()
+        shared_data.session.join_progress = None
+        super().unregister()
+
+
+class LazyLoadTimer(Timer):
+    """ Load the nodes standing as placeholders once one of their objects
+        is visible in the active view layer or selected
+    """
+
+    def __init__(self, timeout=0.5):
+        self._users = {}
+        self._graph_revision = -1
+        super().__init__(timeout)
+
+    def execute(self):
+        lazy_nodes = shared_data.session.lazy_nodes
+        if not (session and session.state == STATE_ACTIVE) or not lazy_nodes:
+            return
+
+        # The users index only changes with the graph topology
+        revision = session.repository.graph_revision
+        if revision != self._graph_revision:
+            self._users = get_users_index(session.repository)
+            self._graph_revision = revision
+
+        for node_id in list(lazy_nodes):
+            node_ref = session.repository.graph.get(node_id)
+            if node_ref is None or node_ref.state != FETCHED:
+                # Removed or already applied as a dependency
+                lazy_nodes.discard(node_id)
+                continue
+
+            for obj in get_user_objects(node_id, self._users):
+                try:
+                    needed = obj.visible_get() or obj.select_get()
+                except (ReferenceError, RuntimeError):
+                    continue
+                if needed:
+                    logging.debug(f"Loading lazy node {node_id}")
+                    lazy_nodes.discard(node_id)
+                    apply_node(node_id)
+                    break
+
+    def unregister(self):
+        shared_data.session.lazy_nodes.clear()
+        super().unregister()
+
+
+class SceneSwitchTimer(Timer):
+    """ Switch the windows to a scene once its nodes are fetched
+
+        :param scene_uuid: uuid of the scene node
+        :type scene_uuid: str
+        :param limit: time waiting for the scene (s)
+        :type limit: float
+    """
+
+    def __init__(self, scene_uuid, timeout=0.2, limit=60):
+        self._scene_uuid = scene_uuid
+        self._limit = limit
+        self._start = utils.current_milli_time()
+        super().__init__(timeout)
+
+    def register(self):
+        shared_data.session.pending_scenes.add(self._scene_uuid)
+        super().register()
+
+    def execute(self):
+        if not (session and session.state == STATE_ACTIVE):
+            return
+
+        node_ref = session.repository.graph.get(self._scene_uuid)
+        if node_ref and node_ref.state == UP and isinstance(node_ref.instance, bpy.types.Scene):
+            bpy.context.window_manager.windows[0].scene = node_ref.instance
+            logging.info(f"Switched to fetched scene {node_ref.instance.name}")
+            self.unregister()
+        elif utils.current_milli_time() - self._start > self._limit * 1000:
+            logging.warning(f"Scene {self._scene_uuid} not received, switch cancelled")
+            self.unregister()
+
+    def unregister(self):
+        shared_data.session.pending_scenes.discard(self._scene_uuid)
+        super().unregister()
 
 
 class AnnotationUpdates(Timer):
@@ -351,6 +550,16 @@ class ClientUpdate(Timer):
                     local_user_metadata['mode_current'] = bpy.context.mode
                     porcelain.update_user_metadata(session.repository, local_user_metadata)
 
+                # Update the scenes the server filters the updates with
+                if local_user_metadata and session.state == STATE_ACTIVE:
+                    subscribed = subscriptions.get_subscribed_scenes() \
+                        if subscriptions.is_enabled() else None
+                    if subscribed != local_user_metadata.get(subscriptions.SUBSCRIPTION_KEY):
+                        local_user_metadata[subscriptions.SUBSCRIPTION_KEY] = subscribed
+                        porcelain.update_user_metadata(session.repository, {
+                            subscriptions.SUBSCRIPTION_KEY: subscribed
+                        })
+
 
 class SessionStatusUpdate(Timer):
     def __init__(self, timeout=1):
@@ -36,6 +36,8 @@ from replication.constants import (
 )
 from replication.interface import session
 from .timers import timers_registry
+from . import recorder
+from .diagnostics import draw_metrics
 from . import icons
 
 ICONS_PROP_STATES = [
@@ -400,6 +402,9 @@ class SESSION_PT_advanced_settings(bpy.types.Panel):
             cache_section_row.label(text="Clear memory filecache:")
             cache_section_row.prop(settings, "clear_memory_filecache", text="")
             cache_section_row = cache_section.row()
+            cache_section_row.label(text="Cache session nodes:")
+            cache_section_row.prop(settings, "use_node_cache", text="")
+            cache_section_row = cache_section.row()
             cache_section_row.operator('wm.session_cache_clear', text=f"Clear cache ({get_folder_size(settings.cache_directory)})")
 
         # ADVANCED LOG
@@ -680,6 +685,11 @@ class SESSION_PT_repository(bpy.types.Panel):
                 row.alert = True
                 row.operator('wm.session_stop_autosave', icon="CANCEL")
                 row.alert = False
+            if recorder.recorder:
+                row = layout.row()
+                row.alert = True
+                row.operator('wm.session_stop_record', icon="REC")
+                row.alert = False
 
             box = layout.box()
             row = box.row()
@@ -708,6 +718,27 @@ class SESSION_PT_repository(bpy.types.Panel):
                 layout.row().label(text="Empty")
 
 
+class SESSION_PT_metrics(bpy.types.Panel):
+    bl_idname = "MULTIUSER_METRICS_PT_panel"
+    bl_label = "Metrics"
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_parent_id = 'MULTIUSER_SETTINGS_PT_panel'
+    bl_options = {'DEFAULT_CLOSED'}
+
+    @classmethod
+    def poll(cls, context):
+        return session and session.state == STATE_ACTIVE
+
+    def draw_header(self, context):
+        self.layout.label(text="", icon='GRAPH')
+
+    def draw(self, context):
+        layout = self.layout
+        draw_metrics(layout)
+        layout.operator('multiuser.export_metrics', icon='EXPORT')
+
+
 class VIEW3D_PT_overlay_session(bpy.types.Panel):
     bl_space_type = 'VIEW_3D'
     bl_region_type = 'HEADER'
@@ -786,6 +817,7 @@ classes = (
     SESSION_PT_user,
     SESSION_PT_sync,
     SESSION_PT_repository,
+    SESSION_PT_metrics,
     VIEW3D_PT_overlay_session,
 )
 
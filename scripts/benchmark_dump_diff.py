@@ -0,0 +1,89 @@
+"""Benchmark the structural differ against DeepDiff on synthetic dumps.
+
+Usage (from the repository root):
+    python scripts/benchmark_dump_diff.py --objects 5000 --runs 5
+"""
+
+import argparse
+import copy
+import random
+import sys
+import time
+from pathlib import Path
+from uuid import uuid4
+
+import numpy as np
+from deepdiff import DeepDiff, Delta
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from multi_user.bl_types.dump_diff import compute_delta  # noqa: E402
+
+
+def scene_like_dump(objects: int, buffer_size: int) -> dict:
+    return {
+        'uuid': str(uuid4()),
+        'type_id': 'Scene',
+        'name': 'Scene',
+        'frame_start': 1,
+        'frame_end': 250,
+        'collection': {
+            'objects': [str(uuid4()) for _ in range(objects)],
+            'children': [str(uuid4()) for _ in range(objects // 10)],
+        },
+        'timeline_markers': [{'name': f"m{i}", 'frame': i} for i in range(50)],
+        'render': {'resolution_x': 1920, 'resolution_y': 1080},
+        'buffer': np.random.rand(buffer_size).astype(np.float32).tobytes(),
+    }
+
+
+def mutate(dump: dict, changes: int) -> dict:
+    current = copy.deepcopy(dump)  # keeps bytes identity like Node.patch
+    objects = current['collection']['objects']
+    for _ in range(changes):
+        objects[random.randrange(len(objects))] = str(uuid4())
+    random.shuffle(objects)
+    current['frame_end'] += 1
+    return current
+
+
+def bench(name: str, func, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    print(f"{name:<12} best {best * 1000:9.2f} ms  "
+          f"mean {sum(timings) / runs * 1000:9.2f} ms")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--objects', type=int, default=2000)
+    parser.add_argument('--changes', type=int, default=10)
+    parser.add_argument('--buffer', type=int, default=1_000_000,
+                        help="float count of the synthetic buffer")
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    last = scene_like_dump(args.objects, args.buffer)
+    current = mutate(last, args.changes)
+
+    structural = compute_delta(last, current, ignore_order=True)
+    assert not DeepDiff(current, last + structural, ignore_order=True)
+    print(f"objects={args.objects} changes={args.changes} "
+          f"buffer={args.buffer * 4 / 1e6:.1f}MB "
+          f"delta={len(structural.dumps())} bytes")
+
+    reference = bench('deepdiff', lambda: Delta(DeepDiff(
+        last, current, cache_size=5000,
+        ignore_order=True, report_repetition=True)), args.runs)
+    merkle = bench('structural', lambda: compute_delta(
+        last, current, ignore_order=True), args.runs)
+    print(f"speedup x{reference / merkle:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Replay a recorded multi-user session in a headless Blender.
+
+Record the traffic from a live session with File > Export > Multi-user
+session traffic recording, then:
+
+Usage (from the repository root):
+    blender -b --python scripts/replay_session.py -- recording.murec [--realtime] [--report report.json]
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import bpy  # noqa: F401
+import addon_utils
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+def main():
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else sys.argv[1:]
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('recording', help="session recording (.murec)")
+    parser.add_argument('--realtime', action='store_true',
+                        help="keep the recorded pace instead of replaying as fast as possible")
+    parser.add_argument('--report', help="write the replay statistics and metrics to a json file")
+    args = parser.parse_args(argv)
+
+    # Preferences and datablock uuid properties are needed by the loaders
+    addon_utils.enable('multi_user', default_set=True)
+
+    from multi_user import recorder
+    from multi_user.metrics import metrics
+
+    metrics.clear()
+    stats = recorder.replay(args.recording, realtime=args.realtime)
+
+    print(f"Base: {stats['base_nodes']} nodes in {stats['base_seconds']:.2f}s")
+    print(f"Updates: {stats['updates']} applied in {stats['apply_seconds']:.2f}s "
+          f"(total {stats['total_seconds']:.2f}s)")
+    for type_id, entry in sorted(metrics.as_dict()['types'].items()):
+        load = entry['timings_ms'].get('load')
+        if load:
+            print(f"  {type_id:<16} load p50 {load['p50']:8.2f} ms  p99 {load['p99']:8.2f} ms"
+                  f"  ({load['samples']} loads)")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({'replay': stats, 'metrics': metrics.as_dict()}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+Synthetic multi-client load generator for a local Multi-User server
+
+Starts a local server, then for each client count N spawns N simulated
+clients (one process each, authenticated like a Blender client) pushing
+node updates at a fixed rate. Every update is fanned out by the server to
+the other clients, which timestamp its reception.
+
+Updates are either synthetic nodes of a given size, or the node/commit
+stream of a session recording (File > Export > Multi-user recording),
+replayed by every client on its own copy of the recorded nodes.
+
+Reported per client count:
+    - server CPU usage and resident memory (peak)
+    - fan-out latency percentiles (push -> reception by another client)
+    - pushed / delivered updates per second and delivered bandwidth
+
+Usage:
+    python load_test.py --clients 1,5,10,30 --rate 20 --size 4096
+    python load_test.py --clients 2,8 --recording session.murec
+    python load_test.py --clients 10 --server persistent_server_v2.py --json results.json
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import multiprocessing
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+
+# Prefer an installed replication library: the clients heartbeat script
+# can't be run from inside the wheel
+try:
+    import replication  # noqa: F401
+except ImportError:
+    replication_wheel = Path(__file__).parent.parent / "multi_user" / "wheels" / "replication-0.9.10-py3-none-any.whl"
+    sys.path.insert(0, str(replication_wheel))
+
+import zmq  # noqa: E402
+from replication import porcelain  # noqa: E402
+from replication.constants import STATE_AUTH, STATE_INITIAL  # noqa: E402
+from replication.interface import Session  # noqa: E402
+from replication.objects import Auth, Node  # noqa: E402
+from replication.repository import Repository  # noqa: E402
+
+# Session recordings format, see multi_user/recorder.py
+RECORDING_MAGIC = b'MUREC1\n'
+RECORDING_BASE = 'base'
+
+PERCENTILES = (50, 90, 99)
+SAMPLING_INTERVAL = 0.25
+CLIENT_READY_TIMEOUT = 30
+
+
+def read_recording(filepath):
+    """ Load the base nodes and the update stream of a session recording
+
+        The raw chunks are returned untouched, they are only re-keyed per
+        simulated client before being pushed.
+    """
+    base, updates = [], []
+    with gzip.open(filepath, 'rb') as f:
+        if f.read(len(RECORDING_MAGIC)) != RECORDING_MAGIC:
+            raise ValueError(f"{filepath} is not a session recording")
+        while True:
+            try:
+                _, kind, payload = pickle.load(f)
+            except EOFError:
+                break
+            if kind == RECORDING_BASE:
+                base.extend(payload)
+            else:
+                updates.append(payload)
+    return base, updates
+
+
+def digest(chunks):
+    hasher = hashlib.blake2b(digest_size=16)
+    for chunk in chunks:
+        hasher.update(chunk)
+    return hasher.digest()
+
+
+def rekey(chunks, client):
+    """ Give a recorded node or commit a uuid owned by a simulated client
+
+        Node and commit chunks both carry the node uuid in second position.
+    """
+    node_id = uuid.uuid5(uuid.NAMESPACE_OID, f"{client}-{chunks[1].decode()}")
+    return [chunks[0], str(node_id).encode(), *chunks[2:]]
+
+
+class SimulatedClient():
+    """ Authenticated session pushing raw updates on the data channel
+
+        :param name: username of the simulated client
+        :type name: str
+        :param port: local server port
+        :type port: int
+    """
+
+    def __init__(self, name, port):
+        self.name = name
+        self.repository = Repository(username=name)
+        porcelain.remote_add(self.repository, 'origin', '127.0.0.1', port)
+        self.session = Session()
+        self.remote = self.repository.remote
+        self.sent = []      # (digest, time)
+        self.received = []  # (digest, time, size)
+
+    def connect(self, timeout):
+        self.session.connect(repository=self.repository, timeout=timeout)
+        deadline = time.monotonic() + timeout / 1000
+        while self.session.state == STATE_AUTH:
+            if time.monotonic() > deadline:
+                raise ConnectionError(f"{self.name}: authentication timeout")
+            self.poll(100)
+        if self.session.state == STATE_INITIAL:
+            raise ConnectionError(f"{self.name}: authentication refused")
+
+    def push(self, chunks, measured=True):
+        self.remote.data.send_multipart(chunks)
+        if measured:
+            self.sent.append((digest(chunks), time.perf_counter()))
+
+    def poll(self, timeout=0, measured=True):
+        """ Read the incoming frames
+
+            Commands are only handled for the authentication, updates are
+            timestamped and dropped: the simulated clients don't apply them.
+        """
+        sockets = dict(self.remote.poller.poll(timeout))
+        while self.remote.command in sockets:
+            _, command = self.repository.fetch(self.remote.command)
+            if isinstance(command, Auth):
+                self.session.handle_authentification(command)
+            sockets = dict(self.remote.poller.poll(0))
+
+        while self.remote.data in sockets:
+            frame = self.remote.data.recv_multipart()
+            if measured:
+                self.received.append((digest(frame), time.perf_counter(),
+                                      sum(len(c) for c in frame)))
+            sockets = dict(self.remote.poller.poll(0))
+
+    def disconnect(self):
+        self.session.disconnect(reason='load test done')
+
+
+def synthetic_updates(client, nodes, size):
+    """ Endless stream of full node updates of `size` bytes, spread over
+        `nodes` nodes owned by the client
+    """
+    node_ids = [str(uuid.uuid4()) for _ in range(nodes)]
+    sequence = 0
+    while True:
+        node = Node(owner=client,
+                    uuid=node_ids[sequence % nodes],
+                    data={'type_id': 'LoadTest',
+                          'sequence': sequence,
+                          'payload': os.urandom(size)},
+                    dependencies=[])
+        yield node.as_raw_chunks()
+        sequence += 1
+
+
+def recorded_updates(client, recording):
+    base, updates = read_recording(recording)
+    base = [rekey(chunks, client) for chunks in base]
+    updates = [rekey(chunks, client) for chunks in updates]
+    return base, updates
+
+
+def client_process(index, args, ready, start, results):
+    """ Simulated client entry point
+    """
+    name = f"load_{index}"
+    client = SimulatedClient(name, args.port)
+    try:
+        client.connect(args.timeout)
+
+        if args.recording:
+            base, updates = recorded_updates(name, args.recording)
+            # The server must know the nodes before receiving their commits
+            for chunks in base:
+                client.push(chunks, measured=False)
+            stream = iter(updates)
+        else:
+            stream = synthetic_updates(name, args.nodes, args.size)
+
+        ready.put(index)
+        start.wait()
+
+        interval = 1 / args.rate if args.rate > 0 else 0
+        next_push = time.perf_counter()
+        end = next_push + args.duration
+        while time.perf_counter() < end:
+            now = time.perf_counter()
+            if now >= next_push:
+                chunks = next(stream, None)
+                if chunks is None:
+                    break
+                client.push(chunks)
+                next_push += interval
+            client.poll(max(0, int((next_push - time.perf_counter()) * 1000)))
+
+        # Wait for the in-flight updates
+        drain_end = time.perf_counter() + args.drain
+        while time.perf_counter() < drain_end:
+            client.poll(50)
+    except Exception as e:
+        results.put((index, {'error': str(e)}))
+    else:
+        results.put((index, {
+            'sent': client.sent,
+            'received': client.received,
+        }))
+    finally:
+        client.disconnect()
+
+
+def process_stats(pid):
+    """ Cumulated CPU seconds and resident memory (bytes) of a process
+    """
+    try:
+        import psutil
+    except ImportError:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        ticks = os.sysconf('SC_CLK_TCK')
+        cpu = (int(fields[11]) + int(fields[12])) / ticks
+        rss = int(fields[21]) * os.sysconf('SC_PAGE_SIZE')
+        return cpu, rss
+    process = psutil.Process(pid)
+    cpu_times = process.cpu_times()
+    return cpu_times.user + cpu_times.system, process.memory_info().rss
+
+
+def percentiles(values):
+    if not values:
+        return [0.0] * len(PERCENTILES)
+    values = sorted(values)
+    return [values[min(len(values) - 1, int(len(values) * p / 100))] for p in PERCENTILES]
+
+
+def match_deliveries(client_results):
+    """ Match every reception with its push
+
+        Updates of a sender reach a receiver in order, so the k-th reception
+        of a digest matches its k-th push. Receptions of updates pushed
+        before the round (recording base) match none and are left out.
+
+        :return: (fan-out latencies in ms, bytes of the matched receptions)
+    """
+    pushes = defaultdict(list)
+    for result in client_results:
+        for key, sent in result['sent']:
+            pushes[key].append(sent)
+
+    latencies = []
+    delivered_bytes = 0
+    for result in client_results:
+        occurrences = defaultdict(int)
+        for key, received, size in result['received']:
+            sent_times = pushes.get(key)
+            if not sent_times:
+                continue
+            occurrence = occurrences[key]
+            occurrences[key] += 1
+            if occurrence < len(sent_times):
+                latencies.append((received - sent_times[occurrence]) * 1000)
+                delivered_bytes += size
+    return latencies, delivered_bytes
+
+
+def start_server(args, log_file):
+    server = subprocess.Popen([
+        sys.executable,
+        str(Path(__file__).parent / args.server),
+        '-p', str(args.port),
+        '-t', str(args.timeout),
+        '-l', 'WARNING',
+        '-lf', log_file],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL)
+
+    # Wait for the command port
+    context = zmq.Context.instance()
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited, see {log_file}")
+        probe = context.socket(zmq.REQ)
+        probe.linger = 0
+        try:
+            probe.bind(f"tcp://127.0.0.1:{args.port}")
+        except zmq.ZMQError:
+            return server
+        finally:
+            probe.close()
+        time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("Server didn't start")
+
+
+def run_round(args, clients):
+    log_file = os.path.join(tempfile.gettempdir(), f"load_test_server_{clients}.log")
+    server = start_server(args, log_file)
+
+    context = multiprocessing.get_context('spawn')
+    ready, results = context.Queue(), context.Queue()
+    start = context.Event()
+    processes = [context.Process(target=client_process,
+                                 args=(index, args, ready, start, results))
+                 for index in range(clients)]
+    for process in processes:
+        process.start()
+
+    try:
+        for _ in range(clients):
+            ready.get(timeout=CLIENT_READY_TIMEOUT)
+
+        cpu_start, rss_peak = process_stats(server.pid)
+        wall_start = time.perf_counter()
+        start.set()
+
+        while time.perf_counter() - wall_start < args.duration:
+            time.sleep(SAMPLING_INTERVAL)
+            _, rss = process_stats(server.pid)
+            rss_peak = max(rss_peak, rss)
+
+        cpu_end, _ = process_stats(server.pid)
+        load_duration = time.perf_counter() - wall_start
+
+        client_results = []
+        for _ in range(clients):
+            index, result = results.get(timeout=args.duration + args.drain + CLIENT_READY_TIMEOUT)
+            if 'error' in result:
+                print(f"  client {index} failed: {result['error']}")
+                continue
+            client_results.append(result)
+    finally:
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.kill()
+        server.kill()
+        server.wait()
+
+    latencies, bytes_received = match_deliveries(client_results)
+    pushed = sum(len(r['sent']) for r in client_results)
+    delivered = len(latencies)
+    expected = pushed * (clients - 1)
+
+    return {
+        'clients': clients,
+        'pushed': pushed,
+        'delivered': delivered,
+        'delivery_ratio': delivered / expected if expected else 1.0,
+        'push_rate': pushed / load_duration,
+        'delivery_rate': delivered / load_duration,
+        'delivered_mb_s': bytes_received / load_duration / 1e6,
+        'server_cpu_percent': (cpu_end - cpu_start) / load_duration * 100,
+        'server_rss_mb': rss_peak / 1e6,
+        **{f"latency_p{p}_ms": v for p, v in zip(PERCENTILES, percentiles(latencies))},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-User server load generator")
+    parser.add_argument('--clients', default='1,5,10',
+                        help="comma separated client counts, one round each")
+    parser.add_argument('-p', '--port', type=int, default=5570,
+                        help="local server port (uses port to port+2)")
+    parser.add_argument('--server', default='standalone_server.py',
+                        help="server script, relative to this folder")
+    parser.add_argument('--rate', type=float, default=10,
+                        help="updates per second and per client (0: as fast as possible)")
+    parser.add_argument('--size', type=int, default=1024,
+                        help="synthetic update payload size in bytes")
+    parser.add_argument('--nodes', type=int, default=10,
+                        help="synthetic nodes updated by each client")
+    parser.add_argument('--recording',
+                        help="replay a session recording (.murec) instead of synthetic updates")
+    parser.add_argument('--duration', type=float, default=10,
+                        help="load duration of a round in seconds")
+    parser.add_argument('--drain', type=float, default=2,
+                        help="time waiting for in-flight updates after a round")
+    parser.add_argument('-t', '--timeout', type=int, default=5000,
+                        help="connection timeout in milliseconds")
+    parser.add_argument('--json', help="write the results to a json file")
+    args = parser.parse_args()
+
+    rounds = []
+    print(f"{'clients':>8}{'push/s':>10}{'deliv/s':>10}{'MB/s':>8}{'ratio':>7}"
+          f"{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'cpu %':>8}{'rss MB':>8}")
+    for clients in [int(c) for c in args.clients.split(',')]:
+        result = run_round(args, clients)
+        rounds.append(result)
+        print(f"{clients:>8}{result['push_rate']:>10.1f}{result['delivery_rate']:>10.1f}"
+              f"{result['delivered_mb_s']:>8.2f}{result['delivery_ratio']:>7.2f}"
+              f"{result['latency_p50_ms']:>9.2f}{result['latency_p90_ms']:>9.2f}"
+              f"{result['latency_p99_ms']:>9.2f}{result['server_cpu_percent']:>8.1f}"
+              f"{result['server_rss_mb']:>8.1f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'arguments': vars(args), 'rounds': rounds}, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\nLoad test cancelled.")
+        sys.exit(1)
@@ -11,7 +11,14 @@ This version uses a more robust approach:
 Features:
 - Saves session data every 2 minutes
 - Saves on user disconnect
-- Automatically restores latest session on startup
+- Automatically restores latest session on startup, node data being read
+  from the memory-mapped snapshot when first needed
+- Announces node hashes so clients only download nodes missing from their cache
+- Only forwards to subscribed clients the updates of the scenes they have open
+- Serves Prometheus metrics on http://METRICS_HOST:METRICS_PORT/metrics
+- Relays the chat channel and serves its history by pages
+- Keeps the canonical task board, merging the task changes field by field
+- Keeps the latest mesh previews and sends them to joining clients first
 """
 
 import sys
@@ -21,10 +28,19 @@ import json
 import time
 import signal
 import threading
+import gzip
+import hashlib
+import mmap
+import struct
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 from datetime import datetime
 import logging
 
+import zmq
+from replication.objects import Command, Node, UpdateUserMetadata
+
 # Setup logging
 logging.basicConfig(
     format="%(asctime)s SERVER %(levelname)-8s %(message)s",
@@ -36,10 +52,16 @@ logging.basicConfig(
 DATA_DIR = Path(os.getenv('DATA_DIR', '/app/data'))
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-SNAPSHOT_FILE = DATA_DIR / 'session_snapshot.pkl'
+SNAPSHOT_FILE = DATA_DIR / 'session_snapshot.bin'
+# Whole pickle written by the previous versions, restored when no indexed
+# snapshot exists yet
+LEGACY_SNAPSHOT_FILE = DATA_DIR / 'session_snapshot.pkl'
 METADATA_FILE = DATA_DIR / 'session_metadata.json'
 BACKUP_DIR = DATA_DIR / 'backups'
 BACKUP_DIR.mkdir(exist_ok=True)
+# Backups are manifests of node hashes, node payloads are stored once in
+# BACKUP_OBJECTS_DIR/<2 first digest chars>/<digest>.node
+BACKUP_OBJECTS_DIR = BACKUP_DIR / 'objects'
 
 # Save interval in seconds (2 minutes)
 SAVE_INTERVAL = int(os.getenv('SAVE_INTERVAL', 120))
@@ -47,11 +69,810 @@ SAVE_INTERVAL = int(os.getenv('SAVE_INTERVAL', 120))
 # Keep last N backups
 MAX_BACKUPS = int(os.getenv('MAX_BACKUPS', 10))
 
+# Chat messages kept for the history
+CHAT_HISTORY = int(os.getenv('CHAT_HISTORY', 1000))
+
+# Metrics endpoint, disabled with METRICS_PORT=0
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9560))
+# The graph size is measured again at most every GRAPH_BYTES_INTERVAL seconds
+GRAPH_BYTES_INTERVAL = 30
+
 # Global reference to server instance
 _server_instance = None
 _shutdown_flag = False
 
 
+# Node hashes, keyed by uuid: (data, owner, dependencies the hash was
+# computed from, digest). Right and Delete change the owner and dependencies
+# in place, so the data alone doesn't identify the hashed chunks.
+_node_digests = {}
+
+
+def node_digest(chunks):
+    """Hash node chunks, must match multi_user.node_cache.node_digest"""
+    digest = hashlib.blake2b(digest_size=16)
+    for chunk in chunks[1:]:
+        digest.update(len(chunk).to_bytes(8, 'little'))
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def digest_key(node):
+    """What a node hash depends on, without loading a lazy node"""
+    return data_ref(node), node.owner, tuple(node.dependencies or ())
+
+
+def cached_digest(uuid, node):
+    """Memoized hash of a node, None when its data, owner or dependencies
+    changed since it was computed"""
+    cached = _node_digests.get(uuid)
+    if cached is None:
+        return None
+    data, owner, dependencies = digest_key(node)
+    if cached[0] is data and cached[1] == owner and cached[2] == dependencies:
+        return cached[3]
+    return None
+
+
+def remember_digest(uuid, node, chunks):
+    """Hash the node chunks and memoize the result"""
+    digest = node_digest(chunks)
+    _node_digests[uuid] = digest_key(node) + (digest,)
+    return digest
+
+
+def catalog_digests(repository):
+    """Compute the hash of every node, reusing the ones whose chunks didn't change"""
+    digests = {}
+    for uuid, node in repository.object_store.items():
+        digest = cached_digest(uuid, node)
+        if digest is None:
+            try:
+                digest = remember_digest(uuid, node, node.as_raw_chunks())
+            except Exception as e:
+                logging.debug(f"Can't hash node {uuid}: {e}")
+                continue
+        digests[str(uuid)] = digest
+
+    for uuid in set(_node_digests) - set(repository.object_store.keys()):
+        del _node_digests[uuid]
+
+    return digests
+
+
+# Indexed snapshot: SNAPSHOT_MAGIC, the pickled data of every node back to
+# back, the pickled header, then the header offset (SNAPSHOT_FOOTER). The
+# header holds the session infos and, for each node, where its data is, its
+# owner, dependencies, state, hash, type and name. Restoring only reads the
+# header: node data is unpickled from the memory-mapped file when first used.
+SNAPSHOT_MAGIC = b'MUSNAP1\n'
+SNAPSHOT_FOOTER = struct.Struct('<Q')
+
+
+class SnapshotFile:
+    """Memory-mapped indexed snapshot
+
+    The mapping stays valid once the file is replaced by a newer snapshot,
+    it is closed when the last node reading from it is gone.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.mapping[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not an indexed snapshot")
+        footer = len(self.mapping) - SNAPSHOT_FOOTER.size
+        header_offset, = SNAPSHOT_FOOTER.unpack_from(self.mapping, footer)
+        self.header = pickle.loads(self.mapping[header_offset:footer])
+
+    def read(self, offset, length):
+        return self.mapping[offset:offset + length]
+
+
+class LazyNode(Node):
+    """Restored node, its data is unpickled from the snapshot on first access
+
+    The serialized data is sent as is to the clients, so a node is only
+    loaded once an update patches it.
+    """
+    __slots__ = ['_payload', 'type_id', 'name']
+
+    def __init__(self, uuid, owner, dependencies, state, payload, type_id=None, name=None):
+        self.uuid = uuid
+        self.owner = owner
+        self.dependencies = dependencies
+        self.state = state
+        self.instance = None
+        self.last_commit = None
+        self.sender = None
+        self._payload = payload  # (SnapshotFile, offset, length), None once loaded
+        self.type_id = type_id
+        self.name = name
+
+    @property
+    def data(self):
+        payload = self._payload
+        if payload is not None:
+            snapshot, offset, length = payload
+            Node.data.__set__(self, pickle.loads(snapshot.read(offset, length)))
+            self._payload = None
+        return Node.data.__get__(self)
+
+    @data.setter
+    def data(self, value):
+        self._payload = None
+        Node.data.__set__(self, value)
+
+    def _serialize(self):
+        payload = self._payload
+        if payload is None:
+            return super()._serialize()
+        snapshot, offset, length = payload
+        return [pickle.dumps(self.type_num, protocol=4),
+                self.uuid.encode(),
+                self.owner.encode(),
+                pickle.dumps(self.dependencies, protocol=4),
+                snapshot.read(offset, length)]
+
+
+def data_ref(node):
+    """Object identifying the node data, without loading a lazy node"""
+    payload = getattr(node, '_payload', None)
+    return payload if payload is not None else node.data
+
+
+def node_summary(node):
+    """Type and name of a node, without loading a lazy node"""
+    if getattr(node, '_payload', None) is not None:
+        return node.type_id, node.name
+    data = node.data if isinstance(node.data, dict) else {}
+    return data.get('type_id'), data.get('name')
+
+
+def write_indexed_snapshot(path, graph, infos):
+    """Write the graph as an indexed snapshot, through a temporary file
+
+    :param infos: session infos stored in the header (timestamp, reason...)
+    """
+    nodes = {}
+    temporary = path.with_suffix(path.suffix + '.tmp')
+    with open(temporary, 'wb') as f:
+        f.write(SNAPSHOT_MAGIC)
+        offset = len(SNAPSHOT_MAGIC)
+        for uuid, node in graph.items():
+            chunks = node.as_raw_chunks()
+            digest = cached_digest(uuid, node) or remember_digest(uuid, node, chunks)
+            type_id, name = node_summary(node)
+            data = chunks[4]
+            f.write(data)
+            nodes[uuid] = (offset, len(data), node.owner, node.dependencies,
+                           node.state, digest, type_id, name)
+            offset += len(data)
+
+        f.write(pickle.dumps(dict(infos, nodes=nodes), protocol=4))
+        f.write(SNAPSHOT_FOOTER.pack(offset))
+    os.replace(temporary, path)
+
+
+def read_indexed_snapshot(path):
+    """Open an indexed snapshot, the node data stays on disk until needed"""
+    from replication.repository import GraphObjectStore
+
+    snapshot = SnapshotFile(path)
+    infos = dict(snapshot.header)
+    graph = GraphObjectStore()
+    for uuid, entry in infos.pop('nodes').items():
+        offset, length, owner, dependencies, state, digest, type_id, name = entry
+        payload = (snapshot, offset, length)
+        graph[uuid] = LazyNode(uuid, owner, dependencies, state, payload, type_id, name)
+        _node_digests[uuid] = (payload, owner, tuple(dependencies or ()), digest)
+
+    return dict(infos, graph=graph)
+
+
+# Interest management: clients announcing the scenes they have open (user
+# metadata SUBSCRIPTION_KEY) only receive the updates of the nodes used by
+# those scenes. New nodes are always broadcast so everyone knows the whole
+# session structure.
+SCENE_TYPE_ID = 'Scene'
+SUBSCRIPTION_KEY = 'subscribed_scenes'
+
+
+def dependency_closure(repository, roots):
+    """Nodes reachable from the given roots through their dependencies"""
+    closure = set()
+    stack = list(roots)
+    while stack:
+        uuid = stack.pop()
+        if uuid in closure:
+            continue
+        node = repository.graph.get(uuid)
+        if node is None:
+            continue
+        closure.add(uuid)
+        if node.dependencies:
+            stack.extend(node.dependencies)
+    return closure
+
+
+def dependency_order(repository, uuids):
+    """Sort nodes so that dependencies come first"""
+    ordered = []
+    visited = set()
+    for root in uuids:
+        stack = [(root, False)]
+        while stack:
+            uuid, expanded = stack.pop()
+            if expanded:
+                ordered.append(uuid)
+                continue
+            if uuid in visited or uuid not in uuids:
+                continue
+            visited.add(uuid)
+            stack.append((uuid, True))
+            node = repository.graph.get(uuid)
+            if node and node.dependencies:
+                stack.extend((dep, False) for dep in node.dependencies)
+    return ordered
+
+
+class SceneIndex:
+    """Dependency closure of every scene, rebuilt after a graph change"""
+
+    def __init__(self, repository):
+        self.repository = repository
+        self.closures = {}  # scene uuid: closure
+        self.names = {}  # scene uuid: name
+        self.shared = set()  # nodes used by no scene
+        self._dirty = True
+        self._size = -1
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._dirty = True
+
+    def _refresh(self):
+        graph = self.repository.graph
+        if not self._dirty and len(graph) == self._size:
+            return
+
+        self.closures = {}
+        self.names = {}
+        for uuid, node in list(graph.items()):
+            type_id, name = node_summary(node)
+            if type_id == SCENE_TYPE_ID:
+                self.closures[uuid] = dependency_closure(self.repository, [uuid])
+                self.names[uuid] = name or uuid
+        used = set().union(*self.closures.values())
+        self.shared = set(graph.keys()) - used
+        self._dirty = False
+        self._size = len(graph)
+
+    def interest(self, scenes):
+        """Nodes needed by a client having the given scenes open"""
+        with self._lock:
+            self._refresh()
+            nodes = set(self.shared)
+            for scene in scenes:
+                nodes |= self.closures.get(scene, set())
+            return nodes
+
+    def find_scene(self, name):
+        with self._lock:
+            self._refresh()
+            for uuid, scene_name in self.names.items():
+                if scene_name == name:
+                    return uuid
+            return next(iter(sorted(self.names, key=self.names.get)), None)
+
+    def scene_names(self):
+        with self._lock:
+            self._refresh()
+            return dict(self.names)
+
+
+class ClientInterest:
+    """Scenes subscribed by a client, the nodes they need and the nodes the
+    client holds up to date"""
+
+    def __init__(self, scenes, nodes, known=None):
+        self.scenes = list(scenes)
+        self.nodes = nodes
+        self.known = set(nodes if known is None else known)
+
+
+_scene_index = None
+_interests = {}  # client uid: ClientInterest
+_requested_scenes = {}  # client uid: scene name asked for the join
+
+
+def get_scene_index(repository):
+    global _scene_index
+
+    if _scene_index is None or _scene_index.repository is not repository:
+        _scene_index = SceneIndex(repository)
+    return _scene_index
+
+
+def push_missing_nodes(service, client_uid, interest, nodes):
+    """Send a client the given nodes it doesn't hold, return the sent ones"""
+    repository = service._repository
+    missing = nodes - interest.known
+    for uuid in dependency_order(repository, missing):
+        node = repository.graph.get(uuid)
+        if node:
+            send_chunks(service._data, client_uid, node.as_raw_chunks())
+    interest.known |= missing
+    if missing:
+        logging.debug(f"Subscription: sent {len(missing)} nodes to {client_uid}")
+    return missing
+
+
+def sync_subscriptions(service):
+    """Follow the scenes announced by the clients in their metadata"""
+    index = get_scene_index(service._repository)
+
+    for client_uid in list(_interests):
+        if client_uid not in service.clients:
+            del _interests[client_uid]
+
+    for client_uid, client_data in list(service.clients.items()):
+        scenes = client_data.get('metadata', {}).get(SUBSCRIPTION_KEY)
+        interest = _interests.get(client_uid)
+        if scenes is None:
+            if interest:
+                # Back to the whole session
+                push_missing_nodes(service, client_uid, interest,
+                                   set(service._repository.graph.keys()))
+                del _interests[client_uid]
+            continue
+        if interest is None:
+            # Subscribing without a filtered join: the client holds everything
+            _interests[client_uid] = ClientInterest(scenes, index.interest(scenes),
+                                                    known=service._repository.graph.keys())
+        elif list(scenes) != interest.scenes:
+            interest.scenes = list(scenes)
+            interest.nodes = index.interest(scenes)
+            push_missing_nodes(service, client_uid, interest, interest.nodes)
+
+
+class ServerMetrics:
+    """Traffic counters of the data channel and persistence timings"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.service = None  # ServerData running the fan-out
+        self.messages_in = 0
+        self.bytes_in = 0
+        self.messages_out = {}  # client uid: count
+        self.bytes_out = {}  # client uid: bytes
+        self.snapshot_seconds = 0.0
+        self.capture_seconds = 0.0
+        self.snapshot_timestamp = 0.0
+        self.snapshots = 0
+        self.restore_seconds = 0.0
+        self._node_sizes = {}  # uuid: (data the size was computed from, size)
+        self._graph_bytes = (0.0, 0)  # (measure time, total)
+
+    def received(self, size):
+        with self.lock:
+            self.messages_in += 1
+            self.bytes_in += size
+
+    def sent(self, client_uid, size):
+        with self.lock:
+            self.messages_out[client_uid] = self.messages_out.get(client_uid, 0) + 1
+            self.bytes_out[client_uid] = self.bytes_out.get(client_uid, 0) + size
+
+    def graph_bytes(self, repository):
+        """Serialized size of the nodes, only re-measuring the changed ones
+
+        The nodes are measured between two updates: the data loop commits
+        them and Delete edits their dependencies in place. The total is
+        cached for GRAPH_BYTES_INTERVAL to keep the data loop pauses rare.
+        """
+        measured_at, total = self._graph_bytes
+        if time.monotonic() - measured_at < GRAPH_BYTES_INTERVAL:
+            return total
+
+        total = 0
+        sizes = {}
+        with _graph_lock:
+            for uuid, node in list(repository.graph.items()):
+                cached = self._node_sizes.get(uuid)
+                if cached and cached[0] is data_ref(node):
+                    size = cached[1]
+                else:
+                    try:
+                        size = sum(len(chunk) for chunk in node.as_raw_chunks())
+                    except Exception:
+                        continue
+                sizes[uuid] = (data_ref(node), size)
+                total += size
+        self._node_sizes = sizes
+        self._graph_bytes = (time.monotonic(), total)
+        return total
+
+
+server_metrics = ServerMetrics()
+
+
+# Channels: client messages sent as an UpdateUserMetadata holding a
+# CHANNEL_PREFIX + name key (see multi_user/channels.py). They are handled
+# here instead of being stored in the sender metadata, which every client
+# state update carries.
+CHANNEL_PREFIX = 'channel:'
+CHAT_CHANNEL = CHANNEL_PREFIX + 'chat'
+TASK_CHANNEL = CHANNEL_PREFIX + 'tasks'
+PREVIEW_CHANNEL = CHANNEL_PREFIX + 'previews'
+MAX_HISTORY_PAGE = 200
+
+
+class ChatLog:
+    """Latest chat messages, numbered in their arrival order"""
+
+    def __init__(self, messages=None):
+        self.messages = deque(messages or [], maxlen=CHAT_HISTORY)
+        self.next_index = self.messages[-1]['index'] + 1 if self.messages else 0
+
+    def post(self, message):
+        message = dict(message, index=self.next_index)
+        self.next_index += 1
+        self.messages.append(message)
+        return message
+
+    def page(self, before=None, limit=50):
+        """Messages preceding the given index, oldest first, and whether
+        older ones remain"""
+        older = [m for m in self.messages if before is None or m['index'] < before]
+        page = older[-limit:] if limit > 0 else []
+        return page, len(older) > len(page)
+
+
+chat_log = ChatLog()
+
+
+class TaskBoard:
+    """Canonical tasks. Each field carries the (clock, writer) version of
+    its last write, the highest version wins"""
+
+    def __init__(self, tasks=None):
+        self.tasks = tasks or {}  # id: {'fields': {...}, 'versions': {...}}
+        self._lock = threading.Lock()
+
+    def merge(self, change):
+        """Merge a task change, return the part of it that was kept and the
+        current values of the fields it wrote over with older versions"""
+        applied = {'id': change['id'], 'fields': {}, 'versions': {}}
+        stale = {'id': change['id'], 'fields': {}, 'versions': {}}
+        with self._lock:
+            task = self.tasks.setdefault(change['id'], {'fields': {}, 'versions': {}})
+            for name, value in change['fields'].items():
+                version = tuple(change['versions'][name])
+                current = task['versions'].get(name, (0, ''))
+                if version > current:
+                    task['fields'][name] = value
+                    task['versions'][name] = version
+                    target = applied
+                elif version < current:
+                    value, version = task['fields'][name], current
+                    target = stale
+                else:
+                    continue
+                target['fields'][name] = value
+                target['versions'][name] = version
+        return applied, stale
+
+    def changes(self):
+        """Every task not deleted, as changes"""
+        with self._lock:
+            return [{'id': task_id, 'fields': dict(task['fields']), 'versions': dict(task['versions'])}
+                    for task_id, task in self.tasks.items()
+                    if not task['fields'].get('deleted')]
+
+    def copy(self):
+        with self._lock:
+            return {task_id: {'fields': dict(task['fields']), 'versions': dict(task['versions'])}
+                    for task_id, task in self.tasks.items()}
+
+
+task_board = TaskBoard()
+
+
+def send_channel(service, client_uid, owner, key, payload):
+    """Send a channel message to a client, on behalf of the owner user"""
+    message = UpdateUserMetadata(owner=owner, data={key: payload})
+    service._command.send(client_uid, zmq.SNDMORE)
+    service._repository.push(service._command, message)
+
+
+def handle_chat(service, client_uid, payload):
+    user = service.clients.get(client_uid)
+    if user is None:
+        return
+
+    op = payload.get('op')
+    if op == 'post':
+        message = chat_log.post(payload['message'])
+        for other_uid in list(service.clients):
+            if other_uid != client_uid:
+                send_channel(service, other_uid, user['id'], CHAT_CHANNEL,
+                             {'op': 'post', 'message': message})
+    elif op == 'history':
+        limit = min(int(payload.get('limit', 50)), MAX_HISTORY_PAGE)
+        messages, more = chat_log.page(payload.get('before'), limit)
+        send_channel(service, client_uid, user['id'], CHAT_CHANNEL,
+                     {'op': 'page', 'messages': messages, 'more': more})
+
+
+def handle_tasks(service, client_uid, payload):
+    user = service.clients.get(client_uid)
+    if user is None:
+        return
+
+    op = payload.get('op')
+    if op == 'put':
+        applied, stale = [], []
+        for change in payload.get('changes', []):
+            kept, lost = task_board.merge(change)
+            if kept['fields']:
+                applied.append(kept)
+            if lost['fields']:
+                stale.append(lost)
+        if applied:
+            for other_uid in list(service.clients):
+                if other_uid != client_uid:
+                    send_channel(service, other_uid, user['id'], TASK_CHANNEL,
+                                 {'op': 'put', 'changes': applied})
+        if stale:
+            # Concurrent writes won over the sender ones
+            send_channel(service, client_uid, user['id'], TASK_CHANNEL,
+                         {'op': 'put', 'changes': stale})
+    elif op == 'sync':
+        send_channel(service, client_uid, user['id'], TASK_CHANNEL,
+                     {'op': 'state', 'changes': task_board.changes()})
+
+
+# Latest mesh preview of each node, sent to the joining clients ahead of the
+# nodes. Not saved with the session: the next geometry commits refresh them.
+mesh_previews = {}  # node uuid: preview
+
+
+def client_previews(service, client_uid):
+    """Previews of the nodes a client holds or is about to receive"""
+    object_store = service._repository.object_store
+    interest = _interests.get(client_uid)
+    for uuid in [uuid for uuid in mesh_previews if uuid not in object_store]:
+        mesh_previews.pop(uuid, None)
+    return {uuid: preview for uuid, preview in list(mesh_previews.items())
+            if interest is None or uuid in interest.nodes}
+
+
+def handle_previews(service, client_uid, payload):
+    user = service.clients.get(client_uid)
+    if user is None:
+        return
+
+    op = payload.get('op')
+    if op == 'put':
+        previews = payload.get('previews', {})
+        mesh_previews.update(previews)
+        for other_uid in list(service.clients):
+            if other_uid == client_uid:
+                continue
+            interest = _interests.get(other_uid)
+            relayed = {uuid: preview for uuid, preview in previews.items()
+                       if interest is None or uuid in interest.nodes}
+            if relayed:
+                send_channel(service, other_uid, user['id'], PREVIEW_CHANNEL,
+                             {'op': 'put', 'previews': relayed})
+    elif op == 'sync':
+        send_channel(service, client_uid, user['id'], PREVIEW_CHANNEL,
+                     {'op': 'state', 'previews': client_previews(service, client_uid)})
+
+
+channel_handlers = {
+    CHAT_CHANNEL: handle_chat,
+    TASK_CHANNEL: handle_tasks,
+    PREVIEW_CHANNEL: handle_previews,
+}
+
+
+def handle_channels(service, client_uid, command):
+    """Handle the channel messages of a command, True when nothing else
+    remains in it"""
+    if not isinstance(command, UpdateUserMetadata) or not isinstance(command.data, dict):
+        return False
+
+    for key in [key for key in command.data if key in channel_handlers]:
+        payload = command.data.pop(key)
+        if payload is None:
+            # Metadata clearing for the servers relaying the channels
+            continue
+        try:
+            channel_handlers[key](service, client_uid, payload)
+        except Exception as e:
+            logging.error(f"Failed to handle {key} message: {e}")
+    return not command.data
+
+
+def channel_states():
+    """Channel data saved with the session"""
+    return {'chat': list(chat_log.messages), 'tasks': task_board.copy()}
+
+
+def restore_channels(states):
+    global chat_log, task_board
+
+    chat_log = ChatLog((states or {}).get('chat'))
+    task_board = TaskBoard((states or {}).get('tasks'))
+
+
+def send_chunks(socket, client_uid, chunks):
+    """Route serialized chunks to a client of the data channel"""
+    socket.send(client_uid, zmq.SNDMORE)
+    socket.send_multipart(chunks)
+    server_metrics.sent(client_uid, sum(len(chunk) for chunk in chunks))
+
+
+def render_metrics():
+    """Metrics in the Prometheus text exposition format"""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ','.join(f'{k}="{v}"' for k, v in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+    service = server_metrics.service
+    clients = dict(service.clients) if service else {}
+    repository = service._repository if service else None
+
+    def client_name(client_uid):
+        client = clients.get(client_uid)
+        return client['id'] if client else None
+
+    metric('multiuser_connected_clients', 'gauge', "Connected clients",
+           [({}, len(clients))])
+
+    types = {}
+    if repository is not None:
+        for node in list(repository.graph.values()):
+            # The restored nodes still on disk stay there
+            type_id = node_summary(node)[0] or 'unknown'
+            types[type_id] = types.get(type_id, 0) + 1
+    metric('multiuser_nodes', 'gauge', "Nodes of the session graph by type",
+           [({'type': type_id}, count) for type_id, count in sorted(types.items())])
+    metric('multiuser_graph_bytes', 'gauge',
+           "Serialized size of the graph nodes, estimates the graph memory",
+           [({}, server_metrics.graph_bytes(repository) if repository is not None else 0)])
+
+    with server_metrics.lock:
+        # Forget the clients gone since the last scrape
+        for client_uid in set(server_metrics.messages_out) - set(clients):
+            server_metrics.messages_out.pop(client_uid, None)
+            server_metrics.bytes_out.pop(client_uid, None)
+        messages_out = dict(server_metrics.messages_out)
+        bytes_out = dict(server_metrics.bytes_out)
+        messages_in = server_metrics.messages_in
+        bytes_in = server_metrics.bytes_in
+
+    metric('multiuser_client_latency_milliseconds', 'gauge',
+           "Heartbeat round trip of each client. Proxy of its pending send queue, "
+           "which ZeroMQ doesn't expose: it grows as the client falls behind",
+           [({'client': client['id']}, client.get('latency', 0)) for client in clients.values()])
+    metric('multiuser_received_messages_total', 'counter', "Updates received on the data channel",
+           [({}, messages_in)])
+    metric('multiuser_received_bytes_total', 'counter', "Bytes received on the data channel",
+           [({}, bytes_in)])
+    metric('multiuser_sent_messages_total', 'counter', "Updates sent to each client",
+           [({'client': client_name(uid)}, count) for uid, count in messages_out.items()
+            if client_name(uid)])
+    metric('multiuser_sent_bytes_total', 'counter', "Bytes sent to each client",
+           [({'client': client_name(uid)}, count) for uid, count in bytes_out.items()
+            if client_name(uid)])
+    metric('multiuser_snapshots_total', 'counter', "Session snapshots written to disk",
+           [({}, server_metrics.snapshots)])
+    metric('multiuser_snapshot_duration_seconds', 'gauge', "Duration of the last snapshot",
+           [({}, server_metrics.snapshot_seconds)])
+    metric('multiuser_snapshot_capture_seconds', 'gauge',
+           "Time the fan-out was paused to capture the last snapshot",
+           [({}, server_metrics.capture_seconds)])
+    metric('multiuser_snapshot_timestamp_seconds', 'gauge', "Time of the last snapshot",
+           [({}, server_metrics.snapshot_timestamp)])
+    metric('multiuser_restore_duration_seconds', 'gauge', "Duration of the session restore",
+           [({}, server_metrics.restore_seconds)])
+
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        try:
+            body = render_metrics().encode()
+        except Exception as e:
+            logging.error(f"Failed to render metrics: {e}")
+            self.send_error(500)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(f"Metrics request: {format % args}")
+
+
+def start_metrics_server():
+    """Serve the metrics from a background thread"""
+    if not METRICS_PORT:
+        return None
+    try:
+        httpd = ThreadingHTTPServer((METRICS_HOST, METRICS_PORT), MetricsHandler)
+    except OSError as e:
+        logging.error(f"Failed to start the metrics endpoint: {e}")
+        return None
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True, name="metrics").start()
+    logging.info(f"✓ Metrics served on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    return httpd
+
+
+# Held by the data loop while it commits an update, snapshots capture the
+# graph between two updates
+_graph_lock = threading.Lock()
+# Serializes the saves (auto-save, disconnects, shutdown)
+_save_lock = threading.Lock()
+
+
+def copy_dependencies(node):
+    dependencies = node.dependencies
+    return list(dependencies) if dependencies is not None else None
+
+
+def capture_graph(repository):
+    """Point-in-time copy of the graph, the fan-out is only paused while
+    the node references are collected
+
+    Updates replace the node data instead of mutating it, so the copy can
+    share it with the live graph. Dependency lists are copied: Delete
+    removes entries from them in place, from the command thread. The
+    restored nodes still on disk are copied without loading them.
+    """
+    from replication.repository import GraphObjectStore
+
+    with _graph_lock:
+        entries = [(uuid, node, node.owner, copy_dependencies(node), data_ref(node), node.state)
+                   for uuid, node in list(repository.graph.items())]
+
+    graph = GraphObjectStore()
+    for uuid, node, owner, dependencies, data, state in entries:
+        if isinstance(node, LazyNode) and isinstance(data, tuple):
+            # Still on disk, the copy reads the same snapshot payload
+            graph[uuid] = LazyNode(uuid, owner, dependencies, state, data,
+                                   node.type_id, node.name)
+            continue
+        graph[uuid] = Node(owner=owner, uuid=uuid, data=data,
+                           dependencies=dependencies, state=state)
+    return graph
+
+
+def write_atomic(path, payload):
+    """Write a file through a temporary one so readers never see it partial"""
+    temporary = path.with_suffix(path.suffix + '.tmp')
+    with open(temporary, 'wb') as f:
+        f.write(payload)
+    os.replace(temporary, path)
+
+
 def save_session(reason="periodic"):
     """Save current session state to disk"""
     global _server_instance
@@ -79,47 +900,11 @@ def save_session(reason="periodic"):
             return
 
         # Check if repository is initialized
-        is_initialized = hasattr(repository, 'state') and repository.state == STATE_ACTIVE
-
-        # Create snapshot data
-        snapshot_data = {
-            'timestamp': time.time(),
-            'datetime': datetime.now().isoformat(),
-            'reason': reason,
-            'initialized': is_initialized,
-            'graph': repository.graph if hasattr(repository, 'graph') else {},
-            'metadata': getattr(repository, 'metadata', {}),
-        }
-
-        # Save to main snapshot file
-        with open(SNAPSHOT_FILE, 'wb') as f:
-            pickle.dump(snapshot_data, f)
-
-        # Save metadata as JSON for inspection
-        metadata = {
-            'timestamp': snapshot_data['timestamp'],
-            'datetime': snapshot_data['datetime'],
-            'reason': reason,
-            'initialized': is_initialized,
-            'node_count': len(snapshot_data['graph'].nodes) if hasattr(snapshot_data.get('graph'), 'nodes') else 0,
-        }
-
-        with open(METADATA_FILE, 'w') as f:
-            json.dump(metadata, f, indent=2)
-
-        # Create timestamped backup
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_file = BACKUP_DIR / f'snapshot_{timestamp}.pkl'
-
-        with open(backup_file, 'wb') as f:
-            pickle.dump(snapshot_data, f)
-
-        # Clean old backups
-        cleanup_old_backups()
-
-        logging.info(f"✓ Session saved to disk (reason: {reason})")
-        logging.debug(f"  Snapshot: {SNAPSHOT_FILE}")
-        logging.debug(f"  Backup: {backup_file}")
+        is_initialized = (getattr(_server_instance, '_state', None) == STATE_ACTIVE
+                          or getattr(repository, 'state', None) == STATE_ACTIVE)
+
+        with _save_lock:
+            _write_snapshot(repository, reason, is_initialized)
 
     except Exception as e:
         logging.error(f"Failed to save session: {e}")
@@ -127,15 +912,69 @@ def save_session(reason="periodic"):
         logging.debug(traceback.format_exc())
 
 
+def _write_snapshot(repository, reason, is_initialized):
+    """Capture the graph, then serialize and write it off the fan-out path"""
+    start = time.perf_counter()
+    graph = capture_graph(repository)
+    capture_seconds = time.perf_counter() - start
+
+    # Create snapshot data
+    snapshot_data = {
+        'timestamp': time.time(),
+        'datetime': datetime.now().isoformat(),
+        'reason': reason,
+        'initialized': is_initialized,
+        'metadata': getattr(repository, 'metadata', {}),
+        'channels': channel_states(),
+    }
+
+    # Save to main snapshot file
+    write_indexed_snapshot(SNAPSHOT_FILE, graph, snapshot_data)
+
+    # Save metadata as JSON for inspection
+    metadata = {
+        'timestamp': snapshot_data['timestamp'],
+        'datetime': snapshot_data['datetime'],
+        'reason': reason,
+        'initialized': is_initialized,
+        'node_count': len(graph),
+    }
+
+    with open(METADATA_FILE, 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+    # Create timestamped backup
+    backup_file, written = write_backup(graph, snapshot_data)
+
+    # Clean old backups
+    cleanup_old_backups()
+
+    server_metrics.snapshot_seconds = time.perf_counter() - start
+    server_metrics.capture_seconds = capture_seconds
+    server_metrics.snapshot_timestamp = time.time()
+    server_metrics.snapshots += 1
+
+    logging.info(f"✓ Session saved to disk (reason: {reason}, "
+                 f"{server_metrics.snapshot_seconds:.2f}s, "
+                 f"fan-out paused {capture_seconds * 1000:.1f}ms)")
+    logging.debug(f"  Snapshot: {SNAPSHOT_FILE}")
+    logging.debug(f"  Backup: {backup_file} ({written}/{len(graph)} nodes written)")
+
+
 def restore_session():
-    """Restore session from latest snapshot"""
-    if not SNAPSHOT_FILE.exists():
+    """Restore session from latest snapshot, only reading its index"""
+    if not SNAPSHOT_FILE.exists() and not LEGACY_SNAPSHOT_FILE.exists():
         logging.info("No existing session to restore")
         return None
 
     try:
-        with open(SNAPSHOT_FILE, 'rb') as f:
-            snapshot_data = pickle.load(f)
+        start = time.perf_counter()
+        if SNAPSHOT_FILE.exists():
+            snapshot_data = read_indexed_snapshot(SNAPSHOT_FILE)
+        else:
+            with open(LEGACY_SNAPSHOT_FILE, 'rb') as f:
+                snapshot_data = pickle.load(f)
+        server_metrics.restore_seconds = time.perf_counter() - start
 
         was_initialized = snapshot_data.get('initialized', False)
 
@@ -143,6 +982,8 @@ def restore_session():
         logging.info(f"  Timestamp: {snapshot_data['datetime']}")
         logging.info(f"  Reason: {snapshot_data['reason']}")
         logging.info(f"  Initialized: {was_initialized}")
+        logging.info(f"  Nodes: {len(snapshot_data['graph'])} "
+                     f"(index read in {server_metrics.restore_seconds:.2f}s)")
 
         return snapshot_data
 
@@ -151,9 +992,91 @@ def restore_session():
         return None
 
 
+def backup_object_path(digest):
+    return BACKUP_OBJECTS_DIR / digest[:2] / f'{digest}.node'
+
+
+def write_backup(graph, snapshot_data):
+    """Write a backup manifest, storing only the node payloads not stored yet
+
+    Returns the manifest path and the number of payloads written.
+    """
+    nodes = {}
+    written = 0
+    for uuid, node in graph.items():
+        chunks = None
+        digest = cached_digest(uuid, node)
+        if digest is None:
+            chunks = node.as_raw_chunks()
+            digest = remember_digest(uuid, node, chunks)
+        path = backup_object_path(digest)
+        if not path.exists():
+            chunks = chunks or node.as_raw_chunks()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            write_atomic(path, pickle.dumps(chunks, protocol=4))
+            written += 1
+        nodes[uuid] = digest
+
+    manifest = {
+        'timestamp': snapshot_data['timestamp'],
+        'datetime': snapshot_data['datetime'],
+        'reason': snapshot_data['reason'],
+        'initialized': snapshot_data['initialized'],
+        'metadata': snapshot_data['metadata'],
+        'channels': snapshot_data['channels'],
+        'states': {uuid: node.state for uuid, node in graph.items()},
+        'nodes': nodes,
+    }
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    manifest_file = BACKUP_DIR / f'manifest_{timestamp}.pkl.gz'
+    write_atomic(manifest_file, gzip.compress(pickle.dumps(manifest, protocol=4), 3))
+    return manifest_file, written
+
+
+def read_manifest(path):
+    with open(path, 'rb') as f:
+        return pickle.loads(gzip.decompress(f.read()))
+
+
+def load_backup(path):
+    """Rebuild the snapshot data of a backup manifest"""
+    from replication.objects import ReplicationObject
+    from replication.repository import GraphObjectStore
+
+    manifest = read_manifest(path)
+    graph = GraphObjectStore()
+    for uuid, digest in manifest['nodes'].items():
+        with open(backup_object_path(digest), 'rb') as f:
+            node = ReplicationObject.from_raw_chunks(pickle.load(f))
+        node.state = manifest['states'].get(uuid, node.state)
+        graph[uuid] = node
+
+    return {
+        'timestamp': manifest['timestamp'],
+        'datetime': manifest['datetime'],
+        'reason': manifest['reason'],
+        'initialized': manifest['initialized'],
+        'graph': graph,
+        'metadata': manifest['metadata'],
+        'channels': manifest.get('channels'),
+    }
+
+
+def restore_backup(name):
+    """Make a backup the snapshot restored on the next start"""
+    path = Path(name) if Path(name).exists() else BACKUP_DIR / name
+    snapshot_data = load_backup(path)
+    graph = snapshot_data.pop('graph')
+    write_indexed_snapshot(SNAPSHOT_FILE, graph, snapshot_data)
+    logging.info(f"✓ {path.name} ({len(graph)} nodes) "
+                 "will be restored on the next start")
+
+
 def cleanup_old_backups():
-    """Remove old backup files, keeping only the latest MAX_BACKUPS"""
+    """Remove old backups, keeping only the latest MAX_BACKUPS, then the
+    node payloads no backup references anymore"""
     try:
+        # Full pickles written by the previous versions
         backups = sorted(BACKUP_DIR.glob('snapshot_*.pkl'))
 
         if len(backups) > MAX_BACKUPS:
@@ -161,6 +1084,25 @@ def cleanup_old_backups():
                 old_backup.unlink()
                 logging.debug(f"Removed old backup: {old_backup.name}")
 
+        manifests = sorted(BACKUP_DIR.glob('manifest_*.pkl.gz'))
+        if len(manifests) <= MAX_BACKUPS:
+            return
+
+        for old_manifest in manifests[:-MAX_BACKUPS]:
+            old_manifest.unlink()
+            logging.debug(f"Removed old backup: {old_manifest.name}")
+
+        referenced = set()
+        for manifest in manifests[-MAX_BACKUPS:]:
+            referenced.update(read_manifest(manifest)['nodes'].values())
+
+        collected = 0
+        for path in BACKUP_OBJECTS_DIR.glob('*/*.node'):
+            if path.stem not in referenced:
+                path.unlink()
+                collected += 1
+        logging.debug(f"Collected {collected} unreferenced node payloads")
+
     except Exception as e:
         logging.error(f"Failed to cleanup old backups: {e}")
 
@@ -200,9 +1142,9 @@ def apply_persistence_hooks():
     # Get the replication server module
     from replication import server as replication_server
 
-    # Find the server class
-    server_class = None
-    for attr_name in dir(replication_server):
+    # Find the server class, the service owning the session repository
+    server_class = getattr(replication_server, 'ServerNetService', None)
+    for attr_name in [] if server_class else dir(replication_server):
         attr = getattr(replication_server, attr_name)
         if isinstance(attr, type) and 'Server' in attr_name:
             server_class = attr
@@ -215,6 +1157,7 @@ def apply_persistence_hooks():
     # Store original methods
     original_init = server_class.__init__
     original_on_user_disconnect = getattr(server_class, 'on_user_disconnect', None)
+    original_login_client = getattr(server_class, '_login_client', None)
 
     def new_init(self, *args, **kwargs):
         """Wrapped init to capture server instance and restore session"""
@@ -229,22 +1172,39 @@ def apply_persistence_hooks():
 
         # Try to restore previous session
         snapshot = restore_session()
-        if snapshot and hasattr(self, 'repository'):
+        repository = getattr(self, '_repository', getattr(self, 'repository', None))
+
+        # Channel messages are handled before the command dispatch, an
+        # empty command is left to it once they are taken out
+        if repository:
+            original_fetch = repository.fetch
+
+            def fetch(socket):
+                identity, command = original_fetch(socket)
+                if socket is getattr(self, '_command', None) \
+                        and handle_channels(self, identity, command):
+                    command = Command(owner=command.owner)
+                return identity, command
+            repository.fetch = fetch
+        if snapshot and repository:
             try:
                 # Restore graph
                 if 'graph' in snapshot and snapshot['graph']:
-                    self.repository.graph = snapshot['graph']
+                    repository.object_store = snapshot['graph']
                     logging.info("✓ Repository graph restored")
 
                 # Restore metadata
                 if 'metadata' in snapshot and snapshot['metadata']:
-                    self.repository.metadata = snapshot['metadata']
+                    repository.metadata = snapshot['metadata']
                     logging.info("✓ Repository metadata restored")
 
-                # Auto-initialize if was previously initialized
+                restore_channels(snapshot.get('channels'))
+
+                # Auto-initialize if was previously initialized, the
+                # service only leaves its waiting state on the first login
                 was_initialized = snapshot.get('initialized', False)
-                if was_initialized and hasattr(self.repository, 'state'):
-                    self.repository.state = STATE_ACTIVE
+                if was_initialized and snapshot.get('graph'):
+                    self._restored_active = True
                     logging.info(f"✓ Repository automatically initialized to ACTIVE state")
                     logging.info("  Users can connect immediately without re-initialization")
 
@@ -266,10 +1226,136 @@ def apply_persistence_hooks():
 
         return result
 
+    def new_login_client(self, *args, **kwargs):
+        """Skip the repository initialization of a restored session"""
+        if getattr(self, '_restored_active', False):
+            self._restored_active = False
+            self._state = STATE_ACTIVE
+        return original_login_client(self, *args, **kwargs)
+
+    def new_send_client_snapshot_init(self, client):
+        """Send the nodes catalog along with the node hashes"""
+        import zmq
+        from replication.objects import Snapshot
+
+        catalog = [str(k) for k in self._repository.object_store.keys()]
+        index = get_scene_index(self._repository)
+
+        # Subscribed join: only the requested scene closure is sent
+        scene_name = _requested_scenes.pop(client, None)
+        if scene_name is not None:
+            scene = index.find_scene(scene_name)
+            if scene:
+                nodes = index.interest([scene])
+                catalog = [uuid for uuid in catalog if uuid in nodes]
+                _interests[client] = ClientInterest([scene], nodes)
+                logging.info(f"{self.clients[client]['id']} - Snapshot : subscribed to "
+                             f"{index.names[scene]} ({len(catalog)} nodes)")
+
+        # The mesh previews go first, to stand for the meshes until they
+        # are received and loaded
+        previews = client_previews(self, client)
+        if previews:
+            send_channel(self, client, self.clients[client]['id'], PREVIEW_CHANNEL,
+                         {'op': 'state', 'previews': previews})
+
+        snapshot_state = Snapshot(
+            owner='server',
+            data={
+                'STATE': 'INIT',
+                'CATALOG': catalog,
+                'HASHES': catalog_digests(self._repository),
+                'SCENES': index.scene_names()})
+        logging.info(f"{self.clients[client]['id']} - Snapshot : Pushing nodes catalog with hashes")
+        self._command.send(client, zmq.SNDMORE)
+        self._repository.push(self._command, snapshot_state)
+
+    original_handle_client_snapshot = replication_server.ServerNetService.handle_client_snapshot
+
+    def new_handle_client_snapshot(self, command):
+        """Remember the scene a subscribed client asks for"""
+        if command.data.get('STATE') == 'REQUEST_INIT' and command.data.get('SCENE') is not None:
+            _requested_scenes[command.sender] = command.data['SCENE']
+        return original_handle_client_snapshot(self, command)
+
+    def new_data_run(self):
+        """ServerData loop filtering the fan-out by client subscriptions"""
+        import zmq
+        from replication.objects import ReplicationObject
+
+        poller = zmq.Poller()
+        poller.register(self._data, zmq.POLLIN)
+        repository = self._repository
+        server_metrics.service = self
+
+        while not self._exit_event.is_set():
+            socks = dict(poller.poll(1))
+            sync_subscriptions(self)
+
+            if self._data not in socks:
+                continue
+
+            try:
+                frame = self._data.recv_multipart()
+                identity = frame.pop(0)
+                server_metrics.received(sum(len(chunk) for chunk in frame))
+                update = ReplicationObject.from_raw_chunks(frame)
+                node_id = getattr(update, 'uuid', getattr(update, 'node_id', None))
+                with _graph_lock:
+                    previous = repository.graph.get(node_id)
+                    is_new = previous is None
+                    dependencies = list(previous.dependencies or []) if previous else None
+                    repository.do_commit(update)
+            except Exception as e:
+                logging.error(f"Corrupted data frame received, skipping it. Cause:{e}")
+                import traceback
+                traceback.print_exc()
+                continue
+
+            node = repository.graph.get(node_id)
+            index = get_scene_index(repository)
+            graph_changed = is_new or (node and list(node.dependencies or []) != dependencies)
+            if graph_changed:
+                index.invalidate()
+
+            sender_interest = _interests.get(identity)
+            if sender_interest:
+                sender_interest.known.add(node_id)
+
+            for client_uid in list(self.clients):
+                if client_uid == identity:
+                    continue
+                interest = _interests.get(client_uid)
+                if interest is None or is_new:
+                    send_chunks(self._data, client_uid, frame)
+                    if interest:
+                        interest.known.add(node_id)
+                    continue
+
+                if graph_changed:
+                    # Newly used nodes, the updated one included, are sent whole
+                    interest.nodes = index.interest(interest.scenes)
+                    if node_id in push_missing_nodes(self, client_uid, interest, interest.nodes):
+                        continue
+                if node_id in interest.nodes:
+                    send_chunks(self._data, client_uid, frame)
+                else:
+                    # Outdated until the client subscribes to it again
+                    interest.known.discard(node_id)
+
     # Apply hooks
     server_class.__init__ = new_init
+    net_service = getattr(replication_server, 'ServerNetService', server_class)
+    if hasattr(net_service, 'send_client_snapshot_init'):
+        net_service.send_client_snapshot_init = new_send_client_snapshot_init
+    else:
+        logging.warning("Snapshot hook unavailable, clients will download every node")
+    replication_server.ServerNetService.handle_client_snapshot = new_handle_client_snapshot
+    replication_server.ServerData.run = new_data_run
     if original_on_user_disconnect:
         server_class.on_user_disconnect = new_on_user_disconnect
+    if original_login_client:
+        server_class._login_client = new_login_client
 
     logging.info("✓ Persistence hooks applied")
     return True
@@ -277,6 +1363,10 @@ def apply_persistence_hooks():
 
 def main():
     """Main entry point"""
+    if len(sys.argv) == 3 and sys.argv[1] == '--restore-backup':
+        restore_backup(sys.argv[2])
+        return
+
     print("=" * 70)
     print("Multi-User Blender Server with Persistent Storage v2")
     print("=" * 70)
@@ -284,6 +1374,8 @@ def main():
     print(f"📁 Data Directory: {DATA_DIR}")
     print(f"⏱️  Auto-save Interval: {SAVE_INTERVAL} seconds")
     print(f"💾 Max Backups: {MAX_BACKUPS}")
+    if METRICS_PORT:
+        print(f"📈 Metrics: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
     print()
 
     # Setup signal handlers
@@ -317,6 +1409,8 @@ def main():
         logging.error(f"Failed to apply persistence hooks: {e}")
         logging.warning("Server will run without persistence")
 
+    start_metrics_server()
+
     # Start auto-save thread
     auto_save_thread = threading.Thread(target=auto_save_loop, daemon=True)
     auto_save_thread.start()
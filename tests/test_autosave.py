@@ -0,0 +1,81 @@
+import pickle
+import zlib
+
+from replication.objects import Node
+
+from multi_user.autosave import MAGIC, RECORD_HEADER, IncrementalSave, read_journal
+from multi_user.session_file import SessionFile
+
+
+class FakeRepository():
+    def __init__(self, nodes):
+        self.graph = {node.uuid: node for node in nodes}
+
+
+def load_names(filepath):
+    with SessionFile(filepath) as save:
+        return {uuid: Node.from_raw_chunks(save.read(uuid)).data['name']
+                for uuid in save.nodes}
+
+
+def test_incremental_save(tmp_path):
+    cube = Node(owner='COMMON', uuid='cube', data={'type_id': 'Mesh', 'name': 'Cube'})
+    light = Node(owner='COMMON', uuid='light', data={'type_id': 'Light', 'name': 'Sun'})
+    repository = FakeRepository([cube, light])
+
+    autosave = IncrementalSave(str(tmp_path / 'session.db'), compact_every=2)
+    assert autosave.save(repository) == 2
+    assert autosave.save(repository) == 0  # Nothing changed
+
+    cube.data = {'type_id': 'Mesh', 'name': 'Cube.001'}
+    assert autosave.save(repository) == 1  # Second record, compacted
+
+    del repository.graph['light']
+    autosave.save(repository)
+    autosave.close(wait=True)
+
+    saves = sorted(tmp_path.glob('session_*.db'))
+    assert saves and not autosave.journal_path.exists()
+    assert load_names(saves[-1]) == {'cube': 'Cube.001'}
+
+
+def test_incremental_save_dependencies(tmp_path):
+    mesh = Node(owner='COMMON', uuid='mesh', data={'type_id': 'Mesh', 'name': 'Cube'})
+    cube = Node(owner='COMMON', uuid='cube', data={'type_id': 'Object', 'name': 'Cube'},
+                dependencies=['mesh'])
+    repository = FakeRepository([mesh, cube])
+
+    autosave = IncrementalSave(str(tmp_path / 'session.db'))
+    assert autosave.save(repository) == 2
+
+    # Deleting a node edits the dependencies of its users in place
+    del repository.graph['mesh']
+    cube.dependencies.remove('mesh')
+    assert autosave.save(repository) == 1
+    autosave.close(wait=True)
+
+    saves = sorted(tmp_path.glob('session_*.db'))
+    with SessionFile(saves[-1]) as save:
+        assert list(save.nodes) == ['cube']
+        assert Node.from_raw_chunks(save.read('cube')).dependencies == []
+
+
+def test_journal_recovery(tmp_path):
+    cube = Node(owner='COMMON', uuid='cube', data={'type_id': 'Mesh', 'name': 'Cube'})
+
+    # Journal left by an interrupted session, ending with a partial record
+    records = [{'base': None},
+               {'nodes': [(cube.as_raw_chunks(), 'Mesh', 'Cube')], 'removed': [], 'users': {}}]
+    with open(tmp_path / 'session.db.journal', 'wb') as f:
+        f.write(MAGIC)
+        for record in records:
+            payload = zlib.compress(pickle.dumps(record))
+            f.write(RECORD_HEADER.pack(len(payload)) + payload)
+        f.write(RECORD_HEADER.pack(100) + b'partial')
+    assert len(list(read_journal(tmp_path / 'session.db.journal'))) == 2
+
+    IncrementalSave(str(tmp_path / 'session.db')).close(wait=True)
+
+    saves = list(tmp_path.glob('session_*.db'))
+    assert len(saves) == 1
+    assert load_names(saves[0]) == {'cube': 'Cube'}
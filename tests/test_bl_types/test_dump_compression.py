@@ -0,0 +1,52 @@
+import os
+
+import pytest
+from deepdiff import DeepDiff
+import bpy
+import numpy as np
+from multi_user.bl_types import get_data_translation_protocol
+from multi_user.bl_types.dump_compression import (compress_dump,
+                                                  decompress_dump,
+                                                  is_compressed)
+
+
+def test_dump_compression_roundtrip():
+    co = np.linspace(0, 1, 30000, dtype=np.float32).tobytes()
+    data = {'vertices': {'co': co}, 'small': b'abc', 'items': [{'buf': co}]}
+
+    raw, packed, _ = compress_dump(data, threshold=1024)
+
+    assert raw == 2 * len(co) and packed < raw
+    assert is_compressed(data['vertices']['co'])
+    assert data['small'] == b'abc'
+    assert decompress_dump(data) == {'vertices': {'co': co},
+                                     'small': b'abc',
+                                     'items': [{'buf': co}]}
+
+    # Already compressed buffers (reused geometry) are left as they are
+    packed_co = data['vertices']['co']
+    assert compress_dump(data, threshold=1024) == (0, 0, 0.0)
+    assert data['vertices']['co'] is packed_co
+
+
+def test_mesh_compressed_load(clear_blend, register_uuid):
+    bpy.ops.mesh.primitive_uv_sphere_add(segments=256, ring_count=128)
+    datablock = bpy.data.meshes[0]
+    protocol = get_data_translation_protocol()
+
+    expected = protocol.dump(datablock, stamp_uuid='sphere')
+    assert not protocol.compression_ratios()
+    protocol.compute_delta(None, expected)
+    raw, _, ratio, _ = protocol.compression_ratios()['Mesh']
+    assert ratio < 1.0
+
+    # Unchanged dumps are skipped before being compressed
+    assert not protocol.compute_delta(expected, protocol.dump(datablock, stamp_uuid='sphere')).diff
+    assert protocol.compression_ratios()['Mesh'][0] == raw
+    bpy.data.meshes.remove(datablock)
+
+    test = protocol.construct(expected)
+    protocol.load(expected, test)
+    result = protocol.dump(test, stamp_uuid='sphere')
+
+    assert not DeepDiff(decompress_dump(expected), result)
@@ -0,0 +1,117 @@
+import os
+
+import pytest
+from deepdiff import DeepDiff, Delta
+import bpy
+import random
+import numpy as np
+from multi_user.bl_types.bl_collection import BlCollection
+from replication.objects import Commit
+
+from multi_user.bl_types import dump_diff
+from multi_user.bl_types.dump_diff import compute_delta, fingerprint, pop_old_values
+
+
+def test_dump_diff_roundtrip():
+    buffer = np.arange(4096, dtype=np.float32)
+    last = {
+        'uuid': 'dump_diff_roundtrip',
+        'objects': [f"obj_{i}" for i in range(200)],
+        'settings': {'frame': 1, 'fps': 24.0, "it's": 'quoted'},
+        'co': buffer.tobytes(),
+        'items': [{'name': 'a'}, {'name': 'b'}],
+        3: 'int key',
+    }
+    current = {
+        'uuid': 'dump_diff_roundtrip',
+        'objects': [f"obj_{i}" for i in random.sample(range(250), 200)],
+        'settings': {'frame': 2, 'fps': 24, "it's": 'quoted'},
+        'co': (buffer * 2).tobytes(),
+        'items': [{'name': 'a'}, {'name': 'c'}],
+        'new': [1, 2, 3],
+    }
+
+    delta = compute_delta(last, current, ignore_order=True)
+    result = last + Delta(delta.dumps())
+
+    assert not DeepDiff(current, result, ignore_order=True)
+    assert not compute_delta(current, current, ignore_order=True).diff
+
+
+def test_dump_diff_directed():
+    last = {'uuid': 'dump_diff_directed', 'co': b'\x00' * 100000, 'frame': 1}
+    current = {'uuid': 'dump_diff_directed', 'co': b'\x01' * 100000, 'frame': 1}
+
+    commit = Commit()
+    commit.node_id = 'dump_diff_directed'
+    commit.deps = []
+    commit.delta = compute_delta(last, current)
+
+    # Only the new buffer is sent, the old one is kept locally
+    assert len(commit.as_raw_chunks()[3]) < 100000 + 1024
+    assert pop_old_values('dump_diff_directed') == {"root['co']": last['co']}
+    assert pop_old_values('dump_diff_directed') is None
+
+
+def test_dump_diff_collection(clear_blend, register_uuid):
+    datablock = bpy.data.collections.new("root")
+    datablock.uuid = "collection_uuid"
+    for i in range(10):
+        child = bpy.data.collections.new(f"child_{i}")
+        child.uuid = f"child_{i}"
+        datablock.children.link(child)
+    implementation = BlCollection()
+    last = implementation.dump(datablock)
+    last['uuid'] = datablock.uuid
+
+    datablock.children.unlink(bpy.data.collections["child_3"])
+    extra = bpy.data.collections.new("extra")
+    extra.uuid = "extra"
+    datablock.children.link(extra)
+    datablock.hide_render = True
+    current = implementation.dump(datablock)
+    current['uuid'] = datablock.uuid
+
+    delta = implementation.compute_delta(last, current)
+
+    assert not DeepDiff(current, last + delta, ignore_order=True)
+
+
+def test_dump_fingerprint():
+    dump = {'uuid': 'fp', 'co': np.arange(8192, dtype=np.float32).tobytes(),
+            'name': 'Cube', 'items': [1, 2.0, True]}
+    same = {'uuid': 'fp', 'co': bytes(dump['co']), 'name': 'Cube',
+            'items': [1, 2.0, True]}
+
+    assert fingerprint(dump) == fingerprint(same)
+    same['items'][0] = 1.0
+    assert fingerprint(dump) != fingerprint(same)
+
+
+def test_dump_diff_trees_bounded(monkeypatch):
+    monkeypatch.setattr(dump_diff, '_previous_trees', {})
+    monkeypatch.setattr(dump_diff, 'PREVIOUS_TREES_MAX_ENTRIES', 4)
+    co = np.arange(4096, dtype=np.float32).tobytes()
+
+    # Patched nodes get a new data dict, their trees are not kept
+    data = {'uuid': 'patched', 'co': co, 'frame': 0}
+    for frame in range(1, 10):
+        current = {'uuid': 'patched', 'co': co, 'frame': frame}
+        data = data + compute_delta(data, current)
+    assert not dump_diff._previous_trees
+
+    # The kept tree is reused by the next diff, and replaced
+    last = {'uuid': 'replaced', 'co': co, 'frame': 0}
+    compute_delta({'uuid': 'replaced'}, last, keep_tree=True)
+    tree = dump_diff._previous_trees['replaced']
+    compute_delta(last, {'uuid': 'replaced', 'co': co, 'frame': 1}, keep_tree=True)
+    assert dump_diff._previous_trees['replaced'] is not tree
+    assert tree.data is last
+
+    # A diff against another base drops the outdated tree
+    compute_delta({'uuid': 'replaced', 'frame': 2}, {'uuid': 'replaced', 'frame': 3})
+    assert 'replaced' not in dump_diff._previous_trees
+
+    for i in range(10):
+        compute_delta({'uuid': f'node_{i}'}, {'uuid': f'node_{i}', 'co': co}, keep_tree=True)
+    assert len(dump_diff._previous_trees) == 4
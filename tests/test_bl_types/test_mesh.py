@@ -5,7 +5,12 @@ from deepdiff import DeepDiff
 
 import bpy
 import random
-from multi_user.bl_types.bl_mesh import BlMesh
+import numpy as np
+from multi_user.bl_types import get_data_translation_protocol
+from multi_user.bl_types import bl_mesh
+from multi_user.bl_types.bl_mesh import (BlMesh, dump_bounds, dump_preview,
+                                         geometry_digest)
+from multi_user.bl_types.dump_anything import np_dequantize, np_quantize
 
 @pytest.mark.parametrize('mesh_type', ['EMPTY','FILLED'])
 def test_mesh(clear_blend, mesh_type):
@@ -26,3 +31,124 @@ def test_mesh(clear_blend, mesh_type):
     result = implementation.dump(test)
 
     assert not DeepDiff(expected, result)
+
+
+def test_mesh_quantized_load(clear_blend):
+    bpy.ops.mesh.primitive_monkey_add()
+    datablock = bpy.data.meshes[0]
+
+    implementation = BlMesh()
+    expected = implementation.dump(datablock)
+    co = np.frombuffer(expected['vertices']['co'], dtype=np.float32)
+    normals = np.frombuffer(expected['loops']['normal'], dtype=np.float32)
+    expected['vertices']['co'] = np_quantize(co, 'POSITION_16', 3)
+    assert np.abs(np_dequantize(np_quantize(normals, 'NORMAL_OCT', 3)) - normals).max() < 1e-3
+    bpy.data.meshes.remove(datablock)
+
+    test = implementation.construct(expected)
+    implementation.load(expected, test)
+    result = np.frombuffer(implementation.dump(test)['vertices']['co'], dtype=np.float32)
+
+    assert np.abs(result - co).max() < 1e-4
+
+
+def test_mesh_placeholder(clear_blend):
+    bpy.ops.mesh.primitive_monkey_add()
+    datablock = bpy.data.meshes[0]
+
+    implementation = BlMesh()
+    expected = implementation.dump(datablock)
+    bpy.data.meshes.remove(datablock)
+
+    test = implementation.construct(expected)
+    implementation.placeholder(expected, test)
+    assert len(test.vertices) == 8
+    co = np.array([v.co for v in test.vertices])
+    assert np.allclose(co.min(axis=0), expected['bounds'][0])
+    assert np.allclose(co.max(axis=0), expected['bounds'][1])
+
+    implementation.load(expected, test)
+    assert len(test.vertices) == expected['vertex_count']
+
+
+def test_mesh_preview(clear_blend):
+    bpy.ops.mesh.primitive_uv_sphere_add(segments=128, ring_count=64)
+    datablock = bpy.data.meshes[0]
+
+    co = np.empty(len(datablock.vertices) * 3, dtype=np.float32)
+    datablock.vertices.foreach_get('co', co)
+    preview = dump_preview(datablock, co.reshape(-1, 3))
+    assert 0 < preview['vertex_count'] < len(datablock.vertices) * 0.1
+
+    test = bpy.data.meshes.new('preview')
+    BlMesh.placeholder({'preview': preview}, test)
+    assert len(test.vertices) == preview['vertex_count']
+    assert len(test.polygons) == preview['triangle_count']
+
+
+def test_mesh_preview_follows_geometry(clear_blend, monkeypatch):
+    monkeypatch.setattr(bl_mesh, 'DEFAULT_PREVIEW_THRESHOLD', 1000)
+    bpy.ops.mesh.primitive_uv_sphere_add(segments=128, ring_count=64)
+    datablock = bpy.data.meshes[0]
+    datablock.uuid = 'sphere'
+    protocol = get_data_translation_protocol()
+    previews = []
+    protocol.on_preview = lambda uuid, preview: previews.append((uuid, preview))
+
+    first = protocol.dump(datablock, stamp_uuid='sphere')
+    protocol.compute_delta(None, first)
+    assert [uuid for uuid, _ in previews] == ['sphere']
+    assert previews[0][1]['base'] is None
+    assert previews[0][1]['digest'] == geometry_digest(first)
+    assert 'preview' not in first
+
+    # Unchanged geometry, no new preview
+    datablock.name = 'Renamed'
+    renamed = protocol.dump(datablock, stamp_uuid='sphere')
+    assert protocol.compute_delta(first, renamed).diff
+    assert len(previews) == 1
+
+    datablock.vertices[0].co.x += 1.0
+    moved = protocol.dump(datablock, stamp_uuid='sphere')
+    protocol.compute_delta(renamed, moved)
+    assert len(previews) == 2
+    assert previews[1][1]['base'] == geometry_digest(renamed)
+    assert previews[1][1]['digest'] == geometry_digest(moved)
+
+
+def test_mesh_bounds(clear_blend):
+    bpy.ops.mesh.primitive_cube_add(size=2, location=(0, 0, 0))
+    datablock = bpy.data.meshes[0]
+    datablock.vertices[0].co = (3.0, -4.0, 0.5)
+
+    data = BlMesh.dump(datablock)
+    co = np.frombuffer(data['vertices']['co'], dtype=np.float32).reshape(-1, 3)
+    assert data['bounds'] == [co.min(axis=0).tolist(), co.max(axis=0).tolist()]
+
+    quantized = np_quantize(co.ravel(), 'POSITION_16', 3)
+    assert np.allclose(dump_bounds(quantized), data['bounds'])
+
+
+def test_mesh_reuses_unchanged_geometry(clear_blend):
+    bpy.ops.mesh.primitive_uv_sphere_add()
+    datablock = bpy.data.meshes[0]
+    protocol = get_data_translation_protocol()
+    last = protocol.dump(datablock, stamp_uuid='sphere')
+
+    # No geometry update and the same probe: only the geometry is reused
+    protocol.hint_geometry('sphere', last)
+    datablock.name = 'Renamed'
+    data = protocol.dump(datablock, stamp_uuid='sphere')
+    assert data['vertices'] is last['vertices'] and data['loops'] is last['loops']
+    assert data['name'] == 'Renamed'
+
+    # A changed probe dumps it again
+    protocol.hint_geometry('sphere', data)
+    datablock.vertices[0].co.x += 1.0
+    moved = protocol.dump(datablock, stamp_uuid='sphere')
+    assert moved['vertices'] is not data['vertices']
+    assert moved['vertices'] != data['vertices']
+
+    # As does a geometry update
+    protocol.hint_geometry('sphere', None)
+    assert protocol.dump(datablock, stamp_uuid='sphere')['vertices'] is not moved['vertices']
@@ -0,0 +1,30 @@
+import json
+
+import bpy
+from deepdiff import DeepDiff
+
+from multi_user.bl_types.bl_mesh import BlMesh
+from multi_user.bl_types.profiling import Profiler
+
+
+def test_profiled_implementation(clear_blend, tmp_path):
+    bpy.ops.mesh.primitive_monkey_add()
+    datablock = bpy.data.meshes[0]
+
+    profiler = Profiler(tmp_path / 'session', threshold=0)
+    implementation = profiler.profile_implementation('Mesh', BlMesh)
+    assert issubclass(implementation, BlMesh)
+    assert implementation.bl_heavy
+
+    expected = BlMesh.dump(datablock)
+    first = implementation.dump(datablock)
+    implementation.dump(datablock)  # Armed by the first slow call
+
+    assert not DeepDiff(expected, first)
+    stats = profiler.stats[('Mesh', 'dump')]
+    assert stats.calls == 2
+    assert stats.snapshots == 1
+    assert (tmp_path / 'session_Mesh_dump_1.prof').exists()
+
+    report = json.loads(profiler.write_report().read_text())
+    assert report['methods']['Mesh.dump']['calls'] == 2
@@ -0,0 +1,140 @@
+from replication.objects import Commit, Node
+
+from multi_user import change_tracking
+from multi_user.bl_types.dump_diff import compute_delta
+from multi_user.change_tracking import ChangeHistory, UndoRedoManager
+
+
+class FakeRepository():
+    def __init__(self, nodes):
+        self.graph = {node.uuid: node for node in nodes}
+
+
+def test_history_spills_to_database(tmp_path):
+    history = ChangeHistory(max_history=10)
+    history.open(str(tmp_path / 'history.sqlite'))
+
+    for i in range(250):
+        history.add_change(f"Object{i % 5}", 'location', i, i + 1,
+                           'alice' if i % 2 else 'bob', timestamp=i)
+    assert len(history.changes) == 10
+
+    recent = history.get_recent_changes(limit=30)
+    assert [c['timestamp'] for c in recent] == list(range(220, 250))
+
+    cube = history.get_object_changes('Object3', limit=5)
+    assert [c['timestamp'] for c in cube] == [228, 233, 238, 243, 248]
+    assert len(history.get_user_changes('bob', limit=500)) == 125
+
+    # Buffered changes are kept on close
+    history.close()
+    history.open(str(tmp_path / 'history.sqlite'))
+    assert history.get_recent_changes(limit=1)[0]['new_value'] == 250
+    history.close()
+
+
+def test_record_commit():
+    last = {'type_id': 'Object', 'name': 'Cube', 'location': [0.0, 0.0, 0.0],
+            'vertices': b'\x00' * 1024}
+    current = dict(last, location=[0.0, 0.0, 2.0], vertices=b'\x01' * 1024)
+    node = Node(owner='alice', uuid='cube', data=current)
+
+    commit = Commit()
+    commit.node_id = 'cube'
+    commit.delta = compute_delta(last, current)
+
+    history = ChangeHistory()
+    history.record_update(commit, FakeRepository([node]))
+
+    changes = {c['property']: c for c in history.get_object_changes('Cube')}
+    assert changes['location[2]']['new_value'] == 2.0
+    assert changes['location[2]']['user'] == 'alice'
+    assert changes['vertices']['new_value'] == '<bytes 1024>'
+
+
+class FakeProtocol():
+    def __init__(self):
+        self.loaded = []
+
+    def load(self, data, instance):
+        self.loaded.append(data)
+
+
+class UndoRepository(FakeRepository):
+    def __init__(self, nodes):
+        super().__init__(nodes)
+        self.rdp = FakeProtocol()
+
+    def is_node_readonly(self, node_id):
+        return False
+
+
+def local_commit(node, current):
+    commit = Commit()
+    commit.node_id = node.uuid
+    commit.deps = node.dependencies
+    commit.delta = compute_delta(node.data, current)
+    node.patch(commit)
+    return commit
+
+
+def test_undo_pushes_inverse_delta(monkeypatch):
+    pushed = []
+    monkeypatch.setattr(change_tracking.porcelain, 'push',
+                        lambda repository, remote, node_id: pushed.append(
+                            repository.graph[node_id].last_commit))
+
+    original = {'uuid': 'cube', 'type_id': 'Object', 'name': 'Cube', 'location': [0.0, 0.0, 0.0],
+                'modifiers': [{'name': 'Bevel'}], 'vertices': b'\x00' * 4096}
+    node = Node(owner='alice', uuid='cube', data=original)
+    node.instance = object()
+    repository = UndoRepository([node])
+    manager = UndoRedoManager()
+
+    moved = dict(original, location=[1.0, 0.0, 0.0], modifiers=[])
+    manager.record_commit(local_commit(node, moved), repository)
+    assert len(manager.undo_stack) == 1
+
+    assert manager.undo(repository)['description'] == 'Cube'
+    assert node.data == original
+    assert repository.rdp.loaded[-1] == original
+    # Only the changed properties are sent back, not the vertices
+    assert len(pushed[-1].as_raw_chunks()[3]) < 1024
+    assert manager.can_redo() and not manager.can_undo()
+
+    manager.redo(repository)
+    assert node.data == moved
+    assert manager.can_undo() and not manager.can_redo()
+
+
+def test_undo_keeps_later_edits(monkeypatch):
+    monkeypatch.setattr(change_tracking.porcelain, 'push', lambda *args: None)
+
+    original = {'uuid': 'lamp', 'type_id': 'Light', 'name': 'Lamp', 'energy': 10.0, 'color': [1.0, 1.0, 1.0]}
+    node = Node(owner='__common__', uuid='lamp', data=original)
+    node.instance = object()
+    repository = UndoRepository([node])
+    manager = UndoRedoManager()
+
+    manager.record_commit(local_commit(node, dict(original, energy=20.0, color=[1.0, 0.0, 0.0])), repository)
+    # Another user edits the energy meanwhile
+    node.data = dict(node.data, energy=30.0)
+
+    action = manager.undo(repository)
+    assert action['skipped'] == ["root['energy']"]
+    assert node.data['energy'] == 30.0
+    assert node.data['color'] == [1.0, 1.0, 1.0]
+
+
+def test_undo_memory_cap():
+    node = Node(owner='alice', uuid='cube', data={'uuid': 'cube', 'type_id': 'Mesh', 'name': 'Cube', 'vertices': b''})
+    repository = UndoRepository([node])
+    manager = UndoRedoManager(max_bytes=10000)
+
+    for i in range(1, 6):
+        manager.record_commit(local_commit(node, dict(node.data, vertices=bytes([i]) * 2000)), repository)
+        manager.undo_stack[-1]['time'] = float('-inf')  # One step per commit
+
+    assert 0 < manager.size <= 10000
+    assert len(manager.undo_stack) < 5
+    assert manager.undo_stack[-1]['commits'][-1][1] == [('value', "root['vertices']", b'\x04' * 2000, b'\x05' * 2000)]
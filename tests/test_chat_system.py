@@ -0,0 +1,92 @@
+from replication.constants import STATE_ACTIVE
+from replication.objects import UpdateUserMetadata
+
+from multi_user import channels
+from multi_user.chat_system import CHAT_CHANNEL, HISTORY_TIMEOUT, ChatManager, ChatMessage
+
+
+def post(sender_id, seq, index):
+    message = ChatMessage('alice', f'message {seq}')
+    message.id = f'{sender_id}:{seq}'
+    message.seq = seq
+    return dict(message.to_dict(), index=index)
+
+
+def test_chat_delivery_and_history():
+    manager = ChatManager(max_messages=4)
+    channels.register_channel(CHAT_CHANNEL, manager.receive)
+    try:
+        for seq in (3, 4):
+            command = UpdateUserMetadata(owner='alice', data={
+                channels.CHANNEL_PREFIX + CHAT_CHANNEL: {'op': 'post', 'message': post('a', seq, seq)},
+                'scene_current': 'Scene'})
+            channels.dispatch(command)
+            assert command.data == {'scene_current': 'Scene'}
+    finally:
+        channels.unregister_channel(CHAT_CHANNEL)
+
+    assert manager.unread_count == 2
+
+    # The page overlaps the live messages
+    manager.receive('alice', {'op': 'page', 'more': True,
+                              'messages': [post('a', seq, seq) for seq in (1, 2, 3)]})
+    assert [m.seq for m in manager.messages] == [1, 2, 3, 4]
+    assert manager.history_cursor == 1 and not manager.history_complete
+
+    manager.receive('alice', {'op': 'post', 'message': post('a', 5, 5)})
+    assert [m.seq for m in manager.messages] == [2, 3, 4, 5]
+    assert sorted(manager.index) == ['a:2', 'a:3', 'a:4', 'a:5']
+
+
+def test_history_without_server(monkeypatch):
+    sent = []
+    monkeypatch.setattr('multi_user.chat_system.channels.send',
+                        lambda name, payload: sent.append(payload) or True)
+    peer, joiner = ChatManager(), ChatManager()
+    for manager, username in ((peer, 'alice'), (joiner, 'bob')):
+        monkeypatch.setattr(manager, '_follow_session', lambda: None)
+        monkeypatch.setattr(manager, '_username', lambda username=username: username)
+    for seq in (1, 2, 3):
+        peer.receive('carol', {'op': 'post', 'message': post('c', seq, None)})
+
+    # A stock server relays the request, the other users answer it
+    joiner.request_history()
+    joiner.receive('carol', {'op': 'post', 'message': post('c', 4, None)})
+    peer.receive('bob', sent.pop())
+    assert sent[-1]['to'] == 'bob'
+    peer.receive('carol', sent[-1])
+    assert len(peer.messages) == 3
+
+    joiner.receive('alice', sent[-1])
+    assert [m.seq for m in joiner.messages] == [1, 2, 3, 4]
+    assert not joiner.can_load_history()
+
+    # Nobody answers: the history is unavailable
+    lonely = ChatManager()
+    monkeypatch.setattr(lonely, '_follow_session', lambda: None)
+    lonely.request_history()
+    assert lonely.can_load_history()
+    lonely.history_pending -= HISTORY_TIMEOUT + 1
+    assert not lonely.can_load_history()
+
+
+def test_channel_key_cleared_from_metadata(monkeypatch):
+    # Stock server: merges the command in the sender metadata and relays it
+    metadata = {}
+    received = []
+
+    def update_user_metadata(repository, data):
+        metadata.update(data)
+        channels.dispatch(UpdateUserMetadata(owner='alice', data=dict(data)))
+
+    monkeypatch.setattr(channels, 'session', type('Session', (), {'state': STATE_ACTIVE,
+                                                                  'repository': None}))
+    monkeypatch.setattr(channels.porcelain, 'update_user_metadata', update_user_metadata)
+    channels.register_channel(CHAT_CHANNEL, lambda sender, payload: received.append(payload))
+    try:
+        assert channels.send(CHAT_CHANNEL, {'op': 'post', 'message': post('a', 1, None)})
+    finally:
+        channels.unregister_channel(CHAT_CHANNEL)
+
+    assert [payload['op'] for payload in received] == ['post']
+    assert metadata == {channels.CHANNEL_PREFIX + CHAT_CHANNEL: None}
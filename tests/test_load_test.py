@@ -0,0 +1,29 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'server')
+
+
+@pytest.fixture(scope='module')
+def load_test():
+    sys.path.insert(0, SERVER_DIR)
+    try:
+        yield importlib.import_module('load_test')
+    finally:
+        sys.path.remove(SERVER_DIR)
+
+
+def test_deliveries_ignore_unmeasured_pushes(load_test):
+    sender = {'sent': [('update', 1.0), ('update', 2.0)], 'received': []}
+    # The recording base reaches the receiver before the round starts
+    receiver = {'sent': [], 'received': [('base', 0.5, 1000),
+                                         ('update', 1.5, 10),
+                                         ('update', 2.5, 10),
+                                         ('update', 3.0, 10)]}
+
+    latencies, delivered_bytes = load_test.match_deliveries([sender, receiver])
+    assert latencies == [500.0, 500.0]
+    assert delivered_bytes == 20
@@ -0,0 +1,32 @@
+import json
+
+from multi_user.metrics import (BYTES_OUT, DUMP, WINDOW_SIZE, Metrics,
+                                RollingWindow)
+
+
+def test_rolling_window_bounded():
+    window = RollingWindow()
+    for value in range(WINDOW_SIZE * 3):
+        window.add(value)
+
+    assert len(window.samples) == WINDOW_SIZE
+    assert window.total == WINDOW_SIZE * 3
+    p50, p90, p99 = window.percentiles()
+    assert WINDOW_SIZE * 2 <= p50 < p90 < p99 < WINDOW_SIZE * 3
+
+
+def test_metrics_export(tmp_path):
+    metrics = Metrics()
+    metrics.count('Mesh', BYTES_OUT, 1024)
+    metrics.count('Mesh', BYTES_OUT, 1024)
+    metrics.time('Mesh', DUMP, 0.002)
+    metrics.sample_queue('apply', 3)
+
+    filepath = tmp_path / 'metrics.json'
+    metrics.export(str(filepath))
+    exported = json.loads(filepath.read_text())
+
+    assert exported['types']['Mesh']['counters'][BYTES_OUT] == 2048
+    assert exported['types']['Mesh']['timings_ms'][DUMP]['p50'] == 2.0
+    assert exported['queues']['apply']['last'] == 3
+
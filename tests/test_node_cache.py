@@ -0,0 +1,62 @@
+import os
+import time
+
+from replication.objects import Node, ReplicationObject
+
+from multi_user import node_cache
+from multi_user.node_cache import NodeCache, node_digest
+
+
+def test_node_cache(tmp_path):
+    cache = NodeCache(str(tmp_path))
+    node = Node(owner='COMMON', uuid='a-uuid', data={'name': 'Cube', 'buffer': b'\x00' * 64})
+    chunks = node.as_raw_chunks()
+    digest = node_digest(chunks)
+
+    assert cache.get(node.uuid, digest) is None
+    cache.put(node.uuid, chunks)
+    restored = ReplicationObject.from_raw_chunks(cache.get(node.uuid, digest))
+    assert restored.data == node.data
+
+    node.data = {'name': 'Cube.001'}
+    updated = node.as_raw_chunks()
+    assert node_digest(updated) != digest
+    cache.put(node.uuid, updated)
+    assert cache.get(node.uuid, digest) is None
+    assert len(list(cache.directory.iterdir())) == 1
+
+
+def cache_nodes(cache, count):
+    nodes = [Node(owner='COMMON', uuid=f'node-{i}', data={'buffer': bytes([i]) * 1024})
+             for i in range(count)]
+    for i, node in enumerate(nodes):
+        cache.put(node.uuid, node.as_raw_chunks())
+        os.utime(cache._path(node.uuid, node_digest(node.as_raw_chunks())), (1000 + i, 1000 + i))
+    return nodes
+
+
+def test_node_cache_discards_outdated(tmp_path):
+    cache = NodeCache(str(tmp_path))
+    first, second = cache_nodes(cache, 2)
+
+    hashes = {first.uuid: 'another-digest', second.uuid: node_digest(second.as_raw_chunks())}
+    assert cache.discard_outdated(hashes) == 1
+    assert [path.name.split('.')[0] for path in cache.directory.iterdir()] == [second.uuid]
+
+
+def test_node_cache_evicts_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(node_cache, 'MAX_AGE', time.time())
+    cache = NodeCache(str(tmp_path))
+    nodes = cache_nodes(cache, 4)
+    entry_size = cache._path(nodes[0].uuid, node_digest(nodes[0].as_raw_chunks())).stat().st_size
+
+    # A hit makes the oldest entry the most recently used
+    assert cache.get(nodes[0].uuid, node_digest(nodes[0].as_raw_chunks()))
+    cache.max_size = entry_size * 2
+    assert cache.prune() == 2
+    kept = sorted(path.name.split('.')[0] for path in cache.directory.iterdir())
+    assert kept == [nodes[0].uuid, nodes[3].uuid]
+
+    # Unused for too long
+    monkeypatch.setattr(node_cache, 'MAX_AGE', 0)
+    assert cache.prune() == 2
@@ -0,0 +1,126 @@
+import importlib
+import os
+import sys
+import tempfile
+import threading
+
+import pytest
+from replication.objects import Node
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'server')
+
+
+@pytest.fixture(scope='module')
+def server():
+    os.environ.setdefault('DATA_DIR', tempfile.mkdtemp(prefix='multiuser_server_'))
+    sys.path.insert(0, SERVER_DIR)
+    try:
+        yield importlib.import_module('persistent_server_v2')
+    finally:
+        sys.path.remove(SERVER_DIR)
+
+
+class FakeRepository():
+    def __init__(self, nodes):
+        self.object_store = {node.uuid: node for node in nodes}
+
+
+def test_catalog_digests_follow_rights(server):
+    light = Node(owner='__common__', uuid='light', data={'type_id': 'Light', 'name': 'Sun'})
+    cube = Node(owner='__common__', uuid='cube', data={'type_id': 'Object', 'name': 'Cube'},
+                dependencies=['light'])
+    repository = FakeRepository([light, cube])
+    before = server.catalog_digests(repository)
+
+    # Right and Delete change these in place, the data stays the same
+    cube.owner = 'alice'
+    cube.dependencies.remove('light')
+
+    after = server.catalog_digests(repository)
+    assert after['cube'] != before['cube']
+    assert after['cube'] == server.node_digest(cube.as_raw_chunks())
+    assert after['light'] == before['light']
+
+
+def test_backup_follows_owner_changes(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(server, 'BACKUP_DIR', tmp_path)
+    monkeypatch.setattr(server, 'BACKUP_OBJECTS_DIR', tmp_path / 'objects')
+    snapshot_data = {'timestamp': 0, 'datetime': '', 'reason': 'test', 'initialized': True,
+                     'metadata': {}, 'channels': {}}
+
+    cube = Node(owner='__common__', uuid='cube', data={'type_id': 'Object', 'name': 'Cube'},
+                dependencies=['mesh'])
+    graph = {'cube': cube}
+    first, written = server.write_backup(graph, snapshot_data)
+    assert written == 1
+
+    cube.owner = 'alice'
+    cube.dependencies.remove('mesh')
+    second, written = server.write_backup(graph, snapshot_data)
+    assert written == 1
+
+    restored = server.load_backup(second)['graph']['cube']
+    assert (restored.owner, restored.dependencies) == ('alice', [])
+    restored = server.load_backup(first)['graph']['cube']
+    assert (restored.owner, restored.dependencies) == ('__common__', ['mesh'])
+
+
+def test_metrics_keep_restored_nodes_on_disk(server, tmp_path, monkeypatch):
+    graph = {uuid: Node(owner='__common__', uuid=uuid, data={'type_id': 'Mesh', 'name': uuid})
+             for uuid in ('a', 'b', 'c')}
+    server.write_indexed_snapshot(tmp_path / 'snapshot.bin', graph, {})
+    restored = server.read_indexed_snapshot(tmp_path / 'snapshot.bin')['graph']
+
+    class Service:
+        clients = {}
+        _repository = FakeRepository([])
+    Service._repository.graph = restored
+    monkeypatch.setattr(server.server_metrics, 'service', Service)
+
+    assert 'multiuser_nodes{type="Mesh"} 3' in server.render_metrics()
+    assert all(node._payload is not None for node in restored.values())
+
+
+def test_previews_relayed_and_sent_on_sync(server, monkeypatch):
+    sent = []
+    monkeypatch.setattr(server, 'send_channel',
+                        lambda service, uid, owner, key, payload: sent.append((uid, payload)))
+    monkeypatch.setattr(server, 'mesh_previews', {})
+
+    class Service:
+        clients = {'a': {'id': 'alice'}, 'b': {'id': 'bob'}}
+        _repository = FakeRepository([Node(owner='alice', uuid='mesh', data={})])
+
+    preview = {'vertex_count': 8, 'base': None, 'digest': 'd1'}
+    server.handle_previews(Service, 'a', {'op': 'put', 'previews': {'mesh': preview, 'gone': preview}})
+    assert sent == [('b', {'op': 'put', 'previews': {'mesh': preview, 'gone': preview}})]
+
+    # Only the previews of the existing nodes are sent to joining clients
+    sent.clear()
+    server.handle_previews(Service, 'b', {'op': 'sync'})
+    assert sent == [('b', {'op': 'state', 'previews': {'mesh': preview}})]
+    assert 'gone' not in server.mesh_previews
+
+
+def test_graph_bytes_measured_between_updates(server, monkeypatch):
+    metrics = server.ServerMetrics()
+    cube = Node(owner='__common__', uuid='cube', data={'type_id': 'Object', 'name': 'Cube'})
+    repository = FakeRepository([cube])
+    repository.graph = repository.object_store
+    size = sum(len(chunk) for chunk in cube.as_raw_chunks())
+
+    # Waits for the update being committed
+    result = []
+    with server._graph_lock:
+        thread = threading.Thread(target=lambda: result.append(metrics.graph_bytes(repository)))
+        thread.start()
+        thread.join(0.2)
+        assert not result
+    thread.join()
+    assert result == [size]
+
+    # Cached until the next measure
+    cube.data = {'type_id': 'Object', 'name': 'Cube.001'}
+    assert metrics.graph_bytes(repository) == size
+    monkeypatch.setattr(server, 'GRAPH_BYTES_INTERVAL', 0)
+    assert metrics.graph_bytes(repository) == sum(len(chunk) for chunk in cube.as_raw_chunks())
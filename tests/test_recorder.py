@@ -0,0 +1,26 @@
+from replication.objects import Node
+
+from multi_user.recorder import (BASE, INCOMING, OUTGOING, TrafficRecorder,
+                                 read_recording)
+
+
+class FakeRepository():
+    def __init__(self, nodes):
+        self.graph = {node.uuid: node for node in nodes}
+
+
+def test_recording_roundtrip(tmp_path):
+    base = Node(owner='COMMON', uuid='base', data={'type_id': 'Mesh', 'name': 'a'})
+    update = Node(owner='COMMON', uuid='new', data={'type_id': 'Mesh', 'name': 'b'})
+
+    filepath = tmp_path / 'session.murec'
+    recording = TrafficRecorder(str(filepath), FakeRepository([base]))
+    recording.record(OUTGOING, update, update.as_raw_chunks())
+    recording.record(INCOMING, object(), [b'command'])  # Commands are skipped
+    recording.close()
+
+    records = list(read_recording(str(filepath)))
+    assert [kind for _, kind, _ in records] == [BASE, OUTGOING]
+    assert records[0][2] == [base.as_raw_chunks()]
+    assert records[1][2] == update.as_raw_chunks()
+    assert records[0][0] <= records[1][0]
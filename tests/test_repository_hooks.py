@@ -0,0 +1,55 @@
+from replication.objects import Commit, Delete, Node, UpdateUserMetadata
+
+from multi_user.repository_hooks import INCOMING, OUTGOING, HookedRepository
+
+
+class LoopbackSocket:
+    def __init__(self):
+        self.frames = []
+
+    def send_multipart(self, chunks):
+        self.frames.append(list(chunks))
+
+    def recv_multipart(self, flags):
+        return self.frames.pop(0)
+
+
+def test_listeners_see_the_traffic():
+    repository = HookedRepository(username='alice')
+    seen = []
+
+    def failing(repository, direction, replication_object, chunks):
+        raise RuntimeError()
+
+    repository.add_listener(lambda repository, direction, replication_object, chunks:
+                            seen.append((direction, type(replication_object))))
+    repository.add_listener(failing)
+
+    socket = LoopbackSocket()
+    repository.push(socket, UpdateUserMetadata(owner='alice', data={'color': 1}))
+    _, received = repository.fetch(socket)
+
+    assert received.data == {'color': 1}
+    assert seen == [(OUTGOING, UpdateUserMetadata), (INCOMING, UpdateUserMetadata)]
+
+
+def test_graph_revision_follows_topology():
+    repository = HookedRepository(username='alice')
+    dependencies = ['mesh']
+    repository._track_topology(Node(uuid='object', dependencies=dependencies, data={}))
+    repository._track_topology(Node(uuid='mesh', dependencies=[], data={}))
+    revision = repository.graph_revision
+
+    # Same dependencies, the commit doesn't touch the topology
+    commit = Commit()
+    commit.node_id, commit.deps = 'object', dependencies
+    repository._track_topology(commit)
+    assert repository.graph_revision == revision
+
+    # Dependencies are edited in place, with the same node count
+    dependencies[0] = 'other_mesh'
+    repository._track_topology(commit)
+    assert repository.graph_revision == revision + 1
+
+    repository._track_topology(Delete(owner='alice', data='mesh'))
+    assert repository.graph_revision == revision + 2
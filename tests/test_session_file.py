@@ -0,0 +1,49 @@
+import gzip
+import pickle
+
+from replication.objects import Node
+
+from multi_user.session_file import SessionFile, SessionWriter
+
+
+def make_nodes():
+    return [
+        Node(owner='COMMON', uuid='scene', data={'type_id': 'Scene', 'name': 'Main'},
+             dependencies=['object']),
+        Node(owner='COMMON', uuid='object', data={'type_id': 'Object', 'name': 'Cube'},
+             dependencies=['mesh', 'material']),
+        Node(owner='COMMON', uuid='mesh', data={'type_id': 'Mesh', 'name': 'Cube'},
+             dependencies=['material']),
+        Node(owner='COMMON', uuid='material', data={'type_id': 'Material', 'name': 'Red'}),
+        Node(owner='COMMON', uuid='other', data={'type_id': 'Scene', 'name': 'Other'}),
+    ]
+
+
+def test_indexed_save(tmp_path):
+    nodes = make_nodes()
+    writer = SessionWriter(tmp_path / 'session.db')
+    for node in nodes:
+        writer.add(node.as_raw_chunks(), node.data['type_id'], node.data['name'])
+    writer.close({'alice': {'metadata': {}}})
+
+    with SessionFile(tmp_path / 'session.db') as save:
+        assert save.users == {'alice': {'metadata': {}}}
+        assert save.scenes() == {'scene': 'Main', 'other': 'Other'}
+        assert save.read('mesh') == nodes[2].as_raw_chunks()
+
+        closure = save.closure(['scene'])
+        assert closure == {'scene', 'object', 'mesh', 'material'}
+        batches = save.batches(closure)
+        assert batches == [('Material', ['material']), ('Mesh', ['mesh']),
+                           ('Object', ['object']), ('Scene', ['scene'])]
+
+
+def test_legacy_save(tmp_path):
+    nodes = make_nodes()
+    with gzip.open(tmp_path / 'legacy.db', 'wb') as f:
+        pickle.dump({'nodes': [node.as_raw_chunks() for node in nodes], 'users': {}}, f)
+
+    with SessionFile(tmp_path / 'legacy.db') as save:
+        assert save.read_raw('mesh') is None
+        assert save.read('mesh') == nodes[2].as_raw_chunks()
+        assert save.batches()[:2] == [('Material', ['material']), ('Scene', ['other'])]
@@ -0,0 +1,89 @@
+from multi_user.task_management import TOMBSTONE_TTL, Task, TaskManager
+
+
+def change(task_id, clock, writer, **fields):
+    return {'id': task_id, 'fields': fields,
+            'versions': {name: (clock, writer) for name in fields}}
+
+
+def test_last_writer_wins_per_field():
+    manager = TaskManager()
+    manager.apply_changes([change('t', 1, 'a', title='Rig', status='todo', assigned_to='')])
+
+    # Concurrent writes of different fields are both kept
+    manager.apply_changes([change('t', 2, 'a', status='in_progress'),
+                           change('t', 2, 'b', assigned_to='bob')])
+    task = manager.tasks['t']
+    assert (task.status, task.assigned_to) == ('in_progress', 'bob')
+
+    # On the same field the highest version wins, whatever the arrival order
+    manager.apply_changes([change('t', 4, 'b', status='done'),
+                           change('t', 3, 'a', status='todo')])
+    assert task.status == 'done'
+    assert manager.clock == 4
+
+
+def test_removed_task_stays_removed():
+    manager = TaskManager()
+    manager.apply_changes([change('t', 1, 'a', title='Rig', created_at=1.0, deleted=False),
+                           change('t', 3, 'b', deleted=True),
+                           change('t', 2, 'a', title='Rig v2')])
+    assert manager.tasks['t'].title == 'Rig v2'
+    assert manager.get_tasks() == []
+
+    manager.update_task('t', title='Ignored')
+    assert manager.tasks['t'].title == 'Rig v2'
+
+
+def test_update_only_sends_written_fields(monkeypatch):
+    sent = []
+    manager = TaskManager()
+    monkeypatch.setattr(manager, 'sync_tasks', sent.extend)
+    monkeypatch.setattr(manager, '_follow_session', lambda: None)
+
+    task = Task('Rig')
+    manager.add_task(task)
+    manager.update_task(task.id, status='done')
+
+    assert sent[1] == {'id': task.id, 'fields': {'status': 'done'},
+                       'versions': {'status': (2, manager.writer_id)}}
+
+
+def test_peers_answer_sync(monkeypatch):
+    sent = []
+    monkeypatch.setattr('multi_user.task_management.channels.send',
+                        lambda name, payload: sent.append(payload) or True)
+    peer, joiner = TaskManager(), TaskManager()
+    for manager in (peer, joiner):
+        monkeypatch.setattr(manager, '_follow_session', lambda: None)
+
+    task = Task('Rig')
+    peer.add_task(task)
+    peer.remove_task(task.id)
+    peer.add_task(Task('Light'))
+    sent.clear()
+
+    # A stock server relays the sync request to the other users
+    joiner.receive('peer', {'op': 'sync'})
+    assert sent == []
+    peer.receive('joiner', {'op': 'sync'})
+    assert sent[0]['op'] == 'state'
+
+    joiner.receive('peer', sent[0])
+    assert [t.title for t in joiner.get_tasks()] == ['Light']
+    assert joiner.tasks[task.id].deleted
+
+
+def test_tombstones_expire(monkeypatch):
+    monkeypatch.setattr('multi_user.task_management.channels.send', lambda name, payload: True)
+    manager = TaskManager()
+    monkeypatch.setattr(manager, '_follow_session', lambda: None)
+
+    task = Task('Rig')
+    manager.add_task(task)
+    manager.remove_task(task.id)
+    assert [change['id'] for change in manager.changes()] == [task.id]
+
+    task.deleted_at -= TOMBSTONE_TTL + 1
+    assert manager.changes() == []
+    assert task.id not in manager.tasks